@@ -1,35 +1,37 @@
-import os
-import shutil
+from task_extraction import extract_task_images, find_task_images
 
 # Define the paths
 source_path = 'C:\\Users\\Emanuele\\Desktop\\Dati_CRC\\Anno_2\\Soggetti'
 destination_path = 'C:\\Users\\Emanuele\\Desktop\\Task_gradimento'
 
 
-def copy_and_rename_files(source, destination):
-    try:
-        # Check if destination folder exists, if not, create it
-        if not os.path.exists(destination):
-            os.makedirs(destination)
-
-        # Iterate over items in the source directory
-        for item in os.listdir(source):
-            full_path = os.path.join(source, item)
-            # Check if the item is a directory and follows the naming pattern
-            if os.path.isdir(full_path) and item.startswith("CRC_SUBJECT_"):
-                image_path = os.path.join(full_path, "images", "Task_26.png")
-                # Check if the Task_26.png exists in the folder
-                if os.path.isfile(image_path):
-                    new_filename = f"{item}.png"
-                    destination_file_path = os.path.join(destination, new_filename)
-                    # Copy and rename the file
-                    shutil.copy(image_path, destination_file_path)
+def copy_and_rename_files(source, destination, task_number=26, year="Anno_2", mode="hardlink"):
+    """
+    Extract an original task of every renamed subject folder as <Id>.png in the destination.
+    Kept for the existing scripts, cli.py extract handles any set of tasks and years
+
+    Args:
+        source (str): The folder containing the subject folders (Soggetti)
+        destination (str): The folder to extract the images to
+        task_number (int): The original task number to extract
+        year (str): The year of the subject folders
+        mode (str): "hardlink", "reflink" or "copy"
 
+    Returns:
+        str: The outcome of the extraction
+    """
+    try:
+        images = [image for image in find_task_images(source, year, [task_number])
+                  if image.subject_id.startswith("CRC_SUBJECT_")]
+        report = extract_task_images(images, destination, mode, flat=True)
+        if report.errors:
+            return f"An error occurred: {report.errors[0][1]}"
         return "Files copied and renamed successfully."
 
     except Exception as e:
         return f"An error occurred: {e}"
 
 
-result = copy_and_rename_files(source_path, destination_path)
-print(result)
+if __name__ == '__main__':
+    result = copy_and_rename_files(source_path, destination_path)
+    print(result)
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from synthetic_cohort import generate_cohort
+
+# Cohort sizes benchmarked when none are given
+BENCHMARK_SIZES = (10, 50)
+
+# Slowdown accepted before a result counts as a regression (0.25 = 25% slower)
+REGRESSION_TOLERANCE = 0.25
+
+
+def _timed(function, *args, **kwargs):
+    """ Run a function and return its duration in seconds"""
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_normalize_task_name(repeat=100000):
+    """ Filenames normalized per second"""
+    from inventory import normalize_task_name
+    names = [pattern.format(number) for number in range(1, 27) for pattern in ("Task_{}", "Task{}_", "Task{}")]
+    names = (names * (repeat // len(names) + 1))[:repeat]
+    duration = _timed(lambda: [normalize_task_name(name) for name in names])
+    return repeat / duration
+
+
+def bench_scan_subjects(subject_folder):
+    """ Subject folders inventoried per second"""
+    from inventory import scan_subjects
+    start = time.perf_counter()
+    count = len(scan_subjects(subject_folder))
+    return count / (time.perf_counter() - start)
+
+
+def bench_crop_and_resize(subject_folder, output_folder, sample_size=20):
+    """ Images cropped, resized and written per second"""
+    import main
+    from codec_benchmark import sample_task_images
+    image_paths = sample_task_images(subject_folder, sample_size)
+    os.makedirs(output_folder, exist_ok=True)
+    duration = _timed(lambda: [main.crop_and_resize_image(path, os.path.join(output_folder, f"{i}.png"))
+                               for i, path in enumerate(image_paths)])
+    return len(image_paths) / duration
+
+
+def bench_subjects_code_creation(subject_folder, output_folder):
+    """ Anagrafica files ingested per second"""
+    from db_pazienti import subjects_code_creation
+    count = len(os.listdir(subject_folder))
+    os.makedirs(output_folder, exist_ok=True)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        duration = _timed(subjects_code_creation, subject_folder, os.path.join(output_folder, "anagrafica.csv"),
+                          os.path.join(output_folder, "codici.csv"))
+    return count / duration
+
+
+def bench_main(root, year, **main_options):
+    """ Subjects organized per second by main.main(), end to end"""
+    import main
+    main.configure_paths(root, year)
+    count = len(os.listdir(main.SUBJECT_FOLDER))
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        duration = _timed(main.main, **main_options)
+    return count / duration
+
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, workers=1, work_folder=None, seed=0):
+    """
+    Generate a synthetic cohort of every size and measure the throughput of every stage
+
+    Args:
+        sizes (tuple): The numbers of subjects of the generated cohorts
+        workers (int): The number of worker processes of the end to end run
+        work_folder (str): Where the cohorts are generated, defaults to a temporary folder
+        seed (int): Seed of the generated cohorts
+
+    Returns:
+        dict: Benchmark name -> throughput (items per second), per cohort size
+    """
+    results = {"normalize_task_name": bench_normalize_task_name()}
+
+    base_folder = work_folder or tempfile.mkdtemp(prefix="crc_benchmark_")
+    try:
+        for size in sizes:
+            root = os.path.join(base_folder, f"cohort_{size}")
+            shutil.rmtree(root, ignore_errors=True)
+            generate_cohort(root, size, seed=seed)
+            subject_folder = os.path.join(root, "Anno_3", "Soggetti")
+
+            results[f"scan_subjects[{size}]"] = bench_scan_subjects(subject_folder)
+            results[f"subjects_code_creation[{size}]"] = bench_subjects_code_creation(
+                subject_folder, os.path.join(root, "registry"))
+            results[f"crop_and_resize_image[{size}]"] = bench_crop_and_resize(
+                subject_folder, os.path.join(root, "crop_and_resize"))
+            results[f"main[{size}]"] = bench_main(root, "Anno_3", workers=workers)
+    finally:
+        if work_folder is None:
+            shutil.rmtree(base_folder, ignore_errors=True)
+
+    return results
+
+
+def find_regressions(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """
+    Compare the throughputs with a baseline
+
+    Args:
+        results (dict): The current results
+        baseline (dict): The results of a previous run
+        tolerance (float): The accepted slowdown
+
+    Returns:
+        list: (benchmark, baseline, current) for every benchmark slower than the tolerance
+    """
+    return [(name, baseline[name], value) for name, value in results.items()
+            if name in baseline and value < baseline[name] * (1 - tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the organization pipeline on synthetic cohorts")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in BENCHMARK_SIZES),
+                        help="Comma separated cohort sizes")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the end to end run")
+    parser.add_argument("--work-folder", help="Folder for the generated cohorts, kept after the run")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run, exit with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="Accepted slowdown")
+    args = parser.parse_args()
+
+    results = run_benchmarks(tuple(int(size) for size in args.sizes.split(",")), args.workers, args.work_folder)
+
+    for name, value in results.items():
+        print(f"{name:<36}{value:>14.1f} /s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for name, expected, value in regressions:
+            print(f"Regression: {name} {value:.1f}/s, baseline {expected:.1f}/s")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,357 @@
+import sys
+import json
+import argparse
+from data_paths import DEFAULT_WORKDIR, DEFAULT_YEAR, get_data_paths
+from file_io import PLACEHOLDER_MODES
+from missing_report import MISSING_REPORT_FORMATS
+from sharding import parse_shard
+from watcher import WATCH_POLL_SECONDS, WATCH_SETTLE_SECONDS
+
+# Year whose subject folders hold the anagrafica files the registry is built from
+REGISTRY_YEAR = "Anno_1"
+
+
+def _split_years(value):
+    """ Parse a comma separated list of years"""
+    return value.split(",")
+
+
+def _split_tasks(value):
+    """ Parse a comma separated list of task numbers"""
+    return [int(number) for number in value.split(",")]
+
+
+def _codec(value):
+    """ Parse a codec spec, loading OpenCV only to check the codecs it may not be built with"""
+    from output_formats import parse_codec
+    return parse_codec(value)
+
+
+def _output_spec(value):
+    """ Parse a derived output spec, loading OpenCV only to check the codecs it may not be built with"""
+    from output_formats import parse_output_spec
+    return parse_output_spec(value)
+
+
+def _codecs(value):
+    """ Parse a comma separated list of codec specs"""
+    return [_codec(spec) for spec in value.split(",")]
+
+
+def _export_layout(value):
+    """ Check a tensor export layout, loading numpy only for the command given one"""
+    from tensor_export import EXPORT_LAYOUTS
+    if value not in EXPORT_LAYOUTS:
+        raise argparse.ArgumentTypeError(f"invalid layout {value}, expected one of {', '.join(EXPORT_LAYOUTS)}")
+    return value
+
+
+def _consolidation_layout(value):
+    """ Check a csv consolidation layout, loading pyarrow only for the command given one"""
+    from csv_consolidation import CONSOLIDATION_LAYOUTS
+    if value not in CONSOLIDATION_LAYOUTS:
+        raise argparse.ArgumentTypeError(f"invalid layout {value}, expected one of {', '.join(CONSOLIDATION_LAYOUTS)}")
+    return value
+
+
+def load_config(config_path):
+    """
+    Read a JSON config file. Its top level keys are the defaults of every subcommand that has the option
+    and an object named after a subcommand overrides them for that subcommand, e.g.
+    {"workdir": "/data/crc", "years": "Anno_2,Anno_3", "organize": {"workers": 8, "codec": "webp"}}.
+    Keys are option names, with dashes or underscores.
+
+    Args:
+        config_path (str): The path of the JSON file
+
+    Returns:
+        dict: The config
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{config_path} must contain a JSON object")
+    return config
+
+
+def build_parser():
+    """
+    Build the parser of the command line
+
+    Returns:
+        tuple: (parser, subparsers) - the parser and the parser of every subcommand by name
+    """
+    parser = argparse.ArgumentParser(description="Organize the subject folders and task images of the CRC cohort")
+    parser.add_argument("--config", metavar="FILE", help="JSON file with the defaults of the options")
+
+    data = argparse.ArgumentParser(add_help=False)
+    data.add_argument("--workdir", default=DEFAULT_WORKDIR,
+                      help="Data folder containing codici.csv, anagrafica.csv and the year folders")
+    single_year = argparse.ArgumentParser(add_help=False, parents=[data])
+    single_year.add_argument("--year", default=DEFAULT_YEAR, help="Year to process, e.g. Anno_3")
+    common = argparse.ArgumentParser(add_help=False, parents=[data])
+    common.add_argument("--years", type=_split_years, default=[DEFAULT_YEAR],
+                        help="Comma separated years to process, e.g. Anno_1,Anno_2,Anno_3")
+
+    planning = argparse.ArgumentParser(add_help=False)
+    planning.add_argument("--force", action="store_true", help="Reprocess every output, ignoring the manifest")
+    planning.add_argument("--hash", action="store_true", dest="use_hash",
+                          help="Compare source content hashes instead of size and mtime to detect changes")
+    planning.add_argument("--codec", type=_codec, help="Output codec and level, e.g. png:1, webp, webp:90, jpeg:95")
+    planning.add_argument("--output", type=_output_spec, action="append", dest="outputs", metavar="SPEC",
+                          help="Derived output NAME:WxH[:interpolation][:codec[:level]], repeatable")
+    planning.add_argument("--shard", type=parse_shard, metavar="i/N",
+                          help="Only the subjects of the i-th of N shards, to split the run over machines")
+
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+    commands = {}
+
+    organize = commands["organize"] = subparsers.add_parser(
+        "organize", parents=[common, planning], help="Process the task images and rename the subject folders")
+    organize.add_argument("--workers", type=int, default=1,
+                          help="Worker processes for the existing subjects, 0 uses one per CPU core")
+    organize.add_argument("--placeholder-mode", choices=PLACEHOLDER_MODES, default="copy",
+                          help="How placeholders and the outputs of duplicate sources are materialized")
+    organize.add_argument("--memory-budget", type=float, metavar="MIB",
+                          help="Bound the memory of the images in flight, with fewer workers if needed")
+    organize.add_argument("--no-dedup", action="store_false", dest="dedup",
+                          help="Transform every source, even when another one has the same content")
+    organize.add_argument("--pipeline", action="store_true",
+                          help="Stream the images through the staged read/transform/write pipeline")
+    for stage in ("read_workers", "transform_workers", "write_workers", "queue_size"):
+        organize.add_argument("--" + stage.replace("_", "-"), type=int, dest=stage,
+                              help="Concurrency of the pipeline stage, defaults to the pipeline default")
+    organize.add_argument("--execute-plan", metavar="FILE", dest="plan_input",
+                          help="Execute the plan saved by the plan command instead of planning again")
+    organize.add_argument("--watch", action="store_true",
+                          help="Keep running and process the subject folders as they arrive")
+    organize.add_argument("--poll-seconds", type=float, default=WATCH_POLL_SECONDS,
+                          help="Seconds between two polls of the subjects folder in watch mode")
+    organize.add_argument("--settle-seconds", type=float, default=WATCH_SETTLE_SECONDS,
+                          help="Seconds a subject folder must stay unchanged before it is processed in watch mode")
+    organize.add_argument("--missing-format", choices=MISSING_REPORT_FORMATS, default="json",
+                          help="Format of the missing-task report")
+    organize.add_argument("--report", metavar="FILE", help="Write the JSON run report to FILE")
+    organize.add_argument("--metrics-textfile", metavar="FILE", help="Write the Prometheus metrics to FILE")
+
+    plan = commands["plan"] = subparsers.add_parser(
+        "plan", parents=[common, planning], help="Print the operations of a run without executing them")
+    plan.add_argument("--save", metavar="FILE", help="Write the plan as JSON to FILE, for organize --execute-plan")
+
+    verify = commands["verify"] = subparsers.add_parser(
+        "verify", parents=[common], help="Check the processed tasks and the subject folders")
+    verify.add_argument("--codec", type=_codec, help="Codec of the processed images")
+    verify.add_argument("--report", metavar="FILE", help="Write the verification report to FILE (single year)")
+
+    extract = commands["extract"] = subparsers.add_parser(
+        "extract", parents=[common], help="Extract some tasks of every subject as <Id>.png collections")
+    extract.add_argument("tasks", type=_split_tasks, metavar="N,N", help="Comma separated task numbers")
+    extract.add_argument("--renumbered", action="store_true",
+                         help="The task numbers are renumbered ones instead of original ones")
+    extract.add_argument("--to", dest="destination", metavar="FOLDER",
+                         help="Folder to extract to, defaults to Extracted in the data folder")
+    extract.add_argument("--mode", choices=PLACEHOLDER_MODES, default="hardlink",
+                         help="How the images are materialized, links fall back to copies")
+    extract.add_argument("--flat", action="store_true",
+                         help="Extract a single task of a single year directly in the destination folder")
+
+    merge = commands["merge-shards"] = subparsers.add_parser(
+        "merge-shards", parents=[common], help="Combine the manifests and reports of the shards of a run")
+    merge.add_argument("count", type=int, metavar="N", help="Number of shards the run was split in")
+    merge.add_argument("--report", metavar="FILE", help="Write the combined JSON run report to FILE")
+    merge.add_argument("--metrics-textfile", metavar="FILE", help="Write the combined Prometheus metrics to FILE")
+
+    export = commands["export-tensors"] = subparsers.add_parser(
+        "export-tensors", parents=[single_year], help="Export the processed tasks as memory-mappable .npy arrays")
+    export.add_argument("destination", metavar="FOLDER", help="Folder to write the arrays to")
+    export.add_argument("--layout", type=_export_layout, default="task",
+                        help="task: one array per task, cohort: one array for the whole cohort")
+    export.add_argument("--codec", type=_codec, help="Codec of the processed images")
+
+    consolidate = commands["consolidate-csv"] = subparsers.add_parser(
+        "consolidate-csv", parents=[common], help="Consolidate the task csv files of the subjects into Parquet files")
+    consolidate.add_argument("destination", metavar="FOLDER", help="Folder to write the Parquet files to")
+    consolidate.add_argument("--layout", type=_consolidation_layout, default="task",
+                             help="task: one file per renumbered task, partitioned: one file per subject and year")
+
+    benchmark = commands["benchmark-codecs"] = subparsers.add_parser(
+        "benchmark-codecs", parents=[single_year], help="Compare the output codecs on sample task images")
+    benchmark.add_argument("samples", type=int, metavar="N", help="Number of sample task images")
+    benchmark.add_argument("--candidates", type=_codecs, metavar="SPEC,SPEC",
+                           help="Comma separated codecs to compare, defaults to the codec benchmark candidates")
+
+    registry = commands["build-registry"] = subparsers.add_parser(
+        "build-registry", parents=[data], help="Build anagrafica.csv and codici.csv from the anagrafica files")
+    registry.add_argument("--year", default=REGISTRY_YEAR,
+                          help="Year whose subject folders hold the anagrafica files")
+
+    return parser, commands
+
+
+def parse_arguments(argv=None):
+    """
+    Parse the command line, with the defaults of the options taken from the --config file if given
+
+    Args:
+        argv (list): The arguments to parse, defaults to sys.argv[1:]
+
+    Returns:
+        argparse.Namespace: The parsed arguments
+    """
+    parser, commands = build_parser()
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument("--config")
+    config_path = config_parser.parse_known_args(argv)[0].config
+    if config_path is not None:
+        try:
+            config = load_config(config_path)
+        except (OSError, ValueError) as e:
+            parser.error(f"Cannot read the config file: {e}")
+
+        # Option name -> value for every subcommand, the subcommand's own section overriding the top level
+        options = {name: {action.dest for action in subparser._actions} for name, subparser in commands.items()}
+        known = set().union(*options.values())
+        for name, subparser in commands.items():
+            defaults = {key: value for key, value in config.items() if key not in commands}
+            defaults.update(config.get(name, {}))
+            defaults = {key.replace("-", "_"): value for key, value in defaults.items()}
+            unknown = sorted(key for key in defaults if key not in known)
+            if unknown:
+                parser.error(f"Unknown options in {config_path}: {', '.join(unknown)}")
+            # The options of the other subcommands are left to them
+            subparser.set_defaults(**{key: value for key, value in defaults.items() if key in options[name]})
+    return parser.parse_args(argv)
+
+
+def _import_main(args):
+    """ Import main.py, which loads OpenCV and numpy only to process images, and point it to the data folder"""
+    import main
+
+    main.MISSING_TASKS_FORMAT = getattr(args, "missing_format", main.MISSING_TASKS_FORMAT)
+    main.configure_paths(args.workdir, getattr(args, "year", None) or args.years[0])
+    return main
+
+
+def run_organize(args):
+    """ Run the organize subcommand"""
+    main = _import_main(args)
+    codec = args.codec or main.DEFAULT_CODEC
+    pipeline = None
+    if args.pipeline:
+        stages = {stage: getattr(args, stage) for stage in ("read_workers", "transform_workers", "write_workers",
+                                                            "queue_size")}
+        from pipeline import PipelineConfig
+
+        pipeline = PipelineConfig(**{stage: value for stage, value in stages.items() if value is not None})
+    memory_budget = int(args.memory_budget * 2 ** 20) if args.memory_budget else None
+
+    if args.watch:
+        if len(args.years) > 1 or args.shard is not None:
+            print("Watch mode processes every subject of a single year")
+            return 2
+        return main.watch(workers=args.workers, placeholder_mode=args.placeholder_mode, use_hash=args.use_hash,
+                          codec=codec, pipeline=pipeline, report_file=args.report,
+                          metrics_textfile=args.metrics_textfile, dedup=args.dedup, poll_seconds=args.poll_seconds,
+                          settle_seconds=args.settle_seconds, outputs=args.outputs, memory_budget=memory_budget)
+    return main.main(workers=args.workers, placeholder_mode=args.placeholder_mode, force=args.force,
+                     use_hash=args.use_hash, codec=codec, pipeline=pipeline, report_file=args.report,
+                     metrics_textfile=args.metrics_textfile, plan_input=args.plan_input, dedup=args.dedup,
+                     years=args.years, outputs=args.outputs, memory_budget=memory_budget, shard=args.shard)
+
+
+def run_plan(args):
+    """ Run the plan subcommand"""
+    main = _import_main(args)
+    return main.main(force=args.force, use_hash=args.use_hash, codec=args.codec or main.DEFAULT_CODEC,
+                     plan_only=True, plan_output=args.save, years=args.years, outputs=args.outputs, shard=args.shard)
+
+
+def run_merge_shards(args):
+    """ Run the merge-shards subcommand"""
+    main = _import_main(args)
+    return main.merge_shards(args.count, args.years, args.report, args.metrics_textfile)
+
+
+def run_verify(args):
+    """ Run the verify subcommand"""
+    main = _import_main(args)
+    return main.verify_outputs(args.report, args.codec or main.DEFAULT_CODEC, args.years)
+
+
+def run_export_tensors(args):
+    """ Run the export-tensors subcommand, which loads numpy and OpenCV"""
+    main = _import_main(args)
+    main.export_dataset(args.destination, args.layout, args.codec or main.DEFAULT_CODEC)
+    return 0
+
+
+def run_consolidate_csv(args):
+    """ Run the consolidate-csv subcommand, which loads pandas and pyarrow but not OpenCV"""
+    main = _import_main(args)
+    return main.consolidate_csv_files(args.destination, args.layout, args.years)
+
+
+def run_benchmark_codecs(args):
+    """ Run the benchmark-codecs subcommand, which loads OpenCV and numpy"""
+    from codec_benchmark import BENCHMARK_CANDIDATES, benchmark_codecs, print_benchmark_report, sample_task_images
+
+    main = _import_main(args)
+    candidates = args.candidates or _codecs(",".join(BENCHMARK_CANDIDATES))
+    sample_paths = sample_task_images(main.SUBJECT_FOLDER, args.samples)
+    print_benchmark_report(benchmark_codecs(sample_paths, candidates, main.transform_image))
+    return 0
+
+
+def run_extract(args):
+    """ Run the extract subcommand, without loading OpenCV, numpy or pandas"""
+    from code_index import SubjectCodeIndex
+    from task_extraction import extract_task_collections
+
+    paths = get_data_paths(args.workdir, args.years[0])
+    try:
+        code_index = SubjectCodeIndex.from_csv(paths.codici_file)
+    except (OSError, ValueError, StopIteration) as e:
+        print(f"Error reading {paths.codici_file}: {e}")
+        return 1
+    code_index.report_problems()
+
+    subject_folders = {year: get_data_paths(args.workdir, year).subject_folder for year in args.years}
+    destination = args.destination or paths.workdir + "Extracted"
+    return extract_task_collections(subject_folders, code_index, destination, args.tasks, args.renumbered,
+                                    args.mode, args.flat)
+
+
+def run_build_registry(args):
+    """ Run the build-registry subcommand, which loads pandas but not OpenCV"""
+    from db_pazienti import subjects_code_creation
+
+    paths = get_data_paths(args.workdir, args.year)
+    failures = subjects_code_creation(paths.subject_folder, paths.anagrafica_file, paths.codici_file)
+    return 0 if not failures else 1
+
+
+# Subcommand name -> the function running it. Every one imports the heavy libraries it needs when it runs:
+# organize, export-tensors and benchmark-codecs load OpenCV and numpy, build-registry and consolidate-csv load
+# pandas, plan, verify, merge-shards and extract load neither
+RUNNERS = {"organize": run_organize, "plan": run_plan, "verify": run_verify, "extract": run_extract,
+           "merge-shards": run_merge_shards, "export-tensors": run_export_tensors,
+           "consolidate-csv": run_consolidate_csv, "benchmark-codecs": run_benchmark_codecs,
+           "build-registry": run_build_registry}
+
+
+def run(argv=None):
+    """
+    Parse the command line and run the subcommand
+
+    Args:
+        argv (list): The arguments, defaults to sys.argv[1:]
+
+    Returns:
+        int: The exit status of the subcommand
+    """
+    args = parse_arguments(argv)
+    return RUNNERS[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,161 @@
+import csv
+
+
+def get_year_columns(codici_df):
+    """
+    Get the year columns (Anno_1, Anno_2, ...) of the codici dataframe
+
+    Args:
+        codici_df (pd.DataFrame): The content of codici.csv
+
+    Returns:
+        list: The names of the year columns
+    """
+    return [col for col in codici_df.columns if 'Anno' in col]
+
+
+class SubjectCodeIndex:
+    """
+    Hash index over codici.csv, mapping the native code of every year to the subject Id
+    and back. Duplicate and conflicting codes are collected in `problems` when it is built.
+    """
+
+    def __init__(self, year_columns):
+        self.year_columns = list(year_columns)
+        # Subject Ids in file order
+        self.ids = []
+        # year -> native code -> Id
+        self.id_by_code = {year: {} for year in self.year_columns}
+        # Id -> year -> native code
+        self.code_by_id = {}
+        # Human readable description of the duplicates and conflicts found
+        self.problems = []
+
+    @classmethod
+    def from_dataframe(cls, codici_df, year_columns=None):
+        """
+        Build the index from the codici dataframe, keeping the first row for duplicated codes
+
+        Args:
+            codici_df (pd.DataFrame): The content of codici.csv
+            year_columns (list): The year columns to index, defaults to every 'Anno' column
+
+        Returns:
+            SubjectCodeIndex: The index
+        """
+        # The dataframe was built with pandas, importing it again costs nothing
+        import pandas as pd
+
+        if year_columns is None:
+            year_columns = get_year_columns(codici_df)
+        columns = ["Id"] + list(year_columns)
+        rows = zip(*[[None if pd.isna(value) else value for value in codici_df[column].tolist()]
+                     for column in columns])
+        return cls.from_rows(rows, year_columns)
+
+    @classmethod
+    def from_csv(cls, codici_path, year_columns=None):
+        """
+        Build the index from codici.csv with the csv module, without loading pandas
+
+        Args:
+            codici_path (str): The path of codici.csv
+            year_columns (list): The year columns to index, defaults to every 'Anno' column
+
+        Returns:
+            SubjectCodeIndex: The index
+        """
+        # utf-8-sig drops the BOM Excel writes at the start of the file
+        with open(codici_path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = [column.strip() for column in next(reader)]
+            if year_columns is None:
+                year_columns = [column for column in header if 'Anno' in column]
+            positions = [header.index(column) for column in ["Id"] + list(year_columns)]
+            rows = [[row[position] if position < len(row) else None for position in positions] for row in reader]
+        return cls.from_rows(rows, year_columns)
+
+    @classmethod
+    def from_rows(cls, rows, year_columns):
+        """
+        Build the index from the rows of codici.csv, keeping the first row for duplicated codes
+
+        Args:
+            rows (iterable): The Id followed by the code of every year column, None or empty when missing
+            year_columns (list): The year columns of the codes
+
+        Returns:
+            SubjectCodeIndex: The index
+        """
+        index = cls(year_columns)
+
+        for row_number, (subject_id, *codes) in enumerate(rows):
+            if subject_id is None or str(subject_id).strip() == "":
+                index.problems.append(f"Row {row_number + 2}: missing Id")
+                continue
+            subject_id = str(subject_id).strip()
+
+            if subject_id in index.code_by_id:
+                index.problems.append(f"Id {subject_id} appears more than once")
+                continue
+            index.ids.append(subject_id)
+            index.code_by_id[subject_id] = {}
+
+            for year, code in zip(index.year_columns, codes):
+                if code is None or str(code).strip() == "":
+                    continue
+                code = str(code).strip()
+
+                # The subject was acquired that year, even if its code conflicts with another one
+                index.code_by_id[subject_id][year] = code
+
+                other_id = index.id_by_code[year].get(code)
+                if other_id is not None:
+                    index.problems.append(f"{year} code {code} is used by both {other_id} and {subject_id}")
+                    continue
+                index.id_by_code[year][code] = subject_id
+
+        return index
+
+    def report_problems(self):
+        """ Print the duplicates and conflicts found while building the index"""
+        for problem in self.problems:
+            print(f"Warning: codici.csv: {problem}")
+
+    def get_id(self, year, code):
+        """
+        Get the subject Id of a native code
+
+        Args:
+            year (str): The year column, e.g. 'Anno_3'
+            code (str): The native code (folder name) of the subject
+
+        Returns:
+            str: The subject Id, or None if the code is unknown
+        """
+        return self.id_by_code.get(year, {}).get(code)
+
+    def get_code(self, subject_id, year):
+        """
+        Get the native code of a subject for a year
+
+        Args:
+            subject_id (str): The subject Id
+            year (str): The year column, e.g. 'Anno_3'
+
+        Returns:
+            str: The native code, or None if the subject has no code for the year
+        """
+        return self.code_by_id.get(subject_id, {}).get(year)
+
+    def get_ids_without_code(self, year):
+        """
+        Get the subjects that have no code for a year, i.e. that were not acquired
+
+        Args:
+            year (str): The year column, e.g. 'Anno_3'
+
+        Returns:
+            list: The subject Ids, in file order
+        """
+        return [subject_id for subject_id in self.ids if year not in self.code_by_id[subject_id]]
@@ -0,0 +1,102 @@
+import os
+import time
+import random
+import numpy as np
+import cv2
+
+# Codecs compared when no candidates are given
+BENCHMARK_CANDIDATES = ("png:0", "png:1", "png:3", "png:6", "png:9", "webp", "jpeg:95")
+
+
+def sample_task_images(subject_folder, sample_size, image_extension=".png", seed=0):
+    """
+    Pick a random sample of the task images of the subjects
+
+    Args:
+        subject_folder (str): The folder containing the subject folders
+        sample_size (int): The number of images to pick
+        image_extension (str): The extension of the images
+        seed (int): The seed of the random sample, so runs are comparable
+
+    Returns:
+        list: The paths of the sampled images
+    """
+    image_paths = []
+    for subject in os.scandir(subject_folder):
+        images_folder = os.path.join(subject.path, "Images")
+        if not subject.is_dir() or not os.path.isdir(images_folder):
+            continue
+        image_paths.extend(f.path for f in os.scandir(images_folder)
+                           if f.is_file() and f.name.endswith(image_extension))
+
+    image_paths.sort()
+    if len(image_paths) > sample_size:
+        image_paths = random.Random(seed).sample(image_paths, sample_size)
+    return image_paths
+
+
+def benchmark_codecs(image_paths, codecs, transform=None):
+    """
+    Encode and decode the sample images with every codec, measuring time and size
+
+    Args:
+        image_paths (list): The paths of the sample images
+        codecs (list): The OutputCodec candidates
+        transform (callable): Applied to every decoded image before encoding, so the
+            candidates are measured on the real output images
+
+    Returns:
+        list: One dict per codec with the mean encode/decode time (ms) and size (KB)
+    """
+    # Decode the sample once, the source decode time is the same for every codec
+    images = []
+    for image_path in image_paths:
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"File {image_path} NOT found!")
+            continue
+        images.append(transform(img) if transform is not None else img)
+
+    if not images:
+        return []
+
+    results = []
+    for codec in codecs:
+        encode_time = decode_time = total_size = 0
+        for img in images:
+            start = time.perf_counter()
+            data = codec.encode(img)
+            encode_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            decode_time += time.perf_counter() - start
+
+            total_size += len(data)
+
+        results.append({
+            "codec": codec.spec,
+            "images": len(images),
+            "encode_ms": 1000 * encode_time / len(images),
+            "decode_ms": 1000 * decode_time / len(images),
+            "size_kb": total_size / len(images) / 1024,
+        })
+    return results
+
+
+def print_benchmark_report(results):
+    """
+    Print the benchmark results as a table
+
+    Args:
+        results (list): The results of benchmark_codecs
+    """
+    if not results:
+        print("No images to benchmark")
+        return
+
+    print(f"Benchmark on {results[0]['images']} images")
+    print(f"{'Codec':<10}{'Encode (ms)':>14}{'Decode (ms)':>14}{'Size (KB)':>12}")
+    for result in results:
+        print(f"{result['codec']:<10}{result['encode_ms']:>14.1f}{result['decode_ms']:>14.1f}"
+              f"{result['size_kb']:>12.1f}")
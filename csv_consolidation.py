@@ -0,0 +1,280 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from inventory import get_task_renumbering_map, scan_subjects
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed to consolidate the task csv files
+    pa = pq = None
+
+# Number of output files written at the same time
+CONSOLIDATION_WORKERS = os.cpu_count() or 1
+
+# Rows read from a csv file at a time, and rows per Parquet row group
+CSV_CHUNK_ROWS = 100_000
+
+# "task": one file per renumbered task for the whole cohort,
+# "partitioned": one file per subject and year, under year=<year>/Id=<Id>/
+CONSOLIDATION_LAYOUTS = ("task", "partitioned")
+
+
+@dataclass
+class TaskRecording:
+    """ A task csv file of a subject"""
+    subject_id: str
+    year: str
+    # Renumbered task name, e.g. 'Task1'
+    task_name: str
+    csv_path: str
+
+
+@dataclass
+class ConsolidationReport:
+    """ Outcome of consolidating the task csv files"""
+    output_folder: str
+    layout: str
+    # Parquet files written, with the files of the extra schemas after the one of their output
+    files: list = field(default_factory=list)
+    recordings: int = 0
+    rows: int = 0
+    # (csv path, error) of the files that could not be read to the end, the rows before the error are kept
+    errors: list = field(default_factory=list)
+
+
+def find_task_recordings(subject_folder, code_index, year):
+    """
+    List the task csv files of a year with a single scan of the subject folders, renumbering
+    the tasks with the map of the year. Folders are recognised by their Id or by their native code.
+
+    Args:
+        subject_folder (str): The folder containing the subject folders (Soggetti)
+        code_index (SubjectCodeIndex): The index of the codici.csv codes
+        year (str): The year column, e.g. 'Anno_3'
+
+    Returns:
+        list: The TaskRecording of every csv file of a renumbered task, sorted by subject Id and task
+    """
+    renumbering_map = get_task_renumbering_map(year)
+    recordings = []
+    for folder, inventory in scan_subjects(subject_folder).items():
+        subject_id = folder if folder in code_index.code_by_id else code_index.get_id(year, folder)
+        if subject_id is None:
+            print(f"Warning: Subject {folder} not found in codici.csv")
+            continue
+        for original_task_number, csv_path in inventory.csv_files.items():
+            new_task_number = renumbering_map.get(original_task_number)
+            if new_task_number is not None:
+                recordings.append(TaskRecording(subject_id, year, f"Task{new_task_number}", csv_path))
+
+    recordings.sort(key=lambda recording: (recording.subject_id, int(recording.task_name[4:])))
+    return recordings
+
+
+def _read_chunks(recording, columns, chunk_rows):
+    """
+    Stream a csv file in chunks of at most chunk_rows rows, with the constant columns in front.
+    Numeric columns are read as float64, so that every file and chunk agree on their type.
+    """
+    # Loaded on first use, so that the commands that never consolidate do not pay for it
+    import pandas as pd
+
+    for chunk in pd.read_csv(recording.csv_path, chunksize=chunk_rows):
+        numeric_columns = chunk.select_dtypes("number").columns
+        chunk[numeric_columns] = chunk[numeric_columns].astype("float64")
+        for position, (name, value) in enumerate(columns.items()):
+            chunk.insert(position, name, value)
+        yield chunk
+
+
+def _cast_chunk(chunk, schema):
+    """
+    Convert a chunk to the columns of a schema: the columns it lacks are null, numbers written as
+    text become numbers and numbers in a text column become text
+
+    Returns:
+        pyarrow.Table: The chunk with the schema, None if it has other columns or text in a numeric column
+    """
+    import pandas as pd
+
+    if not set(chunk.columns) <= set(schema.names):
+        return None
+    arrays = []
+    for column in schema:
+        values = chunk[column.name] if column.name in chunk.columns else None
+        # Missing and empty columns, which pandas reads as float64 NaN, fit any type
+        if values is None or not values.notna().any():
+            arrays.append(pa.nulls(len(chunk), column.type))
+            continue
+        if pa.types.is_floating(column.type) and not pd.api.types.is_numeric_dtype(values):
+            numbers = pd.to_numeric(values, errors="coerce")
+            if (numbers.isna() & values.notna()).any():
+                return None
+            values = numbers
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            values = values.map(str, na_action="ignore")
+        try:
+            arrays.append(pa.Array.from_pandas(values, type=column.type))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return None
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def get_schema_path(output_path, number):
+    """
+    Get the path of the Parquet file of the chunks that do not fit the schemas of the files before it:
+    the output path itself for the first schema, then e.g. Task1-schema2.parquet for the second one
+    """
+    if number == 1:
+        return output_path
+    root, extension = os.path.splitext(output_path)
+    return f"{root}-schema{number}{extension}"
+
+
+class _SchemaWriter:
+    """ A Parquet file with a schema, written to a temporary file and grouping small chunks into row groups"""
+
+    def __init__(self, output_path, schema, chunk_rows):
+        self.output_path = output_path
+        self.temporary_path = output_path + ".tmp"
+        self.schema = schema
+        self.chunk_rows = chunk_rows
+        self.writer = pq.ParquetWriter(self.temporary_path, schema)
+        self.pending = []
+        self.pending_rows = 0
+
+    def write(self, table):
+        """ Write a chunk, once the pending chunks fill a row group"""
+        self.pending.append(table)
+        self.pending_rows += table.num_rows
+        if self.pending_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """ Write the pending chunks"""
+        if self.pending:
+            self.writer.write_table(pa.concat_tables(self.pending), row_group_size=self.chunk_rows)
+        self.pending = []
+        self.pending_rows = 0
+
+    def close(self, complete=True):
+        """ Close the file, moving it in place if it is complete and removing it otherwise"""
+        if complete:
+            self.flush()
+        self.writer.close()
+        if complete:
+            os.replace(self.temporary_path, self.output_path)
+        else:
+            os.remove(self.temporary_path)
+
+
+def _remove_stale_schema_files(output_path, written):
+    """ Remove the files of the extra schemas of a previous run that this run did not write again"""
+    root, extension = os.path.splitext(output_path)
+    prefix = os.path.basename(root) + "-schema"
+    for entry in os.scandir(os.path.dirname(output_path)):
+        if entry.name.startswith(prefix) and entry.name.endswith(extension) and entry.path not in written:
+            os.remove(entry.path)
+
+
+def _write_recordings(output_path, recordings, layout, chunk_rows):
+    """
+    Write the recordings to a Parquet file, streaming every csv file chunk by chunk so that the
+    memory used is bounded by chunk_rows. The first chunk decides the schema of the file. A chunk
+    that does not fit it, e.g. with text in a numeric column, goes to the file of the first other
+    schema it fits, or to a new one from get_schema_path, so that no row is lost.
+    The files are replaced atomically once complete.
+
+    Returns:
+        tuple: ([Parquet files written], recordings written, rows written, [(csv path, error)])
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    writers = []
+    written = 0
+    rows = 0
+    errors = []
+    complete = False
+    try:
+        for recording in recordings:
+            # The partition keys are in the path, the task is in the name of the task files
+            if layout == "task":
+                columns = {"Id": recording.subject_id, "year": recording.year}
+            else:
+                columns = {"task": recording.task_name}
+            recording_rows = 0
+            try:
+                for chunk in _read_chunks(recording, columns, chunk_rows):
+                    for writer in writers:
+                        table = _cast_chunk(chunk, writer.schema)
+                        if table is not None:
+                            break
+                    else:
+                        table = pa.Table.from_pandas(chunk, preserve_index=False).replace_schema_metadata()
+                        writer = _SchemaWriter(get_schema_path(output_path, len(writers) + 1), table.schema,
+                                               chunk_rows)
+                        writers.append(writer)
+                    writer.write(table)
+                    recording_rows += table.num_rows
+            except (OSError, ValueError, KeyError, pa.ArrowException) as e:  # pandas parser errors are ValueErrors
+                # The chunks read before the error are kept, the rest of the file is reported
+                errors.append((recording.csv_path, f"{e}"))
+            if recording_rows:
+                written += 1
+                rows += recording_rows
+        complete = True
+    finally:
+        for writer in writers:
+            writer.close(complete)
+    paths = [writer.output_path for writer in writers]
+    _remove_stale_schema_files(output_path, paths)
+    return paths, written, rows, errors
+
+
+def consolidate_task_recordings(recordings, output_folder, layout="task", chunk_rows=CSV_CHUNK_ROWS,
+                                workers=CONSOLIDATION_WORKERS):
+    """
+    Consolidate the task csv files into a few large Parquet files, so that analytics read
+    the whole cohort without opening every small file. The csv files are streamed in chunks
+    and the output files are written concurrently, each by a single thread.
+
+    With the "task" layout every renumbered task is written to TaskN.parquet, with the Id and
+    year columns in front of the recorded columns. With the "partitioned" layout every subject
+    and year is written to year=<year>/Id=<Id>/recordings.parquet, with the task column in front,
+    which Parquet readers load as a dataset partitioned by year and Id.
+
+    Args:
+        recordings (list): The TaskRecording of the csv files, e.g. from find_task_recordings
+        output_folder (str): The folder to write the Parquet files to
+        layout (str): "task" or "partitioned"
+        chunk_rows (int): Rows read from a csv file at a time and rows per row group
+        workers (int): Number of output files written at the same time
+
+    Returns:
+        ConsolidationReport: The files written and the csv files that could not be read
+    """
+    if layout not in CONSOLIDATION_LAYOUTS:
+        raise ValueError(f"Unknown layout {layout}, expected one of {CONSOLIDATION_LAYOUTS}")
+    if pq is None:
+        raise ImportError("pyarrow is required to write the Parquet files (pip install pyarrow)")
+
+    groups = {}
+    for recording in recordings:
+        if layout == "task":
+            output_path = os.path.join(output_folder, f"{recording.task_name}.parquet")
+        else:
+            output_path = os.path.join(output_folder, f"year={recording.year}", f"Id={recording.subject_id}",
+                                       "recordings.parquet")
+        groups.setdefault(output_path, []).append(recording)
+
+    report = ConsolidationReport(output_folder, layout)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {output_path: executor.submit(_write_recordings, output_path, group, layout, chunk_rows)
+                   for output_path, group in sorted(groups.items())}
+        for output_path, future in futures.items():
+            paths, written, rows, errors = future.result()
+            report.files.extend(paths)
+            report.recordings += written
+            report.rows += rows
+            report.errors.extend(errors)
+    return report
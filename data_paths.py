@@ -0,0 +1,59 @@
+import os
+from dataclasses import dataclass
+
+# Data folder and year processed when none is configured
+DEFAULT_WORKDIR = "C:\\Users\\Emanuele\\Desktop\\Dati_CRC\\"
+DEFAULT_YEAR = "Anno_3"
+
+
+@dataclass(frozen=True)
+class DataPaths:
+    """ Folders and files of a year in a data folder"""
+    workdir: str
+    year: str
+    parent_folder: str
+    subject_folder: str
+    tasks_folder: str
+    anagrafica_file: str
+    codici_file: str
+    missing_tasks_file: str
+    manifest_file: str
+    run_report_file: str
+    metrics_textfile: str
+    merge_report_file: str
+    verify_report_file: str
+
+
+def get_data_paths(workdir=DEFAULT_WORKDIR, year=DEFAULT_YEAR, missing_tasks_format="json"):
+    """
+    Get the layout of a data folder for a year, without touching the filesystem
+
+    Args:
+        workdir (str): The folder containing codici.csv, anagrafica.csv and the year folders
+        year (str): The year column and folder, e.g. 'Anno_3'
+        missing_tasks_format (str): The format of the missing-task report, "json" or "csv"
+
+    Returns:
+        DataPaths: The paths, folders end with a separator
+    """
+    workdir = os.path.join(workdir, "")
+    parent_folder = os.path.join(workdir, year, "")
+    return DataPaths(
+        workdir=workdir,
+        year=year,
+        parent_folder=parent_folder,
+        subject_folder=os.path.join(parent_folder, "Soggetti", ""),
+        tasks_folder=os.path.join(parent_folder, "Tasks", ""),
+        anagrafica_file=workdir + "anagrafica.csv",
+        codici_file=workdir + "codici.csv",
+        missing_tasks_file=workdir + "missing_tasks_crc_" + year + "." + missing_tasks_format,
+        # Manifest of the produced outputs, used to skip up to date work
+        manifest_file=workdir + "manifest_crc_" + year + ".jsonl",
+        # Stage timings and counters of the last run, for all the years it processed
+        run_report_file=workdir + "run_report_crc.json",
+        metrics_textfile=workdir + "crc_organizer.prom",
+        # Entries left in the native folders by the merges of the last run
+        merge_report_file=workdir + "merge_conflicts_crc_" + year + ".csv",
+        # Problems found by the last verification
+        verify_report_file=workdir + "verify_crc_" + year + ".json",
+    )
@@ -1,118 +1,147 @@
-import glob
-import os
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-
-
-def subjects_code_creation(SUBJECT_FOLDER: str, ANAGRAFICA_FILE: str, CODICI_FILE: str) -> None:
-    """ Create the anagrafica_crc.csv and codici_crc.csv files"""
-
+from inventory import scan_subjects
+
+# Number of anagrafica files read at the same time
+READ_WORKERS = 16
+
+# Columns of the anagrafica file: column -> (labels of the key:value record, historical line number)
+# The line number is used when none of the labels of the column is found in the file
+ANAGRAFICA_FIELDS = {
+    "Nome": (("nome", "name"), 1),
+    "Cognome": (("cognome", "surname"), 2),
+    "Sesso": (("sesso", "sex", "genere"), 3),
+    "Data_di_Nascita": (("datadinascita", "datanascita", "birthdate"), 4),
+    "Mano_dominante": (("manodominante", "mano", "dominanthand"), 5),
+    "Classe": (("classe", "class"), 6),
+    "Anno_1": (("cartella", "codice", "codicesoggetto", "idsoggetto", "idcartella"), 9),
+}
+
+schema_anagrafica = {'Id': str, 'Nome': str, 'Cognome': str, 'Sesso': str, 'Data_di_Nascita': str,
+                     'Mano_dominante': str, 'Classe': str}
+
+schema_codici = {'Id': str, 'Anno_1': str, 'Anno_2': str, 'Anno_3': str}
+
+
+def _normalize_label(label):
+    """ Lowercase a record label and drop spaces and underscores"""
+    return label.strip().lower().replace(" ", "").replace("_", "")
+
+
+def parse_anagrafica_file(anagrafica_path):
+    """
+    Parse an anagrafica text file made of 'label: value' lines
+
+    Args:
+        anagrafica_path (str): The path of the anagrafica file
+
+    Returns:
+        dict: The value of every ANAGRAFICA_FIELDS column
+
+    Raises:
+        ValueError: If a field cannot be found in the file
+    """
+    with open(anagrafica_path) as file:
+        rows = [row.strip() for row in file]
+
+    # Index the key:value lines by normalized label
+    values_by_label = {}
+    for row in rows:
+        label, separator, value = row.partition(":")
+        if separator:
+            values_by_label.setdefault(_normalize_label(label), value)
+
+    # Files without any of the expected labels keep the historical fixed layout
+    labelled = any(label in values_by_label for labels, _ in ANAGRAFICA_FIELDS.values() for label in labels)
+
+    record = {}
+    for column, (labels, line_number) in ANAGRAFICA_FIELDS.items():
+        value = next((values_by_label[label] for label in labels if label in values_by_label), None)
+        if value is None:
+            if line_number >= len(rows) or ":" not in rows[line_number]:
+                raise ValueError(f"field {column} not found (line {line_number + 1})")
+            value = rows[line_number].split(":", 1)[1]
+            if labelled:
+                # The label may be one not listed yet, the historical line is read but worth a check
+                print(f"Warning: {anagrafica_path} has no {column} label, read line {line_number + 1}: "
+                      f"{rows[line_number]}")
+        record[column] = value
+    return record
+
+
+def subjects_code_creation(SUBJECT_FOLDER: str, ANAGRAFICA_FILE: str, CODICI_FILE: str,
+                           workers: int = READ_WORKERS) -> list:
+    """
+    Create the anagrafica_crc.csv and codici_crc.csv files
+
+    Args:
+        SUBJECT_FOLDER (str): The folder containing the subject folders
+        ANAGRAFICA_FILE (str): The path of the anagrafica csv to write
+        CODICI_FILE (str): The path of the codici csv to write
+        workers (int): The number of anagrafica files read at the same time
+
+    Returns:
+        list: (anagrafica file, error) for every file that could not be parsed
+    """
     anagrafica_file_list = []
 
-    # # r=root, d=directories, f = files
-    # for r, d, f in os.walk(SUBJECT_FOLDER):
-    #     # print(f"Root: \n {r}")
-    #     # print(f"Directory: \n {d}")
-    #     for file in f:
-    #         if file.endswith(".txt"):
-    #             anagrafica_file_list.append(os.path.join(r, file))
-
-    # List directories in the SUBJECT_FOLDER
-    dirlist = [str(item) for item in os.listdir(SUBJECT_FOLDER) if os.path.isdir(os.path.join(SUBJECT_FOLDER, item))]
-
     # Check if exists a text file that has Anagrafica in the name for every subject
-    for subject in dirlist:
-        subject_path = SUBJECT_FOLDER + subject
-        subject_anagrafica_file = glob.glob(subject_path + "/*Anagrafica*.txt")
-
-        if not subject_anagrafica_file:
+    for subject, inventory in scan_subjects(SUBJECT_FOLDER).items():
+        if not inventory.anagrafica_files:
             print(f"Subject {subject} doesn't have an anagrafica file!")
-        elif len(subject_anagrafica_file) > 1:
+            continue
+        if len(inventory.anagrafica_files) > 1:
             print(f"Subject {subject} has more than one anagrafica file!")
-            anagrafica_file_list.append(subject_anagrafica_file[0])
-        else:
-            # print(f"Anagrafica file for subject {subject} found! \n {subject_anagrafica_file}")
-            anagrafica_file_list.append(subject_anagrafica_file)
-
-    anagrafica_file_list = [item for sublist in anagrafica_file_list for item in sublist]
-
-    try:
-
-        schema_anagrafica = {'Id': str, 'Nome': str, 'Cognome': str, 'Sesso': str, 'Data_di_Nascita': str,
-                             'Mano_dominante': str, 'Classe': str}
-
-        anagrafica_df = pd.DataFrame(columns=schema_anagrafica.keys()).astype(schema_anagrafica)
-
-        schema_codici = {'Id': str, 'Anno_1': str, 'Anno_2': str, 'Anno_3': str}
-
-        code_df = pd.DataFrame(columns=schema_codici.keys()).astype(schema_codici)
-
-        # Read every anagrafica file
-        for num, anagrafica in enumerate(anagrafica_file_list):
-            rows = []
-
-            num += 1
-
-            if num < 10:
-                string_num = "00" + str(num)
-            elif 10 <= num < 100:
-                string_num = "0" + str(num)
-            else:
-                string_num = str(num)
-
-            id_subject_code = "CRC_SUBJECT_" + string_num
+        anagrafica_file_list.append(inventory.anagrafica_files[0])
 
-            if num > 0:
-                with open(anagrafica) as file:
-                    for row in file:
-                        # row = row.replace(" ", "")
-                        rows.append(row.strip())
+    def parse(anagrafica):
+        try:
+            return parse_anagrafica_file(anagrafica), None
+        except Exception as e:
+            return None, f"{e}"
 
-                # Rows are:
-                name = rows[1].split(":", 1)[1]
-                surname = rows[2].split(":", 1)[1]
-                sex = rows[3].split(":", 1)[1]
-                birthdate = rows[4].split(":", 1)[1]
-                hand = rows[5].split(":", 1)[1]
-                sclass = rows[6].split(":", 1)[1]
-                id_folder_first_year = rows[9].split(":", 1)[1]
+    # Read every anagrafica file, results keep the order of the file list
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = list(executor.map(parse, anagrafica_file_list))
 
-                personal_info_row = {
-                    "Id": id_subject_code,
-                    "Nome": name,
-                    "Cognome": surname,
-                    "Sesso": sex,
-                    "Data_di_Nascita": birthdate,
-                    "Mano_dominante": hand,
-                    "Classe": sclass
-                }
+    records = []
+    failures = []
+    for num, (anagrafica, (record, error)) in enumerate(zip(anagrafica_file_list, results), start=1):
+        if error is not None:
+            failures.append((anagrafica, error))
+            continue
+        # The Id follows the position in the file list, so a file fixed later does not renumber the others
+        record["Id"] = f"CRC_SUBJECT_{num:03d}"
+        records.append(record)
 
-                code_row = {
-                    "Id": id_subject_code,
-                    "Anno_1": id_folder_first_year.strip(),
-                    "Anno_2": "",
-                    "Anno_3": ""
-                }
+    for anagrafica, error in failures:
+        print(f"Could not parse {anagrafica}: {error}")
 
-                anagrafica_df = pd.concat([anagrafica_df, pd.DataFrame([personal_info_row])], ignore_index=True)
+    # Build both dataframes in one step
+    records_df = pd.DataFrame.from_records(records, columns=["Id"] + list(ANAGRAFICA_FIELDS))
 
-                code_df = pd.concat([code_df, pd.DataFrame([code_row])], ignore_index=True)
+    anagrafica_df = records_df[list(schema_anagrafica)].astype(schema_anagrafica)
 
-        print(anagrafica_df.to_string())
+    code_df = pd.DataFrame({
+        "Id": records_df["Id"],
+        "Anno_1": records_df["Anno_1"],
+        "Anno_2": "",
+        "Anno_3": "",
+    }).astype(schema_codici)
 
-        anagrafica_df.to_csv(ANAGRAFICA_FILE, index=False)
+    print(anagrafica_df.to_string())
 
-        # Get all yeas columns
-        year_columns = [col for col in code_df.columns if 'Anno' in col]
+    anagrafica_df.to_csv(ANAGRAFICA_FILE, index=False)
 
-        # Remove spaces from year columns
-        for col in year_columns:
-            code_df[col] = code_df[col].str.replace(" ", "")
+    # Get all yeas columns
+    year_columns = [col for col in code_df.columns if 'Anno' in col]
 
-        # Save the codici_crc.csv file
-        code_df.to_csv(CODICI_FILE, index=False)
+    # Remove spaces from year columns
+    for col in year_columns:
+        code_df[col] = code_df[col].str.replace(" ", "")
 
-    except Exception as e:
-        print(f"{e}")
+    # Save the codici_crc.csv file
+    code_df.to_csv(CODICI_FILE, index=False)
 
-    return None
+    print(f"Parsed {len(records)} anagrafica files, {len(failures)} failed")
+    return failures
@@ -0,0 +1,67 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+from manifest import hash_file
+
+# Number of source images hashed at the same time
+DEDUP_WORKERS = 16
+
+
+def _hash_or_none(file_path):
+    """ Hash a file, None if it cannot be read"""
+    try:
+        return hash_file(file_path)
+    except OSError:
+        return None
+
+
+def find_duplicate_sources(operations, workers=DEDUP_WORKERS):
+    """
+    Find the transform operations whose source image has the same content as the source of
+    an earlier operation with the same parameters, so that each distinct image is decoded,
+    resized and encoded once per output. Sizes are compared first, only the sources sharing
+    their size with another source are hashed, each of them once.
+
+    Args:
+        operations (list): The transform operations, in plan order
+        workers (int): Number of sources hashed at the same time
+
+    Returns:
+        tuple: (unique, duplicates) - the operations to run, in plan order, and
+            (operation, original operation) for every operation whose output can be
+            reused from the output of the original one
+    """
+    sizes = []
+    operations_by_size = {}
+    for operation in operations:
+        try:
+            size = os.path.getsize(operation.source_path)
+        except OSError:
+            # Left to the transform, which reports the missing file
+            size = None
+        sizes.append(size)
+        if size is not None:
+            operations_by_size.setdefault(size, []).append(operation)
+
+    # The outputs of a source share its path, they are not duplicates of each other
+    candidates = sorted({operation.source_path for group in operations_by_size.values()
+                         if len({operation.source_path for operation in group}) > 1 for operation in group})
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        digests = dict(zip(candidates, executor.map(_hash_or_none, candidates)))
+
+    unique = []
+    duplicates = []
+    originals = {}
+    for operation, size in zip(operations, sizes):
+        digest = digests.get(operation.source_path)
+        if digest is None:
+            unique.append(operation)
+            continue
+        # Only an output with the same size, codec and interpolation can be reused
+        params = json.dumps(operation.params, sort_keys=True)
+        original = originals.setdefault((size, digest, params), operation)
+        if original is operation:
+            unique.append(operation)
+        else:
+            duplicates.append((operation, original))
+    return unique, duplicates
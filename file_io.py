@@ -0,0 +1,105 @@
+import os
+import shutil
+import socket
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Ways of materializing a file that has the same content as another one
+PLACEHOLDER_MODES = ("copy", "hardlink", "reflink")
+
+# ioctl request to clone a file's extents (Linux btrfs/xfs/...)
+FICLONE = 0x40049409
+
+# Machines sharing the data folder, e.g. the shards of a run, write their temporary files side by side
+_HOSTNAME = socket.gethostname()
+
+
+def _get_temporary_path(destination_path):
+    """ Get a temporary path next to the destination, unique to the machine, process and thread"""
+    return f"{destination_path}.{_HOSTNAME}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def write_file_atomic(destination_path, data):
+    """
+    Write bytes to a temporary file and move it over the destination, so the
+    destination is never left half written and existing hardlinks are not modified
+
+    Args:
+        destination_path (str): The path of the file to write
+        data (bytes): The content of the file
+    """
+    temporary_path = _get_temporary_path(destination_path)
+    with open(temporary_path, "wb") as f:
+        f.write(data)
+    os.replace(temporary_path, destination_path)
+
+
+def _reflink(source_path, destination_path):
+    """ Clone the source file into the destination, raising OSError if not supported"""
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform")
+    with open(source_path, "rb") as src, open(destination_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy_file_range(source_path, destination_path):
+    """
+    Copy a file inside the kernel with copy_file_range, which lets the filesystem clone the
+    extents or copy server side, falling back to a regular copy where it is not available
+    """
+    if not hasattr(os, "copy_file_range"):
+        shutil.copyfile(source_path, destination_path)
+        return
+    try:
+        with open(source_path, "rb") as src, open(destination_path, "wb") as dst:
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    except OSError:
+        # Not supported between these filesystems, e.g. across devices on older kernels
+        shutil.copyfile(source_path, destination_path)
+
+
+def materialize_file(source_path, destination_path, mode="copy"):
+    """
+    Make the destination a file with the same content as the source, replacing it if it exists
+
+    Args:
+        source_path (str): The path of the file to reproduce
+        destination_path (str): The path of the new file
+        mode (str): "copy" for a byte copy, in the kernel where possible, "hardlink" for a hard link to the source,
+            "reflink" for a copy-on-write clone. Links fall back to a copy when the
+            filesystem does not support them
+
+    Returns:
+        str: The mode actually used
+    """
+    if mode not in PLACEHOLDER_MODES:
+        raise ValueError(f"Unknown mode {mode}, expected one of {PLACEHOLDER_MODES}")
+
+    temporary_path = _get_temporary_path(destination_path)
+    used_mode = "copy"
+    try:
+        if mode == "hardlink":
+            os.link(source_path, temporary_path)
+            used_mode = "hardlink"
+        elif mode == "reflink":
+            _reflink(source_path, temporary_path)
+            used_mode = "reflink"
+    except OSError:
+        # Different device or unsupported filesystem
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+    if used_mode == "copy":
+        _copy_file_range(source_path, temporary_path)
+
+    os.replace(temporary_path, destination_path)
+    return used_mode
@@ -0,0 +1,168 @@
+import os
+import errno
+import shutil
+import filecmp
+from dataclasses import dataclass, field
+
+
+@dataclass
+class MergeReport:
+    """ Outcome of merging a source folder into a destination folder, paths are relative to the folders"""
+    source: str
+    destination: str
+    # Files and folders moved into the destination, a folder moved as a whole is listed once
+    moved: list = field(default_factory=list)
+    # Files already in the destination with the same content, removed from the source
+    duplicates: list = field(default_factory=list)
+    # (path, reason) of the entries left in the source because the destination holds something else
+    conflicts: list = field(default_factory=list)
+    # (path, error) of the entries that could not be moved, left in the source
+    errors: list = field(default_factory=list)
+
+    @property
+    def complete(self):
+        """ True if everything was moved and the source folder was removed"""
+        return not self.conflicts and not self.errors
+
+
+def snapshot_tree(root):
+    """
+    List every entry under a folder, recursively, with one scandir pass per folder
+
+    Args:
+        root (str): The folder to list
+
+    Returns:
+        dict: Relative path -> True for folders, False for files (symlinks are not followed)
+    """
+    entries = {}
+    pending = [""]
+    while pending:
+        relative_folder = pending.pop()
+        with os.scandir(os.path.join(root, relative_folder)) as iterator:
+            for entry in iterator:
+                relative_path = os.path.join(relative_folder, entry.name) if relative_folder else entry.name
+                is_dir = entry.is_dir(follow_symlinks=False)
+                entries[relative_path] = is_dir
+                if is_dir:
+                    pending.append(relative_path)
+    return entries
+
+
+def move_entry(source_path, destination_path):
+    """
+    Move a file or folder with an atomic rename, or across devices by copying it
+    next to the destination, renaming the copy into place and removing the source
+
+    Args:
+        source_path (str): The file or folder to move
+        destination_path (str): Its new path, which must not exist
+    """
+    try:
+        os.rename(source_path, destination_path)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    # The copy only appears at the destination once complete
+    temporary_path = f"{destination_path}.{os.getpid()}.merge.tmp"
+    if os.path.isdir(source_path) and not os.path.islink(source_path):
+        shutil.copytree(source_path, temporary_path, symlinks=True)
+        os.rename(temporary_path, destination_path)
+        shutil.rmtree(source_path)
+    else:
+        shutil.copy2(source_path, temporary_path, follow_symlinks=False)
+        os.rename(temporary_path, destination_path)
+        os.unlink(source_path)
+
+
+def _is_under(relative_path, folders):
+    """ Check if a relative path is inside one of the folders"""
+    parent = os.path.dirname(relative_path)
+    while parent:
+        if parent in folders:
+            return True
+        parent = os.path.dirname(parent)
+    return False
+
+
+def _same_content(first_path, second_path):
+    """ Check if two files have the same size and bytes"""
+    if os.path.getsize(first_path) != os.path.getsize(second_path):
+        return False
+    return filecmp.cmp(first_path, second_path, shallow=False)
+
+
+def merge_folders(source, destination):
+    """
+    Move the content of the source folder into the destination folder, at any depth.
+    Both trees are listed once up front. Entries missing from the destination are moved
+    (a whole folder with a single rename), files with the same content in the destination
+    are removed from the source, and the other clashes are left in the source and reported,
+    so no data is lost. The emptied source folders are removed.
+
+    Args:
+        source (str): The folder to merge
+        destination (str): The folder to merge it into
+
+    Returns:
+        MergeReport: What was moved, deduplicated, left in conflict or failed
+    """
+    report = MergeReport(source, destination)
+    source_entries = snapshot_tree(source)
+    destination_entries = snapshot_tree(destination)
+
+    # Folders whose content is not visited again: moved as a whole, failed or in conflict
+    handled_folders = set()
+
+    # Sorted so that a folder comes before its content
+    for relative_path in sorted(source_entries):
+        if _is_under(relative_path, handled_folders):
+            continue
+        is_dir = source_entries[relative_path]
+        source_path = os.path.join(source, relative_path)
+        destination_path = os.path.join(destination, relative_path)
+
+        if relative_path not in destination_entries:
+            try:
+                move_entry(source_path, destination_path)
+                report.moved.append(relative_path)
+            except OSError as e:
+                report.errors.append((relative_path, f"{e}"))
+            if is_dir:
+                handled_folders.add(relative_path)
+            continue
+
+        destination_is_dir = destination_entries[relative_path]
+        if is_dir and destination_is_dir:
+            # Both exist, their content is merged entry by entry
+            continue
+        if is_dir != destination_is_dir:
+            report.conflicts.append((relative_path, "a file and a folder have the same name"))
+            if is_dir:
+                handled_folders.add(relative_path)
+            continue
+
+        try:
+            if _same_content(source_path, destination_path):
+                os.unlink(source_path)
+                report.duplicates.append(relative_path)
+            else:
+                report.conflicts.append((relative_path, "a different file exists in the destination"))
+        except OSError as e:
+            report.errors.append((relative_path, f"{e}"))
+
+    # Remove the emptied source folders, deepest first, the ones still holding entries stay
+    for relative_path in sorted((path for path, is_dir in source_entries.items() if is_dir),
+                                key=lambda path: path.count(os.sep), reverse=True):
+        try:
+            os.rmdir(os.path.join(source, relative_path))
+        except OSError:
+            pass
+    try:
+        os.rmdir(source)
+    except OSError:
+        pass
+
+    return report
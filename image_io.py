@@ -0,0 +1,139 @@
+import os
+import threading
+import numpy as np
+import cv2
+from file_io import PLACEHOLDER_MODES, materialize_file, write_file_atomic
+# The codecs and outputs are described without OpenCV in output_formats, re-exported here
+from output_formats import (CODECS, DEFAULT_CODEC, HEIGHT_IMAGE, INTERPOLATION_FLAGS, WIDTH_IMAGE, OutputCodec,
+                            OutputSpec, parse_codec, parse_output_spec)
+
+# Interpolations available to resize the outputs, by name
+INTERPOLATIONS = {name: getattr(cv2, flag) for name, flag in INTERPOLATION_FLAGS.items()}
+
+# Encoded placeholder images, keyed by (width, height, codec)
+_placeholder_cache = {}
+
+
+class FrameBuffers:
+    """
+    Buffers reused by the images a thread processes one after the other: the encoded source
+    and one output frame per output size, so that they are not allocated again for every image
+    """
+
+    def __init__(self):
+        self.source = bytearray()
+        # (width, height, index) -> output frame
+        self.frames = {}
+
+    def read(self, file_path):
+        """
+        Read a file into the source buffer
+
+        Args:
+            file_path (str): The path of the file
+
+        Returns:
+            numpy.ndarray: A uint8 view of the file content, valid until the next read
+        """
+        with open(file_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if len(self.source) < size:
+                # A new buffer instead of resizing it, views of the old one may still be alive
+                self.source = bytearray(size)
+            length = f.readinto(memoryview(self.source)[:size])
+        return np.frombuffer(self.source, dtype=np.uint8, count=length)
+
+    def get_frame(self, width, height, index=0):
+        """
+        Get an output frame of a size, allocated the first time
+
+        Args:
+            width (int): The width of the frame
+            height (int): The height of the frame
+            index (int): Tells apart the frames of the same size that are in use at the same time
+
+        Returns:
+            numpy.ndarray: The frame
+        """
+        key = (width, height, index)
+        if key not in self.frames:
+            self.frames[key] = np.empty((height, width, 3), dtype=np.uint8)
+        return self.frames[key]
+
+
+# Frame buffers of every thread
+_thread_buffers = threading.local()
+
+
+def get_frame_buffers():
+    """
+    Get the frame buffers of the current thread, created the first time
+
+    Returns:
+        FrameBuffers: The buffers
+    """
+    if not hasattr(_thread_buffers, "buffers"):
+        _thread_buffers.buffers = FrameBuffers()
+    return _thread_buffers.buffers
+
+
+def create_white_image(width=WIDTH_IMAGE, height=HEIGHT_IMAGE):
+    """
+    Create a blank white image with the specified dimensions
+
+    Args:
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+
+    Returns:
+        numpy.ndarray: A white image
+    """
+    img = np.zeros([height, width, 3], dtype=np.uint8)
+    img.fill(255)
+    return img
+
+
+def get_placeholder_bytes(width=WIDTH_IMAGE, height=HEIGHT_IMAGE, codec=DEFAULT_CODEC):
+    """
+    Get the encoded white placeholder image, encoding it only the first time
+
+    Args:
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        codec (OutputCodec): The codec used to encode the image
+
+    Returns:
+        bytes: The encoded placeholder image
+    """
+    key = (width, height, codec)
+    if key not in _placeholder_cache:
+        _placeholder_cache[key] = codec.encode(create_white_image(width, height))
+    return _placeholder_cache[key]
+
+
+def write_placeholder_image(destination_path, mode="copy", canonical_path=None,
+                            width=WIDTH_IMAGE, height=HEIGHT_IMAGE, codec=DEFAULT_CODEC):
+    """
+    Write the white placeholder image to the destination path
+
+    Args:
+        destination_path (str): The path to save the placeholder image
+        mode (str): "copy" writes the cached encoded bytes, "hardlink" and "reflink"
+            link the destination to the canonical placeholder file
+        canonical_path (str): The canonical placeholder file, required for links
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        codec (OutputCodec): The codec used to encode the image
+
+    Returns:
+        str: The mode actually used, links fall back to "copy"
+    """
+    if mode == "copy" or canonical_path is None:
+        write_file_atomic(destination_path, get_placeholder_bytes(width, height, codec))
+        return "copy"
+
+    # Create the canonical file the first time it is needed
+    if not os.path.exists(canonical_path):
+        write_file_atomic(canonical_path, get_placeholder_bytes(width, height, codec))
+
+    return materialize_file(canonical_path, destination_path, mode)
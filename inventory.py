@@ -0,0 +1,231 @@
+import os
+import re
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+# Task renumbering map: defines how original task numbers are converted to new ones
+# Tasks 1, 2, and 5 are skipped as per requirements
+TASK_RENUMBERING_MAP = {
+    1: None, 2: None, 5: None,  # Skip these tasks
+    3: 1,  # Task3 becomes Task1
+    4: 2,  # Task4 becomes Task2
+    6: 3,  # Task6 becomes Task3
+    7: 4, 8: 5, 9: 6, 10: 7,
+    11: 8, 12: 9, 13: 10, 14: 11,
+    15: 12, 16: 13, 17: 14, 18: 15,
+    19: 16, 20: 17, 21: 18, 22: 19,
+    26: None  # Task26 is skipped
+}
+
+# Reverse mapping for reference (new task number → original task number)
+TASK_ORIGINAL_MAP = {new_num: old_num for old_num, new_num in TASK_RENUMBERING_MAP.items() if new_num is not None}
+
+# Renumbering maps of the years whose protocol differs from TASK_RENUMBERING_MAP, keyed by year column
+YEAR_TASK_RENUMBERING_MAPS = {}
+
+# Original task numbers acquired for every subject
+ORIGINAL_TASK_NUMBERS = list(range(1, 23)) + [26]
+
+# Matches 'Task_N', 'TaskN_' and 'TaskN' anywhere in a filename, the first occurrence wins
+TASK_NAME_PATTERN = re.compile(r"Task_?(\d+)")
+
+# Number of folders listed concurrently, listing latency dominates on network shares
+LISTING_WORKERS = 16
+
+
+def normalize_task_name(filename):
+    """
+    Normalize various task naming patterns to a standard 'TaskN' format (without underscore)
+
+    Args:
+        filename (str): The filename to normalize
+
+    Returns:
+        str: The normalized task name in 'TaskN' format, or None if not a task
+        int: The extracted task number, or None if not a task
+    """
+    match = TASK_NAME_PATTERN.search(filename)
+    if match is None:
+        # Not a task
+        return None, None
+    task_number = int(match.group(1))
+    return f"Task{task_number}", task_number
+
+
+def get_renumbered_task_name(original_task_number):
+    """
+    Convert original task number to the renumbered task number
+
+    Args:
+        original_task_number (int): Original task number
+
+    Returns:
+        str: Renumbered task name in TaskN format, or None if task should be skipped
+    """
+    if original_task_number in TASK_RENUMBERING_MAP:
+        new_number = TASK_RENUMBERING_MAP[original_task_number]
+        if new_number is not None:
+            return f"Task{new_number}"
+    return None
+
+
+def get_task_renumbering_map(year=None):
+    """
+    Get the task renumbering map of an acquisition year
+
+    Args:
+        year (str): The year column, e.g. 'Anno_1'
+
+    Returns:
+        dict: Original task number -> new task number, None for the skipped tasks
+    """
+    return YEAR_TASK_RENUMBERING_MAPS.get(year, TASK_RENUMBERING_MAP)
+
+
+def get_new_task_names(year=None):
+    """
+    Get the renumbered task names of an acquisition year
+
+    Args:
+        year (str): The year column, e.g. 'Anno_1'
+
+    Returns:
+        list: The new task names in order, e.g. ['Task1', ..., 'Task19']
+    """
+    new_numbers = {number for number in get_task_renumbering_map(year).values() if number is not None}
+    return [f"Task{number}" for number in sorted(new_numbers)]
+
+
+@dataclass
+class SubjectInventory:
+    """ Files of a subject folder, as listed by a single scan"""
+    native_code: str
+    folder_path: str
+    images_folder_path: str = None
+    # Original task number -> file path
+    images: dict = field(default_factory=dict)
+    csv_files: dict = field(default_factory=dict)
+    anagrafica_files: list = field(default_factory=list)
+    number_of_elements: int = 0
+    number_of_csv_files: int = 0
+    number_of_images_files: int = 0
+
+    def get_missing_tasks(self, kind="images"):
+        """
+        Get the original tasks that have no file
+
+        Args:
+            kind (str): "images" or "csv"
+
+        Returns:
+            list: The missing original task names in TaskN format
+        """
+        tasks = self.images if kind == "images" else self.csv_files
+        return [f"Task{number}" for number in ORIGINAL_TASK_NUMBERS if number not in tasks]
+
+    def get_renumbered_tasks(self, kind="images"):
+        """
+        Get the renumbered tasks that have a file
+
+        Args:
+            kind (str): "images" or "csv"
+
+        Returns:
+            list: The renumbered task names in TaskN format, sorted by task number
+        """
+        tasks = self.images if kind == "images" else self.csv_files
+        new_numbers = sorted({TASK_RENUMBERING_MAP[number] for number in tasks
+                              if TASK_RENUMBERING_MAP.get(number) is not None})
+        return [f"Task{number}" for number in new_numbers]
+
+
+def _add_task_file(tasks, filename, path):
+    """ Register a task file, keeping the longest filename when a task has several files"""
+    name = os.path.splitext(filename)[0]
+    _, task_number = normalize_task_name(name)
+    if task_number is None:
+        return
+    current = tasks.get(task_number)
+    if current is None or (len(current), current) < (len(path), path):
+        tasks[task_number] = path
+
+
+def scan_subject(folder_path, native_code=None, image_extension=".png"):
+    """
+    List a subject folder and its Images folder once and parse every task filename
+
+    Args:
+        folder_path (str): The path of the subject folder
+        native_code (str): The name of the subject folder, defaults to its basename
+        image_extension (str): The extension of the task images
+
+    Returns:
+        SubjectInventory: The files of the subject
+    """
+    if native_code is None:
+        native_code = os.path.basename(os.path.normpath(folder_path))
+    inventory = SubjectInventory(native_code, folder_path)
+
+    try:
+        entries = list(os.scandir(folder_path))
+    except FileNotFoundError:
+        return inventory
+
+    inventory.number_of_elements = len(entries)
+    for entry in entries:
+        if entry.is_dir():
+            # The images folder is 'Images' or 'images' depending on the acquisition station
+            if entry.name.lower() == "images":
+                inventory.images_folder_path = entry.path
+        elif entry.name.endswith(".csv"):
+            inventory.number_of_csv_files += 1
+            _add_task_file(inventory.csv_files, entry.name, entry.path)
+        elif "Anagrafica" in entry.name and entry.name.endswith(".txt"):
+            inventory.anagrafica_files.append(entry.path)
+
+    inventory.anagrafica_files.sort()
+
+    if inventory.images_folder_path is not None:
+        for entry in os.scandir(inventory.images_folder_path):
+            inventory.number_of_images_files += 1
+            if entry.name.endswith(image_extension) and entry.is_file():
+                _add_task_file(inventory.images, entry.name, entry.path)
+
+    return inventory
+
+
+def list_subject_folders(subject_folder):
+    """
+    List the subject folders with a single scan
+
+    Args:
+        subject_folder (str): The folder containing the subject folders (Soggetti)
+
+    Returns:
+        list: The names of the subject folders, sorted
+    """
+    return sorted(entry.name for entry in os.scandir(subject_folder) if entry.is_dir())
+
+
+def scan_subjects(subject_folder, native_codes=None, image_extension=".png", workers=LISTING_WORKERS):
+    """
+    Walk the subjects folder once, listing the subject folders concurrently
+
+    Args:
+        subject_folder (str): The folder containing the subject folders (Soggetti)
+        native_codes (list): The subject folders to scan, defaults to all of them
+        image_extension (str): The extension of the task images
+        workers (int): The number of folders listed at the same time
+
+    Returns:
+        dict: native code -> SubjectInventory, sorted by native code
+    """
+    if native_codes is None:
+        native_codes = list_subject_folders(subject_folder)
+
+    def scan(native_code):
+        return scan_subject(os.path.join(subject_folder, native_code), native_code, image_extension)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        inventories = executor.map(scan, sorted(native_codes))
+        return {inventory.native_code: inventory for inventory in inventories}
@@ -1,39 +1,78 @@
 import os
 import sys
-import numpy as np
-import pandas as pd
-import cv2
-import re
-import glob
-from alive_progress import alive_bar
+import csv
+import json
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from inventory import (ORIGINAL_TASK_NUMBERS, get_new_task_names, get_task_renumbering_map, list_subject_folders,
+                       scan_subjects)
+from code_index import SubjectCodeIndex
+from data_paths import DEFAULT_WORKDIR, DEFAULT_YEAR, get_data_paths
+from manifest import Manifest, make_record, is_record_current
+from plan import Operation, Plan, load_plans, save_plans
+from sharding import get_shards, parse_shard
+from folder_merge import merge_folders
+from verifier import verify_dataset
+from dedup import find_duplicate_sources
+from watcher import WATCH_POLL_SECONDS, WATCH_SETTLE_SECONDS, FolderWatcher
+from missing_report import MissingTaskReport, get_report_files
+from metrics import RUN_METRICS, merge_run_reports, write_json_report, write_prometheus_textfile
+from file_io import materialize_file, write_file_atomic
+from output_formats import DEFAULT_CODEC, OutputSpec, parse_codec
 
 # Define paths
-WORKDIR = "C:\\Users\\Emanuele\\Desktop\\Dati_CRC\\"
+WORKDIR = DEFAULT_WORKDIR
 PARENT_FOLDER = WORKDIR + "Anno_3\\"
 SUBJECT_FOLDER = PARENT_FOLDER + "Soggetti\\"
 TASKS_FOLDER = PARENT_FOLDER + "Tasks\\"
 ANAGRAFICA_FILE = WORKDIR + "anagrafica.csv"
 CODICI_FILE = WORKDIR + "codici.csv"
-MISSING_TASKS_FILE = WORKDIR + "missing_tasks_crc.txt"
-ANNO = "Anno_3"
-
-# Task renumbering map: defines how original task numbers are converted to new ones
-# Tasks 1, 2, and 5 are skipped as per requirements
-TASK_RENUMBERING_MAP = {
-    1: None, 2: None, 5: None,  # Skip these tasks
-    3: 1,  # Task3 becomes Task1
-    4: 2,  # Task4 becomes Task2
-    6: 3,  # Task6 becomes Task3
-    7: 4, 8: 5, 9: 6, 10: 7,
-    11: 8, 12: 9, 13: 10, 14: 11,
-    15: 12, 16: 13, 17: 14, 18: 15,
-    19: 16, 20: 17, 21: 18, 22: 19,
-    26: None  # Task26 is skipped
-}
-
-# Reverse mapping for reference (new task number → original task number)
-TASK_ORIGINAL_MAP = {new_num: old_num for old_num, new_num in TASK_RENUMBERING_MAP.items() if new_num is not None}
+ANNO = DEFAULT_YEAR
+# Tasks missing from the existing subjects, with their completeness, "json" or "csv"
+MISSING_TASKS_FORMAT = "json"
+MISSING_TASKS_FILE = WORKDIR + "missing_tasks_crc_" + ANNO + "." + MISSING_TASKS_FORMAT
+# Manifest of the produced outputs, used to skip up to date work
+MANIFEST_FILE = WORKDIR + "manifest_crc_" + ANNO + ".jsonl"
+# Stage timings and counters of the last run, for all the years it processed
+RUN_REPORT_FILE = WORKDIR + "run_report_crc.json"
+METRICS_TEXTFILE = WORKDIR + "crc_organizer.prom"
+# Entries left in the native folders by the merges of the last run
+MERGE_REPORT_FILE = WORKDIR + "merge_conflicts_crc_" + ANNO + ".csv"
+# Problems found by the last verification
+VERIFY_REPORT_FILE = WORKDIR + "verify_crc_" + ANNO + ".json"
+
+# Number of placeholder images written at the same time
+PLACEHOLDER_WORKERS = 8
+
+
+def configure_paths(workdir, year=None):
+    """
+    Point the path constants to another data folder, e.g. a generated test cohort
+
+    Args:
+        workdir (str): The folder containing codici.csv, anagrafica.csv and the year folders
+        year (str): The year column and folder to process, e.g. 'Anno_3', defaults to the current one
+    """
+    global WORKDIR, PARENT_FOLDER, SUBJECT_FOLDER, TASKS_FOLDER, ANAGRAFICA_FILE, CODICI_FILE
+    global MISSING_TASKS_FILE, ANNO, MANIFEST_FILE, RUN_REPORT_FILE, METRICS_TEXTFILE, MERGE_REPORT_FILE
+    global VERIFY_REPORT_FILE
+
+    if year is not None:
+        ANNO = year
+    paths = get_data_paths(workdir, ANNO, MISSING_TASKS_FORMAT)
+    WORKDIR = paths.workdir
+    PARENT_FOLDER = paths.parent_folder
+    SUBJECT_FOLDER = paths.subject_folder
+    TASKS_FOLDER = paths.tasks_folder
+    ANAGRAFICA_FILE = paths.anagrafica_file
+    CODICI_FILE = paths.codici_file
+    MISSING_TASKS_FILE = paths.missing_tasks_file
+    MANIFEST_FILE = paths.manifest_file
+    RUN_REPORT_FILE = paths.run_report_file
+    METRICS_TEXTFILE = paths.metrics_textfile
+    MERGE_REPORT_FILE = paths.merge_report_file
+    VERIFY_REPORT_FILE = paths.verify_report_file
+
 
 # Acquired Image dimensions
 WIDTH_ACQUIRED = 1280
@@ -44,329 +83,1359 @@ WIDTH_IMAGE = 1920
 HEIGHT_IMAGE = 1080
 
 
-def normalize_task_name(filename):
+def crop_image(img):
     """
-    Normalize various task naming patterns to a standard 'TaskN' format (without underscore)
+    Crop an acquired image to the specified coordinates
 
     Args:
-        filename (str): The filename to normalize
+        img (numpy.ndarray): The acquired image
 
     Returns:
-        str: The normalized task name in 'TaskN' format, or None if not a task
-        int: The extracted task number, or None if not a task
+        numpy.ndarray: The cropped image, a view of the acquired one
     """
-    # In 'Task_N' format, convert to 'TaskN'
-    if re.match(r"Task_\d+", filename):
-        task_number = int(re.search(r"Task_(\d+)", filename).group(1))
-        return f"Task{task_number}", task_number
+    with RUN_METRICS.time("crop"):
+        return img[0:HEIGHT_ACQUIRED, 0:WIDTH_ACQUIRED]
 
-    # In 'TaskN_' format, just remove the trailing underscore
-    if re.match(r"Task\d+_", filename):
-        task_number = int(re.search(r"Task(\d+)_", filename).group(1))
-        return f"Task{task_number}", task_number
 
-    # Already in 'TaskN' format (without trailing underscore)
-    if re.match(r"Task\d+$", filename) or re.match(r"Task\d+[^_]", filename):
-        task_number = int(re.search(r"Task(\d+)", filename).group(1))
-        return f"Task{task_number}", task_number
+def resize_image(img, spec=None, frame=None):
+    """
+    Resize a cropped image to the size of an output
 
-    # Try to extract any task number if possible from other formats
-    match = re.search(r"Task[_]?(\d+)", filename)
-    if match:
-        task_number = int(match.group(1))
-        return f"Task{task_number}", task_number
+    Args:
+        img (numpy.ndarray): The cropped image
+        spec (OutputSpec): The output, defaults to the main output size
+        frame (numpy.ndarray): A preallocated frame of the output size to resize into
 
-    # Not a task
-    return None, None
+    Returns:
+        numpy.ndarray: The resized image, the frame itself if one was given
+    """
+    import cv2
+    from image_io import INTERPOLATIONS
+
+    if spec is None:
+        size, interpolation = (WIDTH_IMAGE, HEIGHT_IMAGE), INTERPOLATIONS["linear"]
+    else:
+        size, interpolation = (spec.width, spec.height), INTERPOLATIONS[spec.interpolation]
+    with RUN_METRICS.time("resize"):
+        return cv2.resize(img, size, dst=frame, interpolation=interpolation)
 
 
-def get_renumbered_task_name(original_task_number):
+def transform_image(img):
     """
-    Convert original task number to the renumbered task number
+    Crop an acquired image to the specified coordinates and resize it
 
     Args:
-        original_task_number (int): Original task number
+        img (numpy.ndarray): The acquired image
 
     Returns:
-        str: Renumbered task name in TaskN format, or None if task should be skipped
+        numpy.ndarray: The cropped and resized image
     """
-    if original_task_number in TASK_RENUMBERING_MAP:
-        new_number = TASK_RENUMBERING_MAP[original_task_number]
-        if new_number is not None:
-            return f"Task{new_number}"
-    return None
+    return resize_image(crop_image(img))
 
 
-def get_images_in_folder(images_folder_path, image_extension=".png"):
+def transform_source(source_path, outputs, buffers=None):
     """
-    Get the list of images in the folder
+    Read an image and crop it once, then resize, encode and save it for every output,
+    so that the derived outputs (previews, model inputs) cost only their resize and encode
 
     Args:
-        images_folder_path (str): The path of the folder
-        image_extension (str): The extension of the images
+        source_path (str): The path to the image to crop and resize
+        outputs (list): (destination path, OutputSpec) of every output of the image
+        buffers (FrameBuffers): Buffers of the current thread to read the source and resize
+            the outputs into, instead of allocating them for this image
 
     Returns:
-        list: The list of image file paths in the folder
+        list: The destination paths written
+    """
+    import numpy as np
+    import cv2
+
+    written = []
+    try:
+        # Read the encoded image, then decode it, so the two are timed separately
+        with RUN_METRICS.time("read"):
+            if buffers is not None:
+                data = buffers.read(source_path)
+            else:
+                with open(source_path, "rb") as f:
+                    data = np.frombuffer(f.read(), dtype=np.uint8)
+        RUN_METRICS.count("bytes_read", len(data))
+
+        with RUN_METRICS.time("decode"):
+            img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if img is None:
+            raise FileNotFoundError(source_path)
+
+        # Crop the image once for all the outputs
+        cropped = crop_image(img)
+    except FileNotFoundError:
+        print(f"File {source_path} NOT found!")
+        RUN_METRICS.count("errors", len(outputs))
+        return written
+    except Exception as e:
+        print(f"Error processing {source_path}: {e}")
+        RUN_METRICS.count("errors", len(outputs))
+        return written
+
+    for destination_path, spec in outputs:
+        try:
+            frame = buffers.get_frame(spec.width, spec.height) if buffers is not None else None
+            resized = resize_image(cropped, spec, frame)
+
+            # Ensure the destination directory exists
+            destination_dir = os.path.dirname(destination_path)
+            if not os.path.exists(destination_dir):
+                os.makedirs(destination_dir, exist_ok=True)
+
+            # Save the resized image, replacing the destination instead of writing
+            # through it, in case it is a hardlink to the shared placeholder
+            with RUN_METRICS.time("encode"):
+                encoded = spec.codec.encode(resized)
+            with RUN_METRICS.time("write"):
+                write_file_atomic(destination_path, encoded)
+            RUN_METRICS.count("bytes_written", len(encoded))
+            RUN_METRICS.count("images_processed")
+            written.append(destination_path)
+        except Exception as e:
+            print(f"Error processing {source_path} into {destination_path}: {e}")
+            RUN_METRICS.count("errors")
+    return written
+
+
+def crop_and_resize_image(source_path, destination_path, codec=DEFAULT_CODEC):
     """
-    # Create the folder if it doesn't exist
-    if not os.path.exists(images_folder_path):
-        os.makedirs(images_folder_path)
-        return []
+    Read an image, crop it to the specified coordinates, resize it,
+    and save it to the specified destination path
 
-    # Get all the images in the folder
-    images_file_list = [f.path for f in os.scandir(images_folder_path) if
-                        f.is_file() and f.path.endswith(image_extension)]
+    Args:
+        source_path (str): The path to the image to crop and resize
+        destination_path (str): The path to save the processed image
+        codec (OutputCodec): The codec used to encode the processed image
 
-    # Sort by filename
-    images_file_list = sorted(images_file_list, key=lambda x: len(x))
+    Returns:
+        bool: True if the image was written
+    """
+    return bool(transform_source(source_path, [(destination_path, get_main_output(codec))]))
 
-    return images_file_list
 
+def read_code_index():
+    """
+    Read codici.csv and index the subject codes, without loading pandas
 
-def create_white_image(width=WIDTH_IMAGE, height=HEIGHT_IMAGE):
+    Returns:
+        SubjectCodeIndex: The index over the codici.csv year columns
     """
-    Create a blank white image with the specified dimensions
+    try:
+        code_index = SubjectCodeIndex.from_csv(CODICI_FILE)
+    except (OSError, ValueError, StopIteration) as e:
+        print(f"Error reading {CODICI_FILE}: {e}")
+        sys.exit(1)
+
+    # Report duplicates and conflicts before processing
+    code_index.report_problems()
+    return code_index
+
+
+def get_placeholder_path(codec=DEFAULT_CODEC, tasks_folder=None):
+    """
+    Get the path of the canonical placeholder image that links point to
 
     Args:
-        width (int): Image width in pixels
-        height (int): Image height in pixels
+        codec (OutputCodec): The codec of the output images
+        tasks_folder (str): The folder containing the TaskN folders, defaults to TASKS_FOLDER
 
     Returns:
-        numpy.ndarray: A white image
+        str: The path of the canonical placeholder image
     """
-    img = np.zeros([height, width, 3], dtype=np.uint8)
-    img.fill(255)
-    return img
+    return os.path.join(tasks_folder or TASKS_FOLDER, f"placeholder{codec.extension}")
 
 
-def crop_and_resize_image(source_path, destination_path):
+def get_main_output(codec=DEFAULT_CODEC):
     """
-    Read an image, crop it to the specified coordinates, resize it,
-    and save it to the specified destination path
+    Get the main output, written to the Tasks folder
 
     Args:
-        source_path (str): The path to the image to crop and resize
-        destination_path (str): The path to save the processed image
+        codec (OutputCodec): The codec of the output images
+
+    Returns:
+        OutputSpec: The main output
     """
-    try:
-        # Read the image
-        img = cv2.imread(source_path)
+    return OutputSpec(None, WIDTH_IMAGE, HEIGHT_IMAGE, codec)
 
-        # Get image dimensions
-        height, width, channels = img.shape
 
-        # Crop the image to specified coordinates
-        cropped = img[0:HEIGHT_ACQUIRED, 0:WIDTH_ACQUIRED]
+def get_output_specs(codec=DEFAULT_CODEC, outputs=None):
+    """
+    Get every output produced from a source image: the main one, then the derived ones
 
-        # Resize the cropped image to specified dimensions
-        resized = cv2.resize(cropped, (WIDTH_IMAGE, HEIGHT_IMAGE))
+    Args:
+        codec (OutputCodec): The codec of the main output
+        outputs (list): The derived outputs, e.g. previews and model inputs
 
-        # Ensure the destination directory exists
-        destination_dir = os.path.dirname(destination_path)
-        if not os.path.exists(destination_dir):
-            os.makedirs(destination_dir)
+    Returns:
+        list: The OutputSpec of every output
+    """
+    specs = [get_main_output(codec)] + list(outputs or [])
+    names = [spec.name for spec in specs[1:]]
+    for name in names:
+        if name in ("Tasks", "Soggetti") or names.count(name) > 1:
+            raise ValueError(f"Output name {name} is reserved or used twice")
+    return specs
 
-        # Save the resized image
-        cv2.imwrite(destination_path, resized)
-    except FileNotFoundError:
-        print(f"File {source_path} NOT found!")
-    except Exception as e:
-        print(f"Error processing {source_path}: {e}")
 
+def get_output_folder(spec=None):
+    """
+    Get the folder containing the TaskN folders of an output
 
-def read_csv_files():
+    Args:
+        spec (OutputSpec): The output, defaults to the main output
+
+    Returns:
+        str: TASKS_FOLDER for the main output, a folder next to it for the derived outputs
+    """
+    if spec is None or spec.name is None:
+        return TASKS_FOLDER
+    return os.path.join(PARENT_FOLDER, spec.name, "")
+
+
+def get_output_spec(params):
+    """
+    Get the output described by transform parameters, e.g. the ones of an operation
+
+    Args:
+        params (dict): The transform parameters from get_transform_params
+
+    Returns:
+        OutputSpec: The output, without its name
+    """
+    width, height = params["size"]
+    return OutputSpec(None, width, height, parse_codec(params["format"]), params.get("interpolation", "linear"))
+
+
+def get_output_key(subject_id, new_task_name, codec=DEFAULT_CODEC, output_name=None):
     """
-    Read the anagrafica.csv and codici.csv files
+    Get the manifest key of a task output, its path relative to the tasks folder
+
+    Args:
+        subject_id (str): The subject's ID from codici.csv
+        new_task_name (str): The renumbered task name
+        codec (OutputCodec): The codec of the output images
+        output_name (str): The name of a derived output, its folder prefixes the key
 
     Returns:
-        tuple: (anagrafica_df, codici_df) - pandas DataFrames containing the CSV data
+        str: The manifest key of the output
     """
+    output_key = f"{new_task_name}/{subject_id}_{new_task_name}{codec.extension}"
+    return output_key if output_name is None else f"{output_name}/{output_key}"
+
+
+def get_transform_params(placeholder=False, codec=DEFAULT_CODEC, spec=None):
+    """
+    Get the parameters that determine the content of an output, stored in the manifest
+
+    Args:
+        placeholder (bool): Whether the output is a placeholder image
+        codec (OutputCodec): The codec of the output images, when no spec is given
+        spec (OutputSpec): The output, defaults to the main output with codec
+
+    Returns:
+        dict: The transform parameters
+    """
+    if spec is None:
+        spec = get_main_output(codec)
+    if placeholder:
+        params = {"placeholder": True, "size": [spec.width, spec.height], "format": spec.codec.spec}
+    else:
+        params = {"crop": [WIDTH_ACQUIRED, HEIGHT_ACQUIRED], "size": [spec.width, spec.height],
+                  "format": spec.codec.spec}
+    # Outputs resized with the default interpolation keep the parameters of the previous runs
+    if spec.interpolation != "linear":
+        params["interpolation"] = spec.interpolation
+    return params
+
+
+def get_subject_records(manifest, subject_id, codec=DEFAULT_CODEC, year=None, outputs=None):
+    """
+    Get the manifest records of the outputs of a subject
+
+    Args:
+        manifest (Manifest): The manifest of the previous runs
+        subject_id (str): The subject's ID from codici.csv
+        codec (OutputCodec): The codec of the output images
+        year (str): The year of the outputs, selects the renumbered tasks
+        outputs (list): The derived outputs, whose records are included
+
+    Returns:
+        dict: The records keyed by output key
+    """
+    records = {}
+    for spec in get_output_specs(codec, outputs):
+        for new_task_name in get_new_task_names(year):
+            output_key = get_output_key(subject_id, new_task_name, spec.codec, spec.name)
+            if manifest.get(output_key) is not None:
+                records[output_key] = manifest.get(output_key)
+    return records
+
+
+def write_placeholder(destination_path, placeholder_mode="copy", codec=DEFAULT_CODEC, spec=None):
+    """
+    Write the white placeholder image of a missing task, counting it in the run metrics
+
+    Args:
+        destination_path (str): The path to save the placeholder image
+        placeholder_mode (str): How the placeholder is materialized ("copy", "hardlink" or "reflink")
+        codec (OutputCodec): The codec used to encode the image, when no spec is given
+        spec (OutputSpec): The output the placeholder stands for, defaults to the main output with codec
+    """
+    from image_io import get_placeholder_bytes, write_placeholder_image
+
+    if spec is None:
+        spec = get_main_output(codec)
+    # Links point to the canonical placeholder of the tasks folder the output belongs to (Tasks/TaskN/file)
+    tasks_folder = os.path.dirname(os.path.dirname(destination_path))
+    with RUN_METRICS.time("placeholder"):
+        used_mode = write_placeholder_image(destination_path, placeholder_mode,
+                                            get_placeholder_path(spec.codec, tasks_folder), spec.width, spec.height,
+                                            spec.codec)
+    RUN_METRICS.count("placeholders_written")
+    if used_mode == "copy":
+        RUN_METRICS.count("bytes_written", len(get_placeholder_bytes(spec.width, spec.height, spec.codec)))
+
+
+def init_worker(workdir=None, year=None):
+    """
+    Initialize a worker process with the paths of the main process. The workers only transform
+    images, the placeholders are written by the main process
+
+    Args:
+        workdir (str): The data folder of the main process, if it was configured with configure_paths
+        year (str): The year processed by the main process
+    """
+    # Spawned workers import the module again, with the default paths
+    if workdir is not None:
+        configure_paths(workdir, year)
+
+
+def write_placeholders(operations, placeholder_mode="copy", workers=PLACEHOLDER_WORKERS):
+    """
+    Write the placeholder images of a batch of placeholder operations on a thread pool,
+    at the size and codec of the output of each operation
+
+    Args:
+        operations (list): The placeholder operations
+        placeholder_mode (str): How the placeholders are materialized ("copy", "hardlink" or "reflink")
+        workers (int): The number of placeholders written at the same time
+
+    Returns:
+        tuple: (records, failed_subjects) - the manifest records of the placeholders written, keyed
+            by year, and the (year, native code) of the existing subjects with a placeholder that
+            could not be written
+    """
+    def write(operation):
+        try:
+            write_placeholder(operation.destination_path, placeholder_mode, spec=get_output_spec(operation.params))
+        except Exception as e:
+            return e
+        return None
+
+    records = {}
+    failed_subjects = set()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for operation, error in zip(operations, executor.map(write, operations)):
+            if error is None:
+                records.setdefault(operation.year, []).append(make_record(operation.output_key, None,
+                                                                          operation.params))
+                continue
+            print(f"Error writing placeholder {operation.destination_path}: {error}")
+            RUN_METRICS.count("errors")
+            if operation.native_code is not None:
+                failed_subjects.add((operation.year, operation.native_code))
+    return records, failed_subjects
+
+
+def plan_subject(subject_folder_code, subject_id, subject_images, previous_records=None, use_hash=False,
+                 codec=DEFAULT_CODEC, year=None, outputs=None):
+    """
+    Decide the operation of every renumbered task of an existing subject, without writing anything
+
+    Args:
+        subject_folder_code (str): The native code (folder name) of the subject
+        subject_id (str): The subject's ID from codici.csv
+        subject_images (dict): The subject's task images from the inventory, original task number -> path
+        previous_records (dict): The manifest records of the subject's outputs, outputs
+            that are still up to date are skipped
+        use_hash (bool): Whether to compare source content hashes
+        codec (OutputCodec): The codec used to encode the outputs
+        year (str): The year of the subject folder, selects the task renumbering map
+        outputs (list): The derived outputs produced next to the main one
+
+    Returns:
+        tuple: (missing_tasks, operations) - the original task names missing from the subject's
+            Images folder and the transform, placeholder or skip operation of every output
+    """
+    specs = get_output_specs(codec, outputs)
+    if previous_records is None:
+        previous_records = {}
+    operations = []
+
+    # Find missing tasks (unnumbered)
+    missing_tasks = [f"Task{number}" for number in ORIGINAL_TASK_NUMBERS if number not in subject_images]
+
+    # Process each task with the new numbering scheme of the year
+    for original_number, new_task_number in sorted(get_task_renumbering_map(year).items()):
+        # Skip tasks that should be excluded
+        if new_task_number is None:
+            continue
+        new_task_name = f"Task{new_task_number}"
+        original_image_path = subject_images.get(original_number)
+
+        # The main output and the derived ones, all produced from one decode of the source
+        for spec in specs:
+            # Create paths for the new task
+            new_task_folder = os.path.join(get_output_folder(spec), new_task_name)
+            new_task_filename = f"{subject_id}_{new_task_name}{spec.codec.extension}"
+            new_task_filepath = os.path.join(new_task_folder, new_task_filename)
+            output_key = get_output_key(subject_id, new_task_name, spec.codec, spec.name)
+
+            # Task exists - crop and resize the image, task is missing - write the white placeholder image
+            params = get_transform_params(original_image_path is None, spec=spec)
+            kind = "placeholder" if original_image_path is None else "transform"
+
+            # Skip the outputs produced from the same source and parameters by a previous run
+            if is_record_current(previous_records.get(output_key), new_task_filepath, original_image_path, params,
+                                 use_hash):
+                kind = "skip"
+
+            operations.append(Operation(kind, new_task_filepath, original_image_path, subject_id,
+                                        subject_folder_code, output_key, params, year))
+
+    return missing_tasks, operations
+
+
+def group_by_source(operations):
+    """
+    Group transform operations by source image, so that every source is decoded once for all its outputs
+
+    Args:
+        operations (list): The transform operations
+
+    Returns:
+        dict: Source path -> its operations, in plan order
+    """
+    operations_by_source = {}
+    for operation in operations:
+        operations_by_source.setdefault(operation.source_path, []).append(operation)
+    return operations_by_source
+
+
+def transform_images(operations, use_hash=False, reuse_buffers=False):
+    """
+    Crop and resize the images of a subject's transform operations, decoding every source once
+    for all its outputs. Safe to run in a worker process.
+
+    Args:
+        operations (list): The transform operations
+        use_hash (bool): Whether to store the source content hashes in the records
+        reuse_buffers (bool): Read and resize into the frame buffers of the current thread,
+            so that the images do not allocate new ones
+
+    Returns:
+        list: The manifest records of the outputs written
+    """
+    from image_io import get_frame_buffers
+
+    buffers = get_frame_buffers() if reuse_buffers else None
+    records = []
+    for source_path, source_operations in group_by_source(operations).items():
+        # The source is described before reading it, so a change during the run is detected next time
+        source_records = {operation.destination_path: make_record(operation.output_key, source_path,
+                                                                  operation.params, use_hash)
+                          for operation in source_operations}
+        written = transform_source(source_path, [(operation.destination_path, get_output_spec(operation.params))
+                                                 for operation in source_operations], buffers)
+        records += [source_records[destination_path] for destination_path in written]
+    return records
+
+
+def transform_images_in_worker(*args):
+    """
+    Run transform_images in a worker process and send back the metrics of the batch
+
+    Args:
+        *args: The arguments of transform_images
+
+    Returns:
+        tuple: (records, metrics) - the result of transform_images and the snapshot
+            of the worker metrics collected while transforming the images
+    """
+    RUN_METRICS.reset()
+    records = transform_images(*args)
+    return records, RUN_METRICS.snapshot()
+
+
+def make_pipeline_job(source_path, operations, subject, use_hash=False):
+    """
+    Make the pipeline job producing every output of a source image from one decode and one crop
+
+    Args:
+        source_path (str): The source image
+        operations (list): The transform operations of the source
+        subject (tuple): The (year, native code) of the subject, returned in the tag of the job
+        use_hash (bool): Whether to store the source content hashes in the records
+
+    Returns:
+        ImageJob: The job, tagged with the subject and the records of its outputs
+    """
+    from pipeline import ImageJob
+
+    # The records are made as the jobs are fed to the pipeline, before reading the sources
+    records = [make_record(operation.output_key, source_path, operation.params, use_hash) for operation in operations]
+    outputs = []
+    for index, operation in enumerate(operations):
+        spec = get_output_spec(operation.params)
+
+        # Each output of the job has its own frame in the buffers, even when the sizes are the same
+        def resize(img, buffers=None, spec=spec, index=index):
+            frame = buffers.get_frame(spec.width, spec.height, index) if buffers is not None else None
+            return resize_image(img, spec, frame)
+
+        outputs.append((operation.destination_path, spec.codec, resize))
+    return ImageJob(source_path, operations[0].destination_path, outputs[0][1], (subject, records), outputs)
+
+
+def transform_images_pipeline(transforms_by_subject, manifests, bar, pipeline, use_hash=False, reuse_buffers=False):
+    """
+    Stream the images of all the subjects through the staged pipeline, decoding every source once
+
+    Args:
+        transforms_by_subject (dict): The transform operations of every subject, keyed by (year, native code)
+        manifests (dict): The manifest of every year, records are appended as each subject completes
+        bar (callable): The progress bar, advanced once per subject
+        pipeline (PipelineConfig): The concurrency of the pipeline stages
+        use_hash (bool): Whether to store the source content hashes in the records
+        reuse_buffers (bool): Read the sources and resize the outputs into buffers preallocated for every
+            image in flight instead of allocating them for every image
+    """
+    from pipeline import run_pipeline
+
+    # Sources still in the pipeline and records written, per subject
+    sources_by_subject = {subject: group_by_source(operations) for subject, operations in transforms_by_subject.items()}
+    pending = {subject: len(sources) for subject, sources in sources_by_subject.items()}
+    subject_records = {subject: [] for subject in transforms_by_subject}
+
+    jobs = (make_pipeline_job(source_path, operations, subject, use_hash)
+            for subject, sources in sources_by_subject.items() for source_path, operations in sources.items())
+
+    for job, error in run_pipeline(jobs, crop_image, pipeline.read_workers, pipeline.transform_workers,
+                                   pipeline.write_workers, pipeline.queue_size, reuse_buffers):
+        subject, records = job.tag
+        if error is None:
+            subject_records[subject] += records
+        else:
+            print(f"Error processing {job.source_path}: {error}")
+            RUN_METRICS.count("errors", len(records))
+
+        pending[subject] -= 1
+        if pending[subject] == 0:
+            year, _ = subject
+            manifests[year].append(subject_records.pop(subject))
+            bar()
+
+
+def rename_subject_folder(subject_folder_code, subject_id, subject_folder=None):
+    """
+    Rename the subject folder to use the ID code, merging the contents
+    if the destination folder already exists
+
+    Args:
+        subject_folder_code (str): The native code (folder name) of the subject
+        subject_id (str): The subject's ID from codici.csv
+        subject_folder (str): The folder containing the subject folders, defaults to SUBJECT_FOLDER
+
+    Returns:
+        MergeReport: The outcome of the merge, None if the folder was simply renamed
+    """
+    if subject_folder_code == subject_id:
+        return None
+
+    subject_path = os.path.join(subject_folder or SUBJECT_FOLDER, subject_folder_code)
+    new_subject_path = os.path.join(subject_folder or SUBJECT_FOLDER, subject_id)
+
+    # If the destination already exists, merge the contents
+    if os.path.exists(new_subject_path):
+        print(f"Warning: Destination folder {subject_id} already exists. Merging contents.")
+        report = merge_folders(subject_path, new_subject_path)
+        for relative_path, reason in report.conflicts:
+            print(f"Conflict merging {subject_folder_code} into {subject_id}: {relative_path}, {reason}")
+        for relative_path, error in report.errors:
+            print(f"Error merging {subject_folder_code} into {subject_id}: {relative_path}, {error}")
+        return report
+
+    # Simple rename if destination doesn't exist
+    os.rename(subject_path, new_subject_path)
+    return None
+
+
+def write_merge_report(merge_reports, report_path, append=False):
+    """
+    Write the entries left in the native folders by the merges, so they can be resolved by hand
+
+    Args:
+        merge_reports (list): (subject ID, MergeReport) of every merge of the run
+        report_path (str): The path of the csv file
+        append (bool): Add the entries to an existing report instead of rewriting it
+    """
+    write_header = not append or not os.path.exists(report_path)
+    with open(report_path, "a" if append else "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(["Id", "source", "path", "outcome", "detail"])
+        for subject_id, report in merge_reports:
+            for relative_path, reason in report.conflicts:
+                writer.writerow([subject_id, report.source, relative_path, "conflict", reason])
+            for relative_path, error in report.errors:
+                writer.writerow([subject_id, report.source, relative_path, "error", error])
+
+
+def write_missing_task_report(plan, failed_subjects=()):
+    """
+    Write the missing tasks of the processed subjects of a plan, with their completeness, in a single write.
+    A partial plan updates the subjects it processed in the existing report and keeps the others.
+
+    Args:
+        plan (Plan): The executed plan
+        failed_subjects (set): (year, native code) of the subjects that could not be processed, left out
+    """
+    report = MissingTaskReport(plan.year)
+    if plan.partial and os.path.exists(plan.missing_tasks_file):
+        try:
+            report = MissingTaskReport.load(plan.missing_tasks_file, plan.year)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading {plan.missing_tasks_file}, it is rewritten with the new subjects only: {e}")
+        report.remove_subjects(plan.missing_tasks)
+
+    # The existing subjects are the ones with operations from their native folder
+    subject_ids = {operation.native_code: operation.subject_id for operation in plan.operations
+                   if operation.native_code is not None}
+    # Folder order, regardless of the order the jobs finished in
+    for subject_folder_code, missing_tasks in plan.missing_tasks.items():
+        if (plan.year, subject_folder_code) not in failed_subjects:
+            report.add_subject(subject_folder_code, subject_ids.get(subject_folder_code), missing_tasks)
+    report.save(plan.missing_tasks_file)
+
+
+def export_dataset(output_folder, layout="task", codec=DEFAULT_CODEC):
+    """
+    Export the processed task images as memory-mapped arrays indexed by the codici.csv Id
+
+    Args:
+        output_folder (str): The folder to write the arrays to
+        layout (str): "task" for one array per task, "cohort" for a single array
+        codec (OutputCodec): The codec of the processed images
+    """
+    from tensor_export import export_tensors
+
+    code_index = read_code_index()
+    new_task_list = get_new_task_names(ANNO)
+    manifest = Manifest(MANIFEST_FILE).load()
+
+    header_paths = export_tensors(TASKS_FOLDER, code_index.ids, new_task_list, output_folder, layout, manifest,
+                                  codec)
+    print(f"Exported {len(code_index.ids)} subjects to {len(header_paths)} arrays in {output_folder}")
+
+
+def consolidate_csv_files(output_folder, layout="task", years=None):
+    """
+    Consolidate the task csv files of the subjects into a few Parquet files for analytics
+
+    Args:
+        output_folder (str): The folder to write the Parquet files to
+        layout (str): "task" for one file per renumbered task, "partitioned" for one file per subject and year
+        years (list): The years whose csv files are consolidated together, defaults to ANNO
+
+    Returns:
+        int: 0 if every csv file was consolidated, 1 otherwise
+    """
+    from csv_consolidation import consolidate_task_recordings, find_task_recordings
+
+    code_index = read_code_index()
+
+    # The subject folders of every year are listed once
+    configured_year = ANNO
+    recordings = []
     try:
-        # Read the anagrafica.csv file - note it uses semicolon delimiter
-        anagrafica_df = pd.read_csv(ANAGRAFICA_FILE, sep=";", encoding='utf-8')
+        for year in years or [ANNO]:
+            configure_paths(WORKDIR, year)
+            recordings += find_task_recordings(SUBJECT_FOLDER, code_index, year)
+    finally:
+        configure_paths(WORKDIR, configured_year)
 
-        # Read the codici.csv file
-        codici_df = pd.read_csv(CODICI_FILE, sep=",", encoding='utf-8')
-        codici_df = codici_df.convert_dtypes()
+    report = consolidate_task_recordings(recordings, output_folder, layout)
+    for csv_path, error in report.errors:
+        print(f"Error reading {csv_path}: {error}")
+    print(f"Consolidated {report.recordings} csv files ({report.rows} rows) into {len(report.files)} files "
+          f"in {output_folder}, {len(report.errors)} errors")
+    return 0 if not report.errors else 1
 
-        # Remove whitespaces from column Anno_3
-        if ANNO in codici_df.columns:
-            codici_df[ANNO] = codici_df[ANNO].str.strip()
 
-        return anagrafica_df, codici_df
+def verify_outputs(report_file=None, codec=DEFAULT_CODEC, years=None):
+    """
+    Check that every subject of codici.csv has the renumbered tasks at the output size
+    and a folder named after its ID, writing the problems found to a JSON report per year
 
-    except Exception as e:
-        print(f"Error reading CSV files: {e}")
-        sys.exit(1)
+    Args:
+        report_file (str): The JSON report to write, defaults to VERIFY_REPORT_FILE.
+            Only used when a single year is verified
+        codec (OutputCodec): The codec of the processed images
+        years (list): The years to verify, defaults to ANNO
 
+    Returns:
+        int: 0 if no problem was found, 1 otherwise
+    """
+    code_index = read_code_index()
+    years = years or [ANNO]
 
-def main():
+    configured_year = ANNO
+    status = 0
+    try:
+        for year in years:
+            configure_paths(WORKDIR, year)
+            report_path = report_file if report_file is not None and len(years) == 1 else VERIFY_REPORT_FILE
+            report = verify_dataset(TASKS_FOLDER, SUBJECT_FOLDER, code_index, year, get_new_task_names(year), codec,
+                                    WIDTH_IMAGE, HEIGHT_IMAGE)
+            report.save(report_path)
+
+            for kind, number in report.count().items():
+                print(f"{year} {kind}: {number}")
+            print(f"{year}: verified {report.images_checked} images of {report.subjects} subjects, "
+                  f"{len(report.issues)} problems (see {report_path})")
+            if not report.ok:
+                status = 1
+    finally:
+        configure_paths(WORKDIR, configured_year)
+    return status
+
+
+def build_plan(code_index, manifest, use_hash=False, codec=DEFAULT_CODEC, subject_codes=None, outputs=None,
+               shard=None):
     """
-    Main function to process subjects and tasks
+    Decide every operation of the configured year without touching any pixel: the folders
+    to create, the placeholders of the missing subjects and tasks, the images to crop and resize,
+    the outputs that are already up to date and the subject folders to rename or merge
+
+    Args:
+        code_index (SubjectCodeIndex): The index of the codici.csv codes
+        manifest (Manifest): The manifest of the previous runs
+        use_hash (bool): Whether to compare source content hashes to detect changes
+        codec (OutputCodec): The codec used to encode the output images
+        subject_codes (list): Plan only these subject folders and leave out the missing subjects,
+            e.g. the folders that arrived in watch mode. Defaults to every subject
+        outputs (list): The derived outputs (previews, model inputs) produced next to the main one
+        shard (Shard): Plan only the subjects of this shard, with the shard's own journal and reports
+
+    Returns:
+        Plan: The operations of the year
     """
-    # Read CSV files
-    anagrafica_df, codici_df = read_csv_files()
+    specs = get_output_specs(codec, outputs)
+    plan = Plan(ANNO, codec.spec, use_hash, TASKS_FOLDER, SUBJECT_FOLDER, MANIFEST_FILE, MISSING_TASKS_FILE,
+                MERGE_REPORT_FILE, partial=subject_codes is not None)
+    if shard is not None:
+        plan.shard = str(shard)
+        plan.manifest_file = shard.get_path(MANIFEST_FILE)
+        plan.missing_tasks_file = shard.get_path(MISSING_TASKS_FILE)
+        plan.merge_report_file = shard.get_path(MERGE_REPORT_FILE)
 
     # Get the list of tasks after renumbering (Task1 through Task19)
-    new_task_list = [f"Task{i}" for i in range(1, 20)]
+    new_task_list = get_new_task_names(ANNO)
 
-    # Create task folders for each renumbered task
-    for task in new_task_list:
-        task_folder_path = os.path.join(TASKS_FOLDER, task)
-        if not os.path.exists(task_folder_path):
-            os.makedirs(task_folder_path)
+    # Create task folders for each renumbered task, in the folder of every output
+    for spec in specs:
+        for task in new_task_list:
+            task_folder_path = os.path.join(get_output_folder(spec), task)
+            if not os.path.exists(task_folder_path):
+                plan.add(Operation("mkdir", task_folder_path))
 
     # Get subject directories - these are the present subjects
-    subject_directories = next(os.walk(SUBJECT_FOLDER))[1]
-    subject_directories = [x for x in subject_directories if not x.startswith("CRC")]
-    print(f"Number of existing subjects in the folder: {len(subject_directories)}")
-
-    # Get lists of subjects from codici_df
-    id_list = codici_df["Id"].tolist()
-    anno_list = []
-
-    # Handle the case where Anno_3 column might not exist
-    if ANNO in codici_df.columns:
-        anno_list = codici_df[ANNO].tolist()
-        # Replace NaN values with empty string
-        anno_list = ["" if pd.isna(x) else x for x in anno_list]
-    else:
-        # If Anno_3 doesn't exist, all subjects are considered missing
-        anno_list = ["" for _ in id_list]
+    # Sorted so that logging and merging do not depend on the listing order
+    with RUN_METRICS.time("listing"):
+        subject_folders = list_subject_folders(SUBJECT_FOLDER)
+        subject_directories = [x for x in subject_folders if not x.startswith("CRC")]
+        if plan.partial:
+            selected_codes = set(subject_codes)
+            subject_directories = [x for x in subject_directories if x in selected_codes]
+        if shard is not None:
+            # Folders unknown to codici.csv are reported by the shard of their name only
+            subject_directories = [x for x in subject_directories if shard.contains(code_index.get_id(ANNO, x) or x)]
+        print(f"Number of existing subjects in the folder: {len(subject_directories)}")
+
+        # List every present subject once, all the following steps read from this inventory
+        subject_inventories = scan_subjects(SUBJECT_FOLDER, subject_directories)
+
+    # Get the subjects without a code for the current year
+    # If the year column doesn't exist, all subjects are considered missing
+    # Their outputs only change with codici.csv, which is planned in full
+    missing_ids = [] if plan.partial else code_index.get_ids_without_code(ANNO)
+    if shard is not None:
+        missing_ids = [id_code for id_code in missing_ids if shard.contains(id_code)]
+    existing_folders = set(subject_folders)
+
+    # Missing subjects - an empty folder and a white image for each task and output
+    for id_code in missing_ids:
+        if id_code not in existing_folders:
+            plan.add(Operation("mkdir", os.path.join(SUBJECT_FOLDER, id_code), subject_id=id_code))
+
+        for spec in specs:
+            params = get_transform_params(True, spec=spec)
+            for task in new_task_list:
+                task_file_path = os.path.join(get_output_folder(spec), task,
+                                              f"{id_code}_{task}{spec.codec.extension}")
+                output_key = get_output_key(id_code, task, spec.codec, spec.name)
+                up_to_date = is_record_current(manifest.get(output_key), task_file_path, None, params)
+                plan.add(Operation("skip" if up_to_date else "placeholder", task_file_path, None, id_code, None,
+                                   output_key, params))
+
+    if not plan.partial:
+        print(f"Total missing subjects for {ANNO}: {len(missing_ids)}")
+
+    # Existing subjects - their task images, then the rename of their folder to the ID code
+    for subject_folder_code in subject_directories:
+        # Get subject's ID from the codici.csv index
+        subject_id = code_index.get_id(ANNO, subject_folder_code)
+
+        # Skip if subject not found in codici.csv
+        if subject_id is None:
+            print(f"Warning: Subject {subject_folder_code} not found in codici.csv")
+            continue
 
-    # Process missing subjects - create folders and white images
-    missing_count = 0
+        missing_tasks, operations = plan_subject(subject_folder_code, subject_id,
+                                                 subject_inventories[subject_folder_code].images,
+                                                 get_subject_records(manifest, subject_id, codec, ANNO, outputs),
+                                                 use_hash, codec, ANNO, outputs)
+        plan.missing_tasks[subject_folder_code] = missing_tasks
+        for operation in operations:
+            plan.add(operation)
 
-    print("Processing missing subjects...")
-    for id_code, anno_code in zip(id_list, anno_list):
-        # Skip if the subject has a code for the current year
-        if anno_code != "":
-            continue
+        if subject_folder_code != subject_id:
+            # Merge the contents if the destination folder already exists
+            kind = "merge" if subject_id in existing_folders else "rename"
+            plan.add(Operation(kind, os.path.join(SUBJECT_FOLDER, subject_id),
+                               os.path.join(SUBJECT_FOLDER, subject_folder_code), subject_id, subject_folder_code))
 
-        missing_count += 1
+    return plan
 
-        # Create empty folder for the subject if it doesn't exist
-        subject_folder = os.path.join(SUBJECT_FOLDER, id_code)
-        if not os.path.exists(subject_folder):
-            os.makedirs(subject_folder)
-            print(f"Created missing subject folder: {id_code}")
 
-        # Create white images for each task
-        for task in new_task_list:
-            img_white = create_white_image()
-            task_file_path = os.path.join(TASKS_FOLDER, task, f"{id_code}_{task}.png")
-            cv2.imwrite(task_file_path, img_white)
+def reuse_outputs(duplicates, manifests, link_mode="copy", use_hash=False):
+    """
+    Write the outputs of the sources identical to another source from the output of that source,
+    transforming them only if that output could not be written
 
-    print(f"Total missing subjects for {ANNO}: {missing_count}")
+    Args:
+        duplicates (list): (operation, original operation) pairs from find_duplicate_sources
+        manifests (dict): The manifest of every year, the records of the outputs written are appended
+        link_mode (str): How the outputs are reproduced ("copy", "hardlink" or "reflink")
+        use_hash (bool): Whether to store the source content hashes in the records
+    """
+    records = {}
+    for operation, original in duplicates:
+        record = make_record(operation.output_key, operation.source_path, operation.params, use_hash)
+        if is_record_current(manifests[original.year].get(original.output_key), original.destination_path,
+                             original.source_path, original.params):
+            try:
+                with RUN_METRICS.time("write"):
+                    used_mode = materialize_file(original.destination_path, operation.destination_path, link_mode)
+                if used_mode == "copy":
+                    RUN_METRICS.count("bytes_written", os.path.getsize(operation.destination_path))
+                records.setdefault(operation.year, []).append(record)
+                continue
+            except OSError as e:
+                print(f"Error reusing {original.destination_path} for {operation.destination_path}: {e}")
+        # The original output is missing, the duplicate is transformed on its own
+        if transform_source(operation.source_path, [(operation.destination_path,
+                                                     get_output_spec(operation.params))]):
+            records.setdefault(operation.year, []).append(record)
+    for year, year_records in records.items():
+        manifests[year].append(year_records)
+
+
+def estimate_image_memory(operations):
+    """
+    Estimate the memory used to transform a source image into all its outputs: the decoded
+    acquired frame, and for every output size its resized frame and encoded bytes (at most a frame)
+
+    Args:
+        operations (list): The transform operations
+
+    Returns:
+        int: The estimate in bytes
+    """
+    output_sizes = {tuple(operation.params["size"]) for operation in operations}
+    return WIDTH_ACQUIRED * HEIGHT_ACQUIRED * 3 + sum(2 * width * height * 3 for width, height in output_sizes)
 
-    # Clear missing tasks file before writing new content
-    if os.path.exists(MISSING_TASKS_FILE):
-        open(MISSING_TASKS_FILE, 'w').close()
 
-    # Process existing subjects
+def execute_plans(plans, manifests, workers=1, placeholder_mode="copy", pipeline=None, dedup=True,
+                  memory_budget=None):
+    """
+    Run the operations of the plans of one or more years batched by kind: the folders, the
+    placeholders on a thread pool, the transforms of all the years on one pool of worker processes
+    or one staged pipeline, then the renames and merges of every year
+
+    Args:
+        plans (list): The plans to run, one per year, made with the same codec and hash option
+        manifests (dict): The manifest of every year, records are appended as the outputs are written
+        workers (int): Number of worker processes used for the transforms, 1 runs them in the current process
+        placeholder_mode (str): How placeholder images and the outputs of duplicate sources are
+            materialized ("copy", "hardlink" or "reflink")
+        pipeline (PipelineConfig): If given, the transforms are streamed through the staged pipeline
+            with this concurrency instead of the worker processes
+        dedup (bool): Transform identical source images once and reuse the output for the others
+        memory_budget (int): Bound the memory of the images in flight to this many bytes: the worker
+            processes or the pipeline threads and queue are reduced to fit, and the sources are read
+            and the outputs resized into reused buffers: one set per worker process, or one per image
+            in flight in the pipeline
+
+    Returns:
+        set: The (year, native code) of the subjects that failed, their folders are not renamed
+    """
+    # OpenCV and numpy are only loaded by the runs that execute a plan
+    from image_io import get_placeholder_bytes
+    from pipeline import fit_to_memory_budget
+
+    if len({(plan.codec, plan.use_hash) for plan in plans}) > 1:
+        raise ValueError("The plans of a run must use the same codec and hash option")
+    use_hash = plans[0].use_hash
+
+    for plan in plans:
+        for operation in plan.get_operations("mkdir"):
+            os.makedirs(operation.destination_path, exist_ok=True)
+            if operation.subject_id is not None:
+                print(f"Created missing subject folder: {operation.subject_id} ({plan.year})")
+
+    placeholders = [operation for plan in plans for operation in plan.get_operations("placeholder")]
+    if placeholder_mode != "copy":
+        # Rewrite the canonical file of every output folder, links from previous runs keep the old content
+        canonical_files = {}
+        for operation in placeholders:
+            spec = get_output_spec(operation.params)
+            tasks_folder = os.path.dirname(os.path.dirname(operation.destination_path))
+            canonical_files[get_placeholder_path(spec.codec, tasks_folder)] = spec
+        for canonical_path, spec in canonical_files.items():
+            write_file_atomic(canonical_path, get_placeholder_bytes(spec.width, spec.height, spec.codec))
+
+    print("Writing placeholder images...")
+    records, failed_subjects = write_placeholders(placeholders, placeholder_mode)
+    for year, year_records in records.items():
+        manifests[year].append(year_records)
+
+    # Identical sources, e.g. from merged folders or re-acquired sessions, are transformed once
+    transforms = [operation for plan in plans for operation in plan.get_operations("transform")]
+    duplicates = []
+    if dedup:
+        with RUN_METRICS.time("hash"):
+            transforms, duplicates = find_duplicate_sources(transforms)
+        RUN_METRICS.count("duplicates", len(duplicates))
+        if duplicates:
+            print(f"Found {len(duplicates)} source images identical to another one, their outputs are reused")
+
+    # The transforms of a subject run together, so its records are appended once it is complete
+    transforms_by_subject = {}
+    for operation in transforms:
+        transforms_by_subject.setdefault((operation.year, operation.native_code), []).append(operation)
+
+    reuse_buffers = memory_budget is not None
+    if reuse_buffers and transforms:
+        image_bytes = estimate_image_memory(transforms)
+        if pipeline is not None:
+            pipeline = fit_to_memory_budget(pipeline, image_bytes, memory_budget)
+            print(f"Memory budget: {pipeline.transform_workers} transform threads, {pipeline.write_workers} "
+                  f"writer threads, {pipeline.queue_size} queued images of {image_bytes / 2 ** 20:.1f} MiB")
+        else:
+            workers = max(1, min(workers, memory_budget // image_bytes))
+            print(f"Memory budget: {workers} workers, {image_bytes / 2 ** 20:.1f} MiB per image")
+        if image_bytes > memory_budget:
+            print(f"Warning: one image needs more than the memory budget of {memory_budget / 2 ** 20:.1f} MiB")
+
+    # The progress bar is only loaded by the runs that process images
+    from alive_progress import alive_bar
+
     print("\nProcessing existing subjects...")
-    with alive_bar(len(subject_directories), title='Processed Subjects') as bar:
-        for subject_folder_code in subject_directories:
+    # The bar writes to the current stdout, not to the one at the time alive_progress was first imported
+    with alive_bar(len(transforms_by_subject), title='Processed Subjects', file=sys.stdout) as bar:
+        if pipeline is not None:
+            # Overlap reading, decoding/resizing and encoding/writing of all the images
+            transform_images_pipeline(transforms_by_subject, manifests, bar, pipeline, use_hash, reuse_buffers)
+        elif workers > 1:
+            # Spread the subjects of all the years over a process pool, results are collected as they finish
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(WORKDIR, ANNO)) as executor:
+                futures = {executor.submit(transform_images_in_worker, operations, use_hash, reuse_buffers): subject
+                           for subject, operations in transforms_by_subject.items()}
+                for future in as_completed(futures):
+                    year, subject_folder_code = futures[future]
+                    try:
+                        records, worker_metrics = future.result()
+                        manifests[year].append(records)
+                        RUN_METRICS.merge(worker_metrics)
+                    except Exception as e:
+                        print(f"Error processing subject {subject_folder_code} ({year}): {e}")
+                        RUN_METRICS.count("errors")
+                        failed_subjects.add((year, subject_folder_code))
+                    bar()
+        else:
+            for (year, subject_folder_code), operations in transforms_by_subject.items():
+                try:
+                    manifests[year].append(transform_images(operations, use_hash, reuse_buffers))
+                except Exception as e:
+                    print(f"Error processing subject {subject_folder_code} ({year}): {e}")
+                    RUN_METRICS.count("errors")
+                    failed_subjects.add((year, subject_folder_code))
+                bar()
+
+    reuse_outputs(duplicates, manifests, placeholder_mode, use_hash)
+
+    for plan in plans:
+        subjects = {(plan.year, subject_folder_code) for subject_folder_code in plan.missing_tasks}
+        RUN_METRICS.count("subjects_processed", len(subjects - failed_subjects))
+
+        write_missing_task_report(plan, failed_subjects)
+
+        # Rename the subject folders to use the ID code, once all the images have been written
+        merge_reports = []
+        for operation in plan.operations:
+            if operation.kind not in ("rename", "merge") or (plan.year, operation.native_code) in failed_subjects:
+                continue
             try:
-                # Get paths
-                subject_path = os.path.join(SUBJECT_FOLDER, subject_folder_code)
-                subject_images_path = os.path.join(subject_path, "Images")
+                with RUN_METRICS.time("rename"):
+                    report = rename_subject_folder(operation.native_code, operation.subject_id, plan.subject_folder)
+            except Exception as e:
+                print(f"Error renaming subject {operation.native_code} ({plan.year}): {e}")
+                RUN_METRICS.count("errors")
+                continue
+            if report is not None:
+                merge_reports.append((operation.subject_id, report))
+                RUN_METRICS.count("merge_conflicts", len(report.conflicts))
+                RUN_METRICS.count("errors", len(report.errors))
 
-                # Get subject's ID from codici_df
-                subject_row = codici_df.loc[codici_df[ANNO] == subject_folder_code]
+        if merge_reports:
+            write_merge_report(merge_reports, plan.merge_report_file, plan.partial)
+            incomplete = sum(1 for _, report in merge_reports if not report.complete)
+            print(f"Merged {len(merge_reports)} subject folders of {plan.year}, {incomplete} with entries left "
+                  f"in the native folder (see {plan.merge_report_file})")
 
-                # Skip if subject not found in codici_df
-                if subject_row.empty:
-                    print(f"Warning: Subject {subject_folder_code} not found in codici.csv")
-                    bar()
-                    continue
-
-                subject_id = subject_row['Id'].values[0]
-
-                # List of original tasks (unnumbered)
-                original_task_list = [f"Task{i}" for i in range(1, 23)] + ["Task26"]
-
-                # Get images in the subject's Images folder
-                subject_images_list = get_images_in_folder(subject_images_path)
-
-                # Create mapping from original task name to file path
-                original_task_to_path = {}
-                for image_path in subject_images_list:
-                    base_name = os.path.splitext(os.path.basename(image_path))[0]
-                    normalized, original_number = normalize_task_name(base_name)
-                    if normalized:
-                        original_task_to_path[normalized] = image_path
-
-                # Find missing tasks
-                missing_tasks = [task for task in original_task_list if task not in original_task_to_path]
-
-                # Process each task with the new numbering scheme
-                for original_number in range(1, 27):  # Include special case Task26
-                    # Skip tasks that should be excluded
-                    if original_number not in TASK_RENUMBERING_MAP or TASK_RENUMBERING_MAP[original_number] is None:
-                        continue
-
-                    # Get new task number
-                    new_task_number = TASK_RENUMBERING_MAP[original_number]
-                    original_task_name = f"Task{original_number}"
-                    new_task_name = f"Task{new_task_number}"
-
-                    # Create paths for the new task
-                    new_task_folder = os.path.join(TASKS_FOLDER, new_task_name)
-                    new_task_filename = f"{subject_id}_{new_task_name}.png"
-                    new_task_filepath = os.path.join(new_task_folder, new_task_filename)
-
-                    # Check if the original task exists or is missing
-                    if original_task_name in original_task_to_path:
-                        # Task exists - copy, crop, and resize the image
-                        original_image_path = original_task_to_path[original_task_name]
-                        crop_and_resize_image(original_image_path, new_task_filepath)
-                    else:
-                        # Task is missing - create a white image
-                        # print(f"Missing task for {subject_id}: {original_task_name} -> {new_task_name}")
-                        img_white = create_white_image()
-                        cv2.imwrite(new_task_filepath, img_white)
-
-                # Log missing tasks
-                if missing_tasks:
-                    with open(MISSING_TASKS_FILE, "a") as f:
-                        f.write(f"{subject_folder_code}:\n")
-                        f.write(f"{missing_tasks}\n")
-
-                # Rename the subject folder to use the ID code
-                if subject_folder_code != subject_id:
-                    new_subject_path = os.path.join(SUBJECT_FOLDER, subject_id)
-
-                    # If the destination already exists, merge the contents
-                    if os.path.exists(new_subject_path):
-                        print(f"Warning: Destination folder {subject_id} already exists. Merging contents.")
-                        # Copy contents instead of renaming
-                        for item in os.listdir(subject_path):
-                            src_item = os.path.join(subject_path, item)
-                            dst_item = os.path.join(new_subject_path, item)
-
-                            if os.path.isdir(src_item):
-                                if not os.path.exists(dst_item):
-                                    os.makedirs(dst_item)
-                                for file in os.listdir(src_item):
-                                    src_file = os.path.join(src_item, file)
-                                    dst_file = os.path.join(dst_item, file)
-                                    if not os.path.exists(dst_file):
-                                        os.rename(src_file, dst_file)
-                            elif not os.path.exists(dst_item):
-                                os.rename(src_item, dst_item)
-                    else:
-                        # Simple rename if destination doesn't exist
-                        os.rename(subject_path, new_subject_path)
+    return failed_subjects
 
-            except Exception as e:
-                print(f"Error processing subject {subject_folder_code}: {e}")
 
-            bar()
+def write_run_report(plans, report_file=None, metrics_textfile=None, **info):
+    """
+    Write the stage timings and counters of the run, to find its bottleneck, and print a summary
+
+    Args:
+        plans (list): The plans executed by the run
+        report_file (str): The JSON run report to write, defaults to RUN_REPORT_FILE
+        metrics_textfile (str): The Prometheus textfile to write, defaults to METRICS_TEXTFILE
+        **info: The options of the run, added to the report
+    """
+    report = RUN_METRICS.get_report(years=[plan.year for plan in plans], codec=plans[0].codec,
+                                    operations={plan.year: plan.count() for plan in plans}, **info)
+    write_json_report(report, report_file or RUN_REPORT_FILE)
+    write_prometheus_textfile(report, metrics_textfile or METRICS_TEXTFILE)
+    counters = report["counters"]
+    print(f"Processed {counters['images_processed']} images and {counters['placeholders_written']} placeholders "
+          f"in {report['duration_seconds']:.1f}s, {counters['errors']} errors")
+    # Peak memory, to size the workers to the node
+    peak_rss = report["peak_rss_bytes"]
+    if peak_rss["main"] is not None:
+        print(f"Peak memory: {peak_rss['main'] / 2 ** 20:.0f} MiB, "
+              f"largest worker {peak_rss['workers'] / 2 ** 20:.0f} MiB")
+
+
+def merge_shards(count, years=None, report_file=None, metrics_textfile=None):
+    """
+    Combine the files written by the shards of a run into the shared ones once every shard is done:
+    the manifest journals, the missing-task and merge reports of every year and the run reports.
+    The files of the shards are removed once merged.
+
+    Args:
+        count (int): The number of shards the run was split in
+        years (list): The years processed by the shards, defaults to ANNO
+        report_file (str): The JSON run report to write, defaults to RUN_REPORT_FILE
+        metrics_textfile (str): The Prometheus textfile to write, defaults to METRICS_TEXTFILE
+
+    Returns:
+        int: 0 if the files of every shard were found, 1 otherwise
+    """
+    shards = get_shards(count)
+    status = 0
+
+    configured_year = ANNO
+    try:
+        for year in years or [ANNO]:
+            configure_paths(WORKDIR, year)
+            shard_manifests = [shard.get_path(MANIFEST_FILE) for shard in shards]
+            missing = [str(shard) for shard, path in zip(shards, shard_manifests) if not os.path.exists(path)]
+            if missing:
+                print(f"Warning: no manifest of shards {', '.join(missing)} for {year}")
+                status = 1
+
+            # The records of the shards are newer than the shared ones
+            manifest = Manifest(MANIFEST_FILE).load()
+            for path in shard_manifests:
+                if os.path.exists(path):
+                    manifest.merge(Manifest(path).load())
+            manifest.compact()
+
+            # The subjects of the shards replace the ones of an earlier run, in folder order
+            shard_reports = [path for path in (shard.get_path(MISSING_TASKS_FILE) for shard in shards)
+                             if os.path.exists(path)]
+            if shard_reports:
+                report = MissingTaskReport(year)
+                if os.path.exists(MISSING_TASKS_FILE):
+                    report = MissingTaskReport.load(MISSING_TASKS_FILE, year)
+                for path in shard_reports:
+                    shard_report = MissingTaskReport.load(path, year)
+                    report.remove_subjects(subject["native_code"] for subject in shard_report.subjects)
+                    report.subjects += shard_report.subjects
+                report.subjects.sort(key=lambda subject: subject["native_code"])
+                report.save(MISSING_TASKS_FILE)
+
+            # The merge report lists the entries left by the merges of the last run, i.e. of every shard
+            shard_merge_reports = [path for path in (shard.get_path(MERGE_REPORT_FILE) for shard in shards)
+                                   if os.path.exists(path)]
+            if shard_merge_reports:
+                with open(MERGE_REPORT_FILE, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(["Id", "source", "path", "outcome", "detail"])
+                    for path in shard_merge_reports:
+                        with open(path, "r", newline="", encoding="utf-8") as shard_file:
+                            writer.writerows(list(csv.reader(shard_file))[1:])
+
+            for path in shard_manifests + shard_merge_reports:
+                if os.path.exists(path):
+                    os.remove(path)
+            for path in shard_reports:
+                for report_path in get_report_files(path):
+                    if os.path.exists(report_path):
+                        os.remove(report_path)
+    finally:
+        configure_paths(WORKDIR, configured_year)
+
+    report_file = report_file or RUN_REPORT_FILE
+    metrics_textfile = metrics_textfile or METRICS_TEXTFILE
+    shard_report_files = [path for path in (shard.get_path(report_file) for shard in shards) if os.path.exists(path)]
+    if shard_report_files:
+        reports = []
+        for path in shard_report_files:
+            with open(path, "r", encoding="utf-8") as f:
+                reports.append(json.load(f))
+        report = merge_run_reports(reports, shards=count)
+        write_json_report(report, report_file)
+        write_prometheus_textfile(report, metrics_textfile)
+        for path in shard_report_files + [shard.get_path(metrics_textfile) for shard in shards]:
+            if os.path.exists(path):
+                os.remove(path)
+        counters = report["counters"]
+        print(f"Merged {len(reports)} of {count} shards: {counters['images_processed']} images and "
+              f"{counters['placeholders_written']} placeholders in {report['duration_seconds']:.1f}s, "
+              f"{counters['errors']} errors")
+    if len(shard_report_files) < count:
+        print(f"Warning: {count - len(shard_report_files)} of {count} shards have no run report, "
+              f"they did not finish")
+        status = 1
+    return status
+
+
+def open_manifest(manifest_path, force=False, base_path=None):
+    """
+    Open the manifest of a year, loading the records of the previous runs unless forced
+
+    Args:
+        manifest_path (str): The path of the manifest journal
+        force (bool): Ignore the previous runs
+        base_path (str): A manifest whose records are read but never written, e.g. the shared
+            manifest extended by the journal of a shard
+
+    Returns:
+        Manifest: The manifest
+    """
+    manifest = Manifest(manifest_path, None if base_path is None else Manifest(base_path))
+    if not force:
+        manifest.load()
+        if manifest.base is not None:
+            manifest.base.load()
+    return manifest
+
+
+def main(workers=1, placeholder_mode="copy", force=False, use_hash=False, codec=DEFAULT_CODEC, pipeline=None,
+         report_file=None, metrics_textfile=None, plan_only=False, plan_output=None, plan_input=None, dedup=True,
+         years=None, outputs=None, memory_budget=None, shard=None):
+    """
+    Main function to process subjects and tasks
+
+    Args:
+        workers (int): Number of worker processes used for the existing subjects.
+            1 processes everything in the current process, 0 uses one worker per CPU core
+        placeholder_mode (str): How placeholder images are materialized ("copy", "hardlink" or "reflink")
+        force (bool): Reprocess every output instead of skipping the up to date ones
+        use_hash (bool): Whether to compare source content hashes to detect changes
+        codec (OutputCodec): The codec used to encode the output images
+        pipeline (PipelineConfig): If given, the existing subjects are streamed through the
+            staged pipeline with this concurrency instead of the worker processes
+        report_file (str): The JSON run report to write, defaults to RUN_REPORT_FILE
+        metrics_textfile (str): The Prometheus textfile to write, defaults to METRICS_TEXTFILE
+        plan_only (bool): Print the operations of the run without executing them
+        plan_output (str): Write the plan of the run as JSON to this file
+        plan_input (str): Execute the plan written to this file by a previous plan_output instead of planning again
+        dedup (bool): Transform identical source images once and reuse the output for the others
+        years (list): The years to process in this run, e.g. ['Anno_1', 'Anno_2', 'Anno_3'], defaults to ANNO
+        outputs (list): The OutputSpec of the derived outputs (previews, model inputs), produced
+            from the same decode and crop as the main output
+        memory_budget (int): Bound the memory of the images in flight to this many bytes, with
+            fewer workers if needed and buffers reused by every worker
+        shard (Shard): Process only the subjects of this shard, so that several machines sharing the
+            data folder split the run. Every shard writes its own manifest journal and reports,
+            combined by merge_shards once all of them are done
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    # Time the stages of this run only
+    RUN_METRICS.reset()
+
+    if plan_input is not None:
+        plans = load_plans(plan_input)
+        # A saved shard plan is executed as that shard
+        if plans[0].shard is not None:
+            shard = parse_shard(plans[0].shard)
+        manifests = {plan.year: open_manifest(plan.manifest_file, force,
+                                              shard.get_shared_path(plan.manifest_file) if plan.shard else None)
+                     for plan in plans}
+    else:
+        # Read CSV files once for all the years
+        with RUN_METRICS.time("csv_load"):
+            code_index = read_code_index()
+
+        # Plan every year with its own folders, manifest and renumbering, then restore the configured year
+        configured_year = ANNO
+        plans = []
+        manifests = {}
+        try:
+            for year in years or [ANNO]:
+                configure_paths(WORKDIR, year)
+                # Load the records of the previous runs, an interrupted run resumes from them.
+                # A shard writes its own journal on top of the shared manifest
+                if shard is None:
+                    manifests[year] = open_manifest(MANIFEST_FILE, force)
+                else:
+                    manifests[year] = open_manifest(shard.get_path(MANIFEST_FILE), force, MANIFEST_FILE)
+                plans.append(build_plan(code_index, manifests[year], use_hash, codec, outputs=outputs, shard=shard))
+        finally:
+            configure_paths(WORKDIR, configured_year)
+
+    if plan_output is not None:
+        save_plans(plans, plan_output)
+    if plan_only:
+        for plan in plans:
+            print(plan.format())
+        return 0
+
+    execute_plans(plans, manifests, workers, placeholder_mode, pipeline, dedup, memory_budget)
+
+    # Keep only the latest record of each output
+    for manifest in manifests.values():
+        manifest.compact()
+
+    # Every shard writes its own reports, combined by merge_shards
+    if shard is not None:
+        report_file = report_file or shard.get_path(RUN_REPORT_FILE)
+        metrics_textfile = metrics_textfile or shard.get_path(METRICS_TEXTFILE)
+    write_run_report(plans, report_file, metrics_textfile, workers=workers, pipeline=pipeline is not None,
+                     placeholder_mode=placeholder_mode, force=force, dedup=dedup,
+                     outputs=[spec.name for spec in outputs or []], memory_budget=memory_budget,
+                     shard=None if shard is None else str(shard))
 
     print("\nProcessing complete!")
     return 0
 
 
+def watch(workers=1, placeholder_mode="copy", use_hash=False, codec=DEFAULT_CODEC, pipeline=None, report_file=None,
+          metrics_textfile=None, dedup=True, poll_seconds=WATCH_POLL_SECONDS, settle_seconds=WATCH_SETTLE_SECONDS,
+          max_polls=None, outputs=None, memory_budget=None):
+    """
+    Process the subject folders of the configured year as they arrive, until interrupted with Ctrl+C.
+    A full run catches up first, then the subjects folder is polled and only the new or changed
+    subject folders are processed, once their content stopped changing. codici.csv is read again
+    when it changes, followed by a full run for the subjects it added.
+
+    Args:
+        workers (int): Number of worker processes used for the subject images, 0 uses one per CPU core
+        placeholder_mode (str): How placeholder images are materialized ("copy", "hardlink" or "reflink")
+        use_hash (bool): Whether to compare source content hashes to detect changes
+        codec (OutputCodec): The codec used to encode the output images
+        pipeline (PipelineConfig): If given, the images are streamed through the staged pipeline
+        report_file (str): The JSON report of the last processing, defaults to RUN_REPORT_FILE
+        metrics_textfile (str): The Prometheus textfile of the last processing, defaults to METRICS_TEXTFILE
+        dedup (bool): Transform identical source images once and reuse the output for the others
+        poll_seconds (float): Seconds between two polls of the subjects folder
+        settle_seconds (float): Seconds a subject folder must stay unchanged before it is processed
+        max_polls (int): Stop after this many polls, defaults to polling until interrupted
+        outputs (list): The OutputSpec of the derived outputs produced next to the main one
+        memory_budget (int): Bound the memory of the images in flight to this many bytes
+
+    Returns:
+        int: 0
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    # The processed folders are named after the subject Id
+    watcher = FolderWatcher(SUBJECT_FOLDER, settle_seconds, ignore=lambda name: name.startswith("CRC"))
+    manifest = open_manifest(MANIFEST_FILE)
+    code_index = None
+    codici_mtime_ns = None
+    polls = 0
+    print(f"Watching {SUBJECT_FOLDER} every {poll_seconds}s, press Ctrl+C to stop")
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            codici_changed = os.stat(CODICI_FILE).st_mtime_ns != codici_mtime_ns
+            # Every subject after a change of codici.csv, the folders that arrived otherwise
+            subject_codes = None if codici_changed else watcher.poll()
+
+            if subject_codes is None or subject_codes:
+                RUN_METRICS.reset()
+                if codici_changed:
+                    codici_mtime_ns = os.stat(CODICI_FILE).st_mtime_ns
+                    with RUN_METRICS.time("csv_load"):
+                        code_index = read_code_index()
+                else:
+                    print(f"New or changed subject folders: {', '.join(subject_codes)}")
+
+                if subject_codes is None:
+                    # Record the folders before they are listed, the ones that arrive or change
+                    # during the run are then still new or changed at the next poll
+                    watcher.poll()
+                plan = build_plan(code_index, manifest, use_hash, codec, subject_codes, outputs)
+                execute_plans([plan], {ANNO: manifest}, workers, placeholder_mode, pipeline, dedup, memory_budget)
+                write_run_report([plan], report_file, metrics_textfile, workers=workers,
+                                 pipeline=pipeline is not None, placeholder_mode=placeholder_mode, dedup=dedup,
+                                 watch=True, subjects=subject_codes, memory_budget=memory_budget)
+
+                # The folders left behind (failed or unknown) are processed again only if they change
+                if subject_codes is None:
+                    subject_codes = [name for name in watcher.watched
+                                     if name in plan.missing_tasks or code_index.get_id(ANNO, name) is None]
+                watcher.mark_processed(subject_codes)
+
+            if max_polls is None or polls < max_polls:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        # Keep only the latest record of each output
+        manifest.compact()
+    return 0
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # The command line is defined once, in cli.py
+    import cli
+
+    sys.exit(cli.run())
\ No newline at end of file
@@ -0,0 +1,168 @@
+import os
+import json
+import hashlib
+
+# Version of the manifest records, bump it to invalidate every record
+MANIFEST_VERSION = 1
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 of a file
+
+    Args:
+        file_path (str): The path of the file
+        chunk_size (int): The number of bytes read at a time
+
+    Returns:
+        str: The hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_record(output_key, source_path, params, use_hash=False):
+    """
+    Describe the inputs of an output file, to be stored in the manifest
+
+    Args:
+        output_key (str): The key of the output file (its path relative to the tasks folder)
+        source_path (str): The path of the source image, or None for placeholders
+        params (dict): The transform parameters used to produce the output
+        use_hash (bool): Whether to store the content hash of the source
+
+    Returns:
+        dict: The manifest record
+    """
+    record = {"version": MANIFEST_VERSION, "output": output_key, "source": source_path, "params": params}
+    if source_path is not None:
+        stat = os.stat(source_path)
+        record["size"] = stat.st_size
+        record["mtime_ns"] = stat.st_mtime_ns
+        if use_hash:
+            record["sha256"] = hash_file(source_path)
+    return record
+
+
+def is_record_current(record, output_path, source_path, params, use_hash=False):
+    """
+    Check if an output described by a manifest record is still up to date
+
+    Args:
+        record (dict): The manifest record of the output, or None if there is none
+        output_path (str): The path of the output file
+        source_path (str): The path of the source image, or None for placeholders
+        params (dict): The transform parameters that would be used now
+        use_hash (bool): Whether to compare content hashes when size or mtime changed
+
+    Returns:
+        bool: True if the output exists and was produced from the same source and parameters
+    """
+    if record is None or record.get("version") != MANIFEST_VERSION:
+        return False
+    if record.get("source") != source_path or record.get("params") != params:
+        return False
+    if not os.path.exists(output_path):
+        return False
+    if source_path is None:
+        return True
+
+    try:
+        stat = os.stat(source_path)
+    except OSError:
+        return False
+
+    if stat.st_size == record.get("size") and stat.st_mtime_ns == record.get("mtime_ns"):
+        return True
+
+    # The file was touched or copied, compare the content if the hash is known
+    if use_hash and "sha256" in record and stat.st_size == record.get("size"):
+        return hash_file(source_path) == record["sha256"]
+
+    return False
+
+
+class Manifest:
+    """
+    Records of the produced outputs, persisted as an append-only JSON lines journal
+    so that an interrupted run keeps every record written before the crash
+    """
+
+    def __init__(self, manifest_path, base=None):
+        self.manifest_path = manifest_path
+        self.records = {}
+        # Manifest read for the outputs this journal has no record of, never written,
+        # e.g. the shared manifest extended by the journal of a shard
+        self.base = base
+        # True when the journal ends with a line cut short by a crash
+        self._needs_newline = False
+
+    def load(self):
+        """
+        Load the records from the journal, later records replace earlier ones
+
+        Returns:
+            Manifest: The manifest itself
+        """
+        self.records = {}
+        if not os.path.exists(self.manifest_path):
+            return self
+
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._needs_newline = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of a journal interrupted while writing
+                    continue
+                self.records[record["output"]] = record
+        return self
+
+    def get(self, output_key):
+        """ Get the record of an output, or None if there is none"""
+        record = self.records.get(output_key)
+        if record is None and self.base is not None:
+            return self.base.get(output_key)
+        return record
+
+    def append(self, records):
+        """
+        Add records and append them to the journal on disk
+
+        Args:
+            records (list): The records to add
+        """
+        if not records:
+            return
+
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            if self._needs_newline:
+                f.write("\n")
+                self._needs_newline = False
+            for record in records:
+                self.records[record["output"]] = record
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def merge(self, other):
+        """
+        Add the records of another journal, e.g. the one of a shard, replacing the records of the same outputs
+
+        Args:
+            other (Manifest): The loaded manifest to merge
+        """
+        self.records.update(other.records)
+
+    def compact(self):
+        """ Rewrite the journal with only the latest record of each output"""
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            for output_key in sorted(self.records):
+                f.write(json.dumps(self.records[output_key]) + "\n")
+        os.replace(temporary_path, self.manifest_path)
+        self._needs_newline = False
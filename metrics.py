@@ -0,0 +1,231 @@
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from file_io import write_file_atomic
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Prefix of the exported Prometheus metrics
+METRICS_PREFIX = "crc_organizer"
+
+# Stages timed during a run
+STAGES = ("csv_load", "listing", "hash", "read", "decode", "crop", "resize", "encode", "write", "placeholder",
+          "rename")
+
+# Counters of a run
+COUNTERS = ("subjects_processed", "images_processed", "placeholders_written", "bytes_read", "bytes_written",
+            "duplicates", "merge_conflicts", "errors")
+
+
+class RunMetrics:
+    """
+    Stage timings and counters of a run, safe to update from several threads.
+    Stage times are summed over the threads and processes that ran the stage,
+    so with concurrency they can exceed the wall time of the run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.reset()
+
+    def reset(self):
+        """ Clear every timing and counter"""
+        with self.lock:
+            self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+            self.stage_calls = dict.fromkeys(STAGES, 0)
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.started = time.time()
+
+    def add_time(self, stage, seconds, calls=1):
+        """ Add the duration of a stage"""
+        with self.lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + calls
+
+    @contextmanager
+    def time(self, stage):
+        """ Time the body of a with statement as a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def count(self, counter, value=1):
+        """ Increment a counter"""
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def snapshot(self):
+        """
+        Get a copy of the timings and counters, e.g. to send them from a worker process
+
+        Returns:
+            dict: {"stage_seconds": ..., "stage_calls": ..., "counters": ...}
+        """
+        with self.lock:
+            return {"stage_seconds": dict(self.stage_seconds), "stage_calls": dict(self.stage_calls),
+                    "counters": dict(self.counters)}
+
+    def merge(self, snapshot):
+        """ Add the timings and counters of a snapshot, e.g. the ones of a worker process"""
+        for stage, seconds in snapshot["stage_seconds"].items():
+            self.add_time(stage, seconds, snapshot["stage_calls"].get(stage, 0))
+        for counter, value in snapshot["counters"].items():
+            self.count(counter, value)
+
+    def get_report(self, **info):
+        """
+        Build the run report
+
+        Args:
+            **info: Run information added to the report, e.g. the year and the options
+
+        Returns:
+            dict: The report
+        """
+        snapshot = self.snapshot()
+        finished = time.time()
+        return {
+            "started": self.started,
+            "finished": finished,
+            "duration_seconds": finished - self.started,
+            "info": info,
+            "stages": {stage: {"seconds": seconds, "calls": snapshot["stage_calls"][stage]}
+                       for stage, seconds in snapshot["stage_seconds"].items()},
+            "counters": snapshot["counters"],
+            "peak_rss_bytes": get_peak_rss(),
+        }
+
+
+def get_peak_rss():
+    """
+    Get the peak resident memory of this process and of the largest of its finished child processes,
+    e.g. the workers of a process pool once it is shut down
+
+    Returns:
+        dict: {"main": bytes, "workers": bytes}, None where the platform does not report it
+    """
+    if resource is None:
+        return {"main": None, "workers": None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {"main": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            "workers": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+
+
+def merge_run_reports(reports, **info):
+    """
+    Combine the reports of runs that split the same work, e.g. the shards of a run on several machines.
+    Stage times and counters are summed, the duration spans the earliest start to the latest finish
+    and the peak memory is the largest of the runs.
+
+    Args:
+        reports (list): The reports from RunMetrics.get_report
+        **info: Run information added to the report, next to the information of every run
+
+    Returns:
+        dict: The combined report
+    """
+    stages = {}
+    counters = {}
+    peak_rss = {}
+    for report in reports:
+        for stage, stage_report in report["stages"].items():
+            merged = stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            merged["seconds"] += stage_report["seconds"]
+            merged["calls"] += stage_report["calls"]
+        for counter, value in report["counters"].items():
+            counters[counter] = counters.get(counter, 0) + value
+        for process, value in report.get("peak_rss_bytes", {}).items():
+            if value is None:
+                peak_rss.setdefault(process, None)
+            else:
+                peak_rss[process] = max(value, peak_rss.get(process) or 0)
+
+    started = min(report["started"] for report in reports)
+    finished = max(report["finished"] for report in reports)
+    return {
+        "started": started,
+        "finished": finished,
+        "duration_seconds": finished - started,
+        "info": dict(info, runs=[report["info"] for report in reports]),
+        "stages": stages,
+        "counters": counters,
+        "peak_rss_bytes": peak_rss,
+    }
+
+
+def write_json_report(report, report_path):
+    """
+    Write the run report as JSON
+
+    Args:
+        report (dict): The report from RunMetrics.get_report
+        report_path (str): The path of the JSON file
+    """
+    write_file_atomic(report_path, json.dumps(report, indent=2).encode("utf-8"))
+
+
+def format_prometheus(report, prefix=METRICS_PREFIX):
+    """
+    Format the run report in the Prometheus text exposition format
+
+    Args:
+        report (dict): The report from RunMetrics.get_report
+        prefix (str): The prefix of the metric names
+
+    Returns:
+        str: The metrics, one sample per line
+    """
+    lines = [
+        f"# HELP {prefix}_stage_seconds Time spent in each stage of the last run, summed over the workers",
+        f"# TYPE {prefix}_stage_seconds gauge",
+    ]
+    lines += [f'{prefix}_stage_seconds{{stage="{stage}"}} {stage_report["seconds"]:.6f}'
+              for stage, stage_report in report["stages"].items()]
+    lines += [
+        f"# HELP {prefix}_stage_calls Number of times each stage ran in the last run",
+        f"# TYPE {prefix}_stage_calls gauge",
+    ]
+    lines += [f'{prefix}_stage_calls{{stage="{stage}"}} {stage_report["calls"]}'
+              for stage, stage_report in report["stages"].items()]
+    for counter, value in report["counters"].items():
+        lines += [f"# TYPE {prefix}_{counter} gauge", f"{prefix}_{counter} {value}"]
+    peak_rss = [(process, value) for process, value in report.get("peak_rss_bytes", {}).items() if value is not None]
+    if peak_rss:
+        lines += [
+            f"# HELP {prefix}_peak_rss_bytes Peak resident memory of the main process and of the largest worker",
+            f"# TYPE {prefix}_peak_rss_bytes gauge",
+        ]
+        lines += [f'{prefix}_peak_rss_bytes{{process="{process}"}} {value}' for process, value in peak_rss]
+    lines += [
+        f"# TYPE {prefix}_duration_seconds gauge",
+        f"{prefix}_duration_seconds {report['duration_seconds']:.6f}",
+        f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+        f"{prefix}_last_run_timestamp_seconds {report['finished']:.0f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(report, textfile_path, prefix=METRICS_PREFIX):
+    """
+    Write the run report as a Prometheus textfile, replaced atomically so that
+    the node exporter textfile collector never reads it half written
+
+    Args:
+        report (dict): The report from RunMetrics.get_report
+        textfile_path (str): The path of the .prom file
+        prefix (str): The prefix of the metric names
+    """
+    write_file_atomic(textfile_path, format_prometheus(report, prefix).encode("utf-8"))
+
+
+# Metrics of the current process, the worker processes send snapshots of theirs to the main process
+RUN_METRICS = RunMetrics()
@@ -0,0 +1,191 @@
+import io
+import os
+import csv
+import json
+from dataclasses import dataclass, field
+from file_io import write_file_atomic
+from inventory import ORIGINAL_TASK_NUMBERS, get_task_renumbering_map, normalize_task_name
+
+# Formats of the missing-task report, selected by the extension of its path
+MISSING_REPORT_FORMATS = ("json", "csv")
+
+# Columns of the csv files of the report
+MISSING_COLUMNS = ["native_code", "Id", "original_task", "task"]
+SUBJECT_COLUMNS = ["native_code", "Id", "tasks_expected", "tasks_present", "tasks_missing", "renumbered_missing",
+                   "completeness"]
+TASK_COLUMNS = ["original_task", "task", "subjects", "missing", "completeness"]
+
+
+def get_report_format(report_path):
+    """ Get the format of a report from the extension of its path, JSON unless it ends with .csv"""
+    return "csv" if report_path.lower().endswith(".csv") else "json"
+
+
+def get_aggregate_paths(report_path):
+    """
+    Get the paths of the per-subject and per-task aggregates of a csv report, written next to it
+
+    Returns:
+        tuple: (subjects csv path, tasks csv path)
+    """
+    root = os.path.splitext(report_path)[0]
+    return root + "_subjects.csv", root + "_tasks.csv"
+
+
+def get_report_files(report_path):
+    """ Get the files a report is written to, the report itself and the aggregates of a csv report"""
+    if get_report_format(report_path) == "json":
+        return [report_path]
+    return [report_path, *get_aggregate_paths(report_path)]
+
+
+def _format_csv(columns, rows):
+    """ Format dict rows as csv text with a header"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, columns, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _read_csv(csv_path):
+    """ Read the dict rows of a csv file"""
+    with open(csv_path, "r", newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+@dataclass
+class MissingTaskReport:
+    """ Tasks missing from the Images folder of the existing subjects of a year, with their completeness"""
+    year: str
+    # One dict per subject in folder order: native code, Id and the missing original task numbers
+    subjects: list = field(default_factory=list)
+
+    def add_subject(self, native_code, subject_id, missing_tasks):
+        """
+        Record the missing tasks of a subject
+
+        Args:
+            native_code (str): The native code (folder name) of the subject
+            subject_id (str): The subject's ID from codici.csv
+            missing_tasks (list): The original task names ('TaskN') or numbers missing from the subject
+        """
+        numbers = sorted(task if isinstance(task, int) else normalize_task_name(task)[1] for task in missing_tasks)
+        self.subjects.append({"native_code": native_code, "Id": subject_id, "missing": numbers})
+
+    def remove_subjects(self, native_codes):
+        """ Forget the subjects with these native codes"""
+        native_codes = set(native_codes)
+        self.subjects = [subject for subject in self.subjects if subject["native_code"] not in native_codes]
+
+    def get_missing_rows(self):
+        """
+        List the missing tasks
+
+        Returns:
+            list: One dict per missing task of every subject: native code, Id, original task number
+                and renumbered task name, empty for the tasks left out of the renumbering
+        """
+        renumbering_map = get_task_renumbering_map(self.year)
+        rows = []
+        for subject in self.subjects:
+            for number in subject["missing"]:
+                new_number = renumbering_map.get(number)
+                rows.append({"native_code": subject["native_code"], "Id": subject["Id"], "original_task": number,
+                             "task": "" if new_number is None else f"Task{new_number}"})
+        return rows
+
+    def get_subject_rows(self):
+        """
+        Aggregate the missing tasks of every subject
+
+        Returns:
+            list: One dict per subject: native code, Id, tasks expected, present and missing, missing
+                tasks that are kept by the renumbering and the fraction of the tasks present
+        """
+        renumbering_map = get_task_renumbering_map(self.year)
+        expected = len(ORIGINAL_TASK_NUMBERS)
+        rows = []
+        for subject in self.subjects:
+            missing = len(subject["missing"])
+            rows.append({"native_code": subject["native_code"], "Id": subject["Id"], "tasks_expected": expected,
+                         "tasks_present": expected - missing, "tasks_missing": missing,
+                         "renumbered_missing": sum(1 for number in subject["missing"]
+                                                   if renumbering_map.get(number) is not None),
+                         "completeness": round((expected - missing) / expected, 4)})
+        return rows
+
+    def get_task_rows(self):
+        """
+        Aggregate the missing subjects of every task
+
+        Returns:
+            list: One dict per original task: its number, renumbered task name, number of subjects,
+                subjects missing it and the fraction of the subjects that have it
+        """
+        renumbering_map = get_task_renumbering_map(self.year)
+        missing_counts = dict.fromkeys(ORIGINAL_TASK_NUMBERS, 0)
+        for subject in self.subjects:
+            for number in subject["missing"]:
+                missing_counts[number] = missing_counts.get(number, 0) + 1
+        subjects = len(self.subjects)
+        rows = []
+        for number, missing in sorted(missing_counts.items()):
+            new_number = renumbering_map.get(number)
+            rows.append({"original_task": number, "task": "" if new_number is None else f"Task{new_number}",
+                         "subjects": subjects, "missing": missing,
+                         "completeness": round((subjects - missing) / subjects, 4) if subjects else 1.0})
+        return rows
+
+    def save(self, report_path):
+        """
+        Write the report in one go, as JSON or, for a .csv path, as a csv file of the missing tasks
+        with the per-subject and per-task aggregates in the files from get_aggregate_paths
+
+        Args:
+            report_path (str): The path of the report
+        """
+        missing_rows = self.get_missing_rows()
+        subject_rows = self.get_subject_rows()
+        task_rows = self.get_task_rows()
+        if get_report_format(report_path) == "json":
+            report = {"year": self.year, "subjects": len(subject_rows),
+                      "incomplete_subjects": sum(1 for row in subject_rows if row["tasks_missing"]),
+                      "missing_tasks": len(missing_rows), "missing": missing_rows,
+                      "subject_completeness": subject_rows, "task_completeness": task_rows}
+            write_file_atomic(report_path, json.dumps(report, indent=1).encode("utf-8"))
+            return
+
+        subjects_path, tasks_path = get_aggregate_paths(report_path)
+        write_file_atomic(report_path, _format_csv(MISSING_COLUMNS, missing_rows).encode("utf-8"))
+        write_file_atomic(subjects_path, _format_csv(SUBJECT_COLUMNS, subject_rows).encode("utf-8"))
+        write_file_atomic(tasks_path, _format_csv(TASK_COLUMNS, task_rows).encode("utf-8"))
+
+    @classmethod
+    def load(cls, report_path, year):
+        """
+        Read a report written by save
+
+        Args:
+            report_path (str): The path of the report
+            year (str): The year of the report
+
+        Returns:
+            MissingTaskReport: The report
+        """
+        if get_report_format(report_path) == "json":
+            with open(report_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            subject_rows = data["subject_completeness"]
+            missing_rows = data["missing"]
+        else:
+            subject_rows = _read_csv(get_aggregate_paths(report_path)[0])
+            missing_rows = _read_csv(report_path)
+
+        missing_by_subject = {}
+        for row in missing_rows:
+            missing_by_subject.setdefault(row["native_code"], []).append(int(row["original_task"]))
+        report = cls(year)
+        for row in subject_rows:
+            report.add_subject(row["native_code"], row["Id"], missing_by_subject.get(row["native_code"], []))
+        return report
@@ -0,0 +1,151 @@
+import os
+from dataclasses import dataclass
+
+# Image dimensions
+WIDTH_IMAGE = 1920
+HEIGHT_IMAGE = 1080
+
+# Supported output codecs: name -> (file extension, name of the OpenCV quality/compression flag, allowed levels).
+# The flags are looked up when encoding, so that planning and verifying do not load OpenCV
+CODECS = {
+    "png": (".png", "IMWRITE_PNG_COMPRESSION", range(0, 10)),
+    # WebP is lossless when no level is given (quality above 100)
+    "webp": (".webp", "IMWRITE_WEBP_QUALITY", range(1, 102)),
+    "jpeg": (".jpg", "IMWRITE_JPEG_QUALITY", range(0, 101)),
+    # QOI has no level, it is only available when OpenCV was built with it
+    "qoi": (".qoi", None, range(0)),
+}
+
+# Codecs every OpenCV build can write, the others are checked against the installed OpenCV
+BUILTIN_CODECS = ("png", "jpeg")
+
+# Interpolations available to resize the outputs: name -> name of the OpenCV flag
+INTERPOLATION_FLAGS = {
+    "nearest": "INTER_NEAREST",
+    "linear": "INTER_LINEAR",
+    "cubic": "INTER_CUBIC",
+    # Best to shrink an image, e.g. for previews and thumbnails
+    "area": "INTER_AREA",
+    "lanczos": "INTER_LANCZOS4",
+}
+
+
+@dataclass(frozen=True)
+class OutputCodec:
+    """ Image format and compression level used to encode the outputs"""
+    name: str = "png"
+    level: int = None
+
+    def __post_init__(self):
+        if self.name not in CODECS:
+            raise ValueError(f"Unknown codec {self.name}, expected one of {list(CODECS)}")
+        extension, flag, levels = CODECS[self.name]
+        if self.level is not None and self.level not in levels:
+            raise ValueError(f"Invalid level {self.level} for codec {self.name}")
+        if self.name not in BUILTIN_CODECS:
+            import cv2
+
+            if not cv2.haveImageWriter("image" + extension):
+                raise ValueError(f"OpenCV cannot write {self.name} images")
+
+    @property
+    def extension(self):
+        """ The file extension of the encoded images"""
+        return CODECS[self.name][0]
+
+    @property
+    def spec(self):
+        """ The codec as a 'name[:level]' string, as accepted by parse_codec"""
+        return self.name if self.level is None else f"{self.name}:{self.level}"
+
+    def get_imwrite_params(self):
+        """ Get the OpenCV encoding parameters"""
+        import cv2
+
+        flag_name = CODECS[self.name][1]
+        flag = None if flag_name is None else getattr(cv2, flag_name)
+        if self.name == "webp" and self.level is None:
+            return [flag, 101]
+        if flag is None or self.level is None:
+            return []
+        return [flag, self.level]
+
+    def encode(self, image):
+        """
+        Encode an image
+
+        Args:
+            image (numpy.ndarray): The image to encode
+
+        Returns:
+            bytes: The encoded image
+        """
+        import cv2
+
+        success, encoded = cv2.imencode(self.extension, image, self.get_imwrite_params())
+        if not success:
+            raise RuntimeError(f"Could not encode the image as {self.spec}")
+        return encoded.tobytes()
+
+
+# Codec used when none is specified, PNG with the OpenCV default compression
+DEFAULT_CODEC = OutputCodec()
+
+
+def parse_codec(spec):
+    """
+    Parse a codec specification such as 'png', 'png:3', 'webp' or 'jpeg:95'
+
+    Args:
+        spec (str): The codec specification
+
+    Returns:
+        OutputCodec: The codec
+    """
+    name, _, level = spec.strip().lower().partition(":")
+    if name == "jpg":
+        name = "jpeg"
+    return OutputCodec(name, int(level) if level else None)
+
+
+@dataclass(frozen=True)
+class OutputSpec:
+    """ An output produced from every cropped source image: its folder, size, interpolation and codec"""
+    # Folder of the outputs next to the Tasks folder, e.g. 'Previews', None for the main output in Tasks
+    name: str
+    width: int
+    height: int
+    codec: OutputCodec = DEFAULT_CODEC
+    interpolation: str = "linear"
+
+    def __post_init__(self):
+        if self.width <= 0 or self.height <= 0:
+            raise ValueError(f"Invalid output size {self.width}x{self.height}")
+        if self.interpolation not in INTERPOLATION_FLAGS:
+            raise ValueError(f"Unknown interpolation {self.interpolation}, "
+                             f"expected one of {list(INTERPOLATION_FLAGS)}")
+        if self.name is not None and (not self.name or os.sep in self.name or "/" in self.name):
+            raise ValueError(f"Invalid output name {self.name}, expected a folder name")
+
+
+def parse_output_spec(spec):
+    """
+    Parse an output specification such as 'Previews:960x540', 'Thumbnails:224x224:area'
+    or 'Previews:960x540:area:webp:90' (name:WIDTHxHEIGHT[:interpolation][:codec[:level]])
+
+    Args:
+        spec (str): The output specification
+
+    Returns:
+        OutputSpec: The output
+    """
+    parts = spec.strip().split(":")
+    if len(parts) < 2:
+        raise ValueError(f"Invalid output {spec}, expected name:WIDTHxHEIGHT[:interpolation][:codec]")
+    name, size, options = parts[0], parts[1].lower(), parts[2:]
+    width, _, height = size.partition("x")
+    interpolation = "linear"
+    if options and options[0].lower() in INTERPOLATION_FLAGS:
+        interpolation = options.pop(0).lower()
+    codec = parse_codec(":".join(options)) if options else DEFAULT_CODEC
+    return OutputSpec(name, int(width), int(height), codec, interpolation)
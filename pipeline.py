@@ -0,0 +1,302 @@
+import os
+import queue
+import threading
+from dataclasses import dataclass
+import numpy as np
+import cv2
+from image_io import DEFAULT_CODEC, FrameBuffers, OutputCodec
+from file_io import write_file_atomic
+from metrics import RUN_METRICS
+
+# Default concurrency of every stage, OpenCV releases the GIL while decoding, resizing and encoding
+READ_WORKERS = 4
+TRANSFORM_WORKERS = os.cpu_count() or 1
+WRITE_WORKERS = 4
+# Items waiting between two stages, bounds the number of frames in memory
+QUEUE_SIZE = 16
+
+# Marks the end of the items of a queue
+_STOP = object()
+
+
+@dataclass
+class PipelineConfig:
+    """ Concurrency of the stages of the pipeline"""
+    read_workers: int = READ_WORKERS
+    transform_workers: int = TRANSFORM_WORKERS
+    write_workers: int = WRITE_WORKERS
+    queue_size: int = QUEUE_SIZE
+
+
+def fit_to_memory_budget(config, image_bytes, budget_bytes):
+    """
+    Reduce the concurrency of the pipeline so that the frames in flight fit a memory budget.
+    A frame is in flight in every transform and writer thread and in every slot of the queue
+    between them, the encoded sources waiting to be decoded are not counted.
+
+    Args:
+        config (PipelineConfig): The requested concurrency
+        image_bytes (int): The memory used by one source image and its outputs
+        budget_bytes (int): The memory budget of the frames in flight
+
+    Returns:
+        PipelineConfig: The concurrency fitting the budget, at least one thread per stage and one queue slot
+    """
+    frames = max(3, budget_bytes // max(1, image_bytes))
+    transform_workers = min(config.transform_workers, max(1, frames // 3))
+    write_workers = min(config.write_workers, max(1, frames // 3))
+    queue_size = min(config.queue_size, max(1, frames - transform_workers - write_workers))
+    return PipelineConfig(config.read_workers, transform_workers, write_workers, queue_size)
+
+
+@dataclass
+class ImageJob:
+    """ An image to read, transform and write"""
+    source_path: str
+    destination_path: str
+    codec: OutputCodec = DEFAULT_CODEC
+    # Caller data, returned with the result of the job
+    tag: object = None
+    # (destination path, codec, resize) of every output of the source: the transformed image is
+    # resized by each callable, then encoded and written. When the buffers are reused the callables
+    # are also given the FrameBuffers to resize into. None writes the transformed image to
+    # destination_path with codec
+    outputs: list = None
+
+
+class _Stage:
+    """ Pool of threads taking items from a queue, the last thread to stop forwards the end to the next queue"""
+
+    def __init__(self, name, workers, function, input_queue, output_queue, next_workers, result_queue, cancelled):
+        self.name = name
+        self.function = function
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.next_workers = next_workers
+        self.result_queue = result_queue
+        self.cancelled = cancelled
+        self.running = workers
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+
+    def start(self):
+        """ Start the threads of the stage"""
+        for thread in self.threads:
+            thread.start()
+
+    def _work(self):
+        """ Process items until the end of the input queue, or until the pipeline is cancelled"""
+        while True:
+            item = _get(self.input_queue, self.cancelled)
+            if item is _STOP or item is None:
+                break
+            job, data = item
+            try:
+                output = self.function(job, data)
+            except Exception as e:
+                # Failed jobs leave the pipeline immediately
+                self.result_queue.put((job, e))
+                continue
+            if not _put(self.output_queue, (job, output), self.cancelled):
+                break
+
+        with self.lock:
+            self.running -= 1
+            last = self.running == 0
+        if last:
+            for _ in range(self.next_workers):
+                _put(self.output_queue, _STOP, self.cancelled)
+
+
+class _BufferPool:
+    """
+    FrameBuffers lent to the items in flight between stages and given back once the next stage
+    is done with them. A thread's own buffers cannot be reused while its data waits in a queue,
+    so there is one FrameBuffers per item that can be in flight.
+    """
+
+    def __init__(self, size):
+        self.free = queue.Queue()
+        for _ in range(size):
+            self.free.put(FrameBuffers())
+
+    def acquire(self, cancelled):
+        """ Take free buffers, waiting for an item to give some back"""
+        buffers = _get(self.free, cancelled)
+        if buffers is None:
+            raise RuntimeError("The pipeline was cancelled")
+        return buffers
+
+    def release(self, buffers):
+        """ Give back buffers, once their content is no longer used"""
+        self.free.put(buffers)
+
+
+def _put(target_queue, item, cancelled):
+    """ Put an item in a bounded queue, giving up if the pipeline was cancelled"""
+    while not cancelled.is_set():
+        try:
+            target_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(source_queue, cancelled):
+    """ Get an item from a queue, returning None if the pipeline was cancelled"""
+    while not cancelled.is_set():
+        try:
+            return source_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+def read_source(job, _):
+    """ Read the encoded source image"""
+    with RUN_METRICS.time("read"):
+        with open(job.source_path, "rb") as f:
+            data = f.read()
+    RUN_METRICS.count("bytes_read", len(data))
+    return data
+
+
+def _write_image(destination_path, codec, image):
+    """ Encode an image and write it, returning the number of bytes written"""
+    with RUN_METRICS.time("encode"):
+        data = codec.encode(image)
+    destination_dir = os.path.dirname(destination_path)
+    if not os.path.exists(destination_dir):
+        os.makedirs(destination_dir, exist_ok=True)
+    with RUN_METRICS.time("write"):
+        write_file_atomic(destination_path, data)
+    RUN_METRICS.count("bytes_written", len(data))
+    RUN_METRICS.count("images_processed")
+    return len(data)
+
+
+def write_destination(job, image):
+    """ Encode the transformed image, or the image of every output of the job, and write it"""
+    if job.outputs is None:
+        return _write_image(job.destination_path, job.codec, image)
+    return sum(_write_image(destination_path, codec, output_image)
+               for (destination_path, codec, _), output_image in zip(job.outputs, image))
+
+
+def run_pipeline(jobs, transform, read_workers=READ_WORKERS, transform_workers=TRANSFORM_WORKERS,
+                 write_workers=WRITE_WORKERS, queue_size=QUEUE_SIZE, reuse_buffers=False):
+    """
+    Stream images through a reader stage, a decode/transform stage and an encode/writer stage,
+    connected by bounded queues so that disk reads, CPU work and writes overlap.
+    At most 3 * queue_size + the number of workers images are in memory at any time.
+
+    Args:
+        jobs (iterable): The ImageJob to run, consumed lazily
+        transform (callable): Applied once to every decoded image, e.g. crop and resize.
+            The outputs of a job with several outputs are resized from its result
+        read_workers (int): Number of threads reading the sources
+        transform_workers (int): Number of threads decoding and transforming
+        write_workers (int): Number of threads encoding and writing
+        queue_size (int): Maximum number of items waiting between two stages
+        reuse_buffers (bool): Read the sources and resize the outputs of the jobs into preallocated
+            FrameBuffers, one per item that can be in flight, instead of allocating them for every image
+
+    Yields:
+        tuple: (job, error) for every job in completion order, error is None on success
+    """
+    cancelled = threading.Event()
+    job_queue = queue.Queue(queue_size)
+    read_queue = queue.Queue(queue_size)
+    transformed_queue = queue.Queue(queue_size)
+    # Unbounded, it is drained by the caller
+    result_queue = queue.Queue()
+
+    # A source is held by its reader, the read queue and its decoder, the outputs of a job
+    # by their transform thread, the transformed queue and their writer
+    source_pool = frame_pool = None
+    if reuse_buffers:
+        source_pool = _BufferPool(read_workers + queue_size + transform_workers)
+        frame_pool = _BufferPool(transform_workers + queue_size + write_workers)
+
+    def read(job, _):
+        if source_pool is None:
+            return None, read_source(job, None)
+        buffers = source_pool.acquire(cancelled)
+        try:
+            with RUN_METRICS.time("read"):
+                data = buffers.read(job.source_path)
+        except Exception:
+            source_pool.release(buffers)
+            raise
+        RUN_METRICS.count("bytes_read", len(data))
+        return buffers, data
+
+    def decode_and_transform(job, item):
+        source_buffers, data = item
+        try:
+            with RUN_METRICS.time("decode"):
+                img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        finally:
+            # The decoded image no longer refers to the source
+            if source_buffers is not None:
+                source_pool.release(source_buffers)
+        if img is None:
+            raise ValueError(f"Could not decode {job.source_path}")
+        img = transform(img)
+        if job.outputs is None:
+            return None, img
+        if frame_pool is None:
+            return None, [resize(img) for _, _, resize in job.outputs]
+        frames = frame_pool.acquire(cancelled)
+        try:
+            return frames, [resize(img, frames) for _, _, resize in job.outputs]
+        except Exception:
+            frame_pool.release(frames)
+            raise
+
+    def write(job, item):
+        frames, image = item
+        try:
+            return write_destination(job, image)
+        finally:
+            if frames is not None:
+                frame_pool.release(frames)
+
+    stages = [
+        _Stage("reader", read_workers, read, job_queue, read_queue, transform_workers,
+               result_queue, cancelled),
+        _Stage("transform", transform_workers, decode_and_transform, read_queue, transformed_queue, write_workers,
+               result_queue, cancelled),
+        _Stage("writer", write_workers, write, transformed_queue, result_queue, 1,
+               result_queue, cancelled),
+    ]
+
+    def feed():
+        try:
+            for job in jobs:
+                if not _put(job_queue, (job, None), cancelled):
+                    return
+        finally:
+            for _ in range(read_workers):
+                _put(job_queue, _STOP, cancelled)
+
+    for stage in stages:
+        stage.start()
+    feeder = threading.Thread(target=feed, name="feeder", daemon=True)
+    feeder.start()
+
+    try:
+        while True:
+            item = result_queue.get()
+            if item is _STOP:
+                break
+            job, result = item
+            yield job, result if isinstance(result, Exception) else None
+    finally:
+        # Stops the threads if the caller did not consume every result
+        cancelled.set()
+        feeder.join()
+        for stage in stages:
+            for thread in stage.threads:
+                thread.join()
@@ -0,0 +1,142 @@
+import json
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+
+# Kinds of operation, in the order the executor runs them
+OPERATION_KINDS = ("mkdir", "placeholder", "transform", "skip", "rename", "merge")
+
+
+@dataclass
+class Operation:
+    """ A filesystem operation decided by the planner"""
+    kind: str
+    destination_path: str
+    source_path: str = None
+    # The subject's ID from codici.csv and its native folder code, None for the missing subjects
+    subject_id: str = None
+    native_code: str = None
+    # Manifest key and transform parameters of the output, for placeholder, transform and skip operations
+    output_key: str = None
+    params: dict = None
+    # The year of the plan the operation belongs to
+    year: str = None
+
+
+@dataclass
+class Plan:
+    """ Every operation of a year, built before touching any pixel"""
+    year: str
+    codec: str
+    use_hash: bool = False
+    # Folders of the year and files written by the executor
+    tasks_folder: str = None
+    subject_folder: str = None
+    manifest_file: str = None
+    missing_tasks_file: str = None
+    merge_report_file: str = None
+    # Only some subject folders were planned, e.g. the new ones in watch mode: the missing-task log
+    # and the merge report are appended to instead of rewritten
+    partial: bool = False
+    # "i/N" when only the subjects of a shard were planned, the manifest journal, missing-task log
+    # and merge report are then the shard's own files, merged once every shard is done
+    shard: str = None
+    operations: list = field(default_factory=list)
+    # Original task names missing from each existing subject, keyed by native code in folder order
+    missing_tasks: dict = field(default_factory=dict)
+
+    def add(self, operation):
+        """ Append an operation to the plan"""
+        if operation.kind not in OPERATION_KINDS:
+            raise ValueError(f"Unknown operation {operation.kind}, expected one of {OPERATION_KINDS}")
+        if operation.year is None:
+            operation.year = self.year
+        self.operations.append(operation)
+
+    def get_operations(self, kind):
+        """
+        Get the operations of a kind, in plan order
+
+        Args:
+            kind (str): One of OPERATION_KINDS
+
+        Returns:
+            list: The operations
+        """
+        return [operation for operation in self.operations if operation.kind == kind]
+
+    def count(self):
+        """
+        Count the operations of every kind
+
+        Returns:
+            dict: Kind -> number of operations, for every kind in OPERATION_KINDS
+        """
+        counts = Counter(operation.kind for operation in self.operations)
+        return {kind: counts[kind] for kind in OPERATION_KINDS}
+
+    def format(self, include_skipped=False):
+        """
+        Format the plan for review, one operation per line followed by a summary
+
+        Args:
+            include_skipped (bool): Whether to list the outputs that are already up to date
+
+        Returns:
+            str: The formatted plan
+        """
+        lines = []
+        for operation in self.operations:
+            if operation.kind == "skip" and not include_skipped:
+                continue
+            if operation.source_path is None:
+                lines.append(f"{operation.kind:<12}{operation.destination_path}")
+            else:
+                lines.append(f"{operation.kind:<12}{operation.source_path} -> {operation.destination_path}")
+
+        summary = ", ".join(f"{number} {kind}" for kind, number in self.count().items())
+        lines.append(f"Plan for {self.year}: {summary}")
+        lines.append(f"Subjects: {len(self.missing_tasks)} existing, "
+                     f"{sum(1 for tasks in self.missing_tasks.values() if tasks)} with missing tasks")
+        return "\n".join(lines)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a plan from its dataclasses.asdict form
+
+        Args:
+            data (dict): The plan as a dictionary
+
+        Returns:
+            Plan: The plan
+        """
+        data = dict(data)
+        data["operations"] = [Operation(**operation) for operation in data["operations"]]
+        return cls(**data)
+
+
+def save_plans(plans, plan_path):
+    """
+    Write the plans of a run as JSON
+
+    Args:
+        plans (list): The plans, one per year
+        plan_path (str): The path of the JSON file
+    """
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump({"plans": [asdict(plan) for plan in plans]}, f, indent=1)
+
+
+def load_plans(plan_path):
+    """
+    Read the plans written by save_plans
+
+    Args:
+        plan_path (str): The path of the JSON file
+
+    Returns:
+        list: The plans, one per year
+    """
+    with open(plan_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [Plan.from_dict(plan) for plan in data["plans"]]
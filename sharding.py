@@ -0,0 +1,80 @@
+import os
+import re
+import hashlib
+from dataclasses import dataclass
+
+# "i/N": the i-th of N shards, counted from 1
+SHARD_PATTERN = re.compile(r"^(\d+)/(\d+)$")
+
+
+def get_shard_number(subject_id, count):
+    """
+    Get the shard of a subject from a stable hash of its Id, the same on every machine and run
+
+    Args:
+        subject_id (str): The subject's ID from codici.csv
+        count (int): The number of shards
+
+    Returns:
+        int: The shard number, from 1 to count
+    """
+    digest = hashlib.sha256(subject_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+@dataclass(frozen=True)
+class Shard:
+    """ One of the parts of the subjects processed by separate machines"""
+    # From 1 to count
+    number: int
+    count: int
+
+    def __post_init__(self):
+        if self.count < 1 or not 1 <= self.number <= self.count:
+            raise ValueError(f"Invalid shard {self.number}/{self.count}, expected 1 to {self.count} of {self.count}")
+
+    def __str__(self):
+        return f"{self.number}/{self.count}"
+
+    @property
+    def name(self):
+        """ The name of the shard in the files it writes, e.g. 'shard-1-of-4'"""
+        return f"shard-{self.number}-of-{self.count}"
+
+    def contains(self, subject_id):
+        """ Check if a subject belongs to the shard"""
+        return get_shard_number(subject_id, self.count) == self.number
+
+    def get_path(self, path):
+        """ Get the path of the shard's own copy of a report or journal, e.g. manifest.shard-1-of-4.jsonl"""
+        root, extension = os.path.splitext(path)
+        return f"{root}.{self.name}{extension}"
+
+    def get_shared_path(self, shard_path):
+        """ Get the path of the file a shard's copy is merged into, the inverse of get_path"""
+        root, extension = os.path.splitext(shard_path)
+        suffix = "." + self.name
+        if not root.endswith(suffix):
+            raise ValueError(f"{shard_path} is not a file of shard {self}")
+        return root[:-len(suffix)] + extension
+
+
+def parse_shard(value):
+    """
+    Parse a shard spec
+
+    Args:
+        value (str): "i/N", the i-th of N shards counted from 1, e.g. "1/4"
+
+    Returns:
+        Shard: The shard
+    """
+    match = SHARD_PATTERN.match(value.strip())
+    if match is None:
+        raise ValueError(f"Invalid shard {value}, expected i/N, e.g. 1/4")
+    return Shard(int(match.group(1)), int(match.group(2)))
+
+
+def get_shards(count):
+    """ Get every shard of a split in count shards"""
+    return [Shard(number, count) for number in range(1, count + 1)]
@@ -1,26 +1,6 @@
-from dataclasses import dataclass
-import pandas as pd
-import glob
-import os
-import re
-
-# Define task renumbering map: original task number → new task number
-# Tasks 1, 2, and 5 are skipped
-TASK_RENUMBERING_MAP = {
-    1: None, 2: None, 5: None,  # Skip these tasks
-    3: 1,  # Task3 becomes Task1
-    4: 2,  # Task4 becomes Task2
-    6: 3,  # Task6 becomes Task3
-    7: 4, 8: 5, 9: 6, 10: 7,
-    11: 8, 12: 9, 13: 10, 14: 11,
-    15: 12, 16: 13, 17: 14, 18: 15,
-    19: 16, 20: 17, 21: 18, 22: 19,
-    # Task26 (special case) is handled separately in the main.py
-    26: None
-}
-
-# Reverse mapping for reference (new task number → original task number)
-TASK_ORIGINAL_MAP = {new_num: old_num for old_num, new_num in TASK_RENUMBERING_MAP.items() if new_num is not None}
+from dataclasses import dataclass, field
+from code_index import SubjectCodeIndex
+from inventory import TASK_RENUMBERING_MAP, SubjectInventory, scan_subject, scan_subjects
 
 
 def get_list_of_tasks(extension: str = "csv"):
@@ -43,129 +23,139 @@ def get_list_of_tasks(extension: str = "csv"):
         return [f"Task{i}" for i in range(1, 20)]
 
 
-def normalize_task_name(filename):
-    """
-    Normalize various task naming patterns to a standard 'TaskN' format (without underscore)
-
-    Args:
-        filename (str): The filename to normalize
-
-    Returns:
-        str: The normalized task name in 'TaskN' format, or None if not a task
-        int: The original task number (before renumbering), or None if not a task
-    """
-    # Extract task number from various patterns
-    task_number = None
+# Renumbered tasks expected for every subject
+EXPECTED_TASKS = frozenset(get_list_of_tasks("images"))
 
-    # In 'Task_N' format, convert to 'TaskN'
-    if re.match(r"Task_\d+", filename):
-        task_number = int(re.search(r"Task_(\d+)", filename).group(1))
 
-    # In 'TaskN_' format
-    elif re.match(r"Task\d+_", filename):
-        task_number = int(re.search(r"Task(\d+)_", filename).group(1))
+def _task_number(task_name):
+    """ Sort key of a task name in TaskN format"""
+    return int(task_name[4:])
 
-    # In 'TaskN' format (without trailing underscore)
-    elif re.match(r"Task\d+$", filename) or re.match(r"Task\d+[^_]", filename):
-        task_number = int(re.search(r"Task(\d+)", filename).group(1))
 
-    # Try to extract any task number from other formats
-    else:
-        match = re.search(r"Task[_]?(\d+)", filename)
-        if match:
-            task_number = int(match.group(1))
-
-    # If we found a task number, normalize it
-    if task_number is not None:
-        return f"Task{task_number}", task_number
-
-    # Not a task
-    return None, None
-
-
-def get_renumbered_task_name(original_task_number):
+def _get_task_set(task_files, use_renumbering=True):
     """
-    Convert original task number to the renumbered task number
+    Get the task names of the task files of a subject
 
     Args:
-        original_task_number (int): Original task number
+        task_files (dict): Original task number -> file path, from the subject inventory
+        use_renumbering (bool): Whether to use task renumbering
 
     Returns:
-        str: Renumbered task name in TaskN format, or None if task should be skipped
+        frozenset: Task names in TaskN format
     """
-    if original_task_number in TASK_RENUMBERING_MAP:
-        new_number = TASK_RENUMBERING_MAP[original_task_number]
-        if new_number is not None:
-            return f"Task{new_number}"
-    return None
+    if not use_renumbering:
+        return frozenset(f"Task{number}" for number in task_files)
+
+    return frozenset(f"Task{TASK_RENUMBERING_MAP[number]}" for number in task_files
+                     if TASK_RENUMBERING_MAP.get(number) is not None)
 
 
-@dataclass
+@dataclass(slots=True)
 class Subject:
     native_code: str
     folder_path: str
-    new_code: str
+    new_code: str = None
+    # Directory listing, loaded on first use
+    _inventory: SubjectInventory = field(default=None, init=False, repr=False, compare=False)
+    # (kind, use_renumbering) -> frozenset of task names, derived from the inventory
+    _task_sets: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_inventory(cls, inventory: SubjectInventory, new_code: str = None):
+        """ Create a subject from an inventory of a cohort scan, without listing the folder again"""
+        subject = cls(inventory.native_code, inventory.folder_path, new_code)
+        subject._inventory = inventory
+        return subject
+
+    @property
+    def inventory(self) -> SubjectInventory:
+        """ The files of the subject folder, listed once and cached until invalidate() is called"""
+        if self._inventory is None:
+            self._inventory = scan_subject(self.folder_path, self.native_code)
+        return self._inventory
+
+    def invalidate(self):
+        """ Drop the cached listing, e.g. after files were added to or moved out of the folder"""
+        self._inventory = None
+        self._task_sets.clear()
+
+    def get_new_code(self, code_index: SubjectCodeIndex, year: str):
+        """
+        Get the new code for the subject from the codici.csv index
 
-    def get_new_code(self, codici_df: pd.DataFrame, year: str):
-        """ Get the new code for the subject from the codici_df dataframe"""
-        self.new_code = codici_df.loc[codici_df[year] == self.native_code].Id.values[0]
+        Args:
+            code_index (SubjectCodeIndex): The index, built once for all the subjects, e.g. with
+                SubjectCodeIndex.from_dataframe(codici_df)
+            year (str): The year column of the native code, e.g. 'Anno_3'
+
+        Returns:
+            str: The subject's ID
+        """
+        self.new_code = code_index.get_id(year, self.native_code)
+        if self.new_code is None:
+            raise KeyError(f"Subject {self.native_code} not found in codici.csv for {year}")
         return self.new_code
 
     def get_number_of_elements_in_folder(self):
         """ Count the number of elements in the subject folder"""
-        return len(os.listdir(self.folder_path))
+        return self.inventory.number_of_elements
 
     def get_number_of_files_in_images_folder(self):
         """ Get the number of files in the subject images folder"""
-        if os.path.exists(self.folder_path + "\\Images\\"):
-            return len(os.listdir(self.folder_path + "\\Images\\"))
-        else:
-            return 0
+        return self.inventory.number_of_images_files
 
     def get_number_of_csv_files_in_folder(self):
         """ Get the number of csv files in the subject folder"""
-        return len([name for name in os.listdir(self.folder_path) if name.endswith(".csv")])
+        return self.inventory.number_of_csv_files
 
     def check_if_anagrafica_txt_is_present(self):
         """ Check if the anagrafica.txt file is present in the subject folder"""
-        return True if glob.glob(self.folder_path + "/*Anagrafica*.txt") else False
+        return bool(self.inventory.anagrafica_files)
 
-    def get_list_of_csv_files(self, use_renumbering=True):
+    def get_task_set(self, kind: str = "images", use_renumbering: bool = True) -> frozenset:
         """
-        Get the list of csv files in the subject folder
+        Get the tasks present in the subject folder, computed once per inventory
 
         Args:
+            kind (str): "images" or "csv"
             use_renumbering (bool): Whether to use task renumbering
 
         Returns:
-            list: List of task names in TaskN format
+            frozenset: Task names in TaskN format
         """
-        csv_files = glob.glob(self.folder_path + "/*.csv")
+        key = (kind, use_renumbering)
+        if key not in self._task_sets:
+            task_files = self.inventory.images if kind == "images" else self.inventory.csv_files
+            self._task_sets[key] = _get_task_set(task_files, use_renumbering)
+        return self._task_sets[key]
 
-        task_list = []
-        for csv_file in csv_files:
-            # Get just the filename without path and extension
-            filename = os.path.splitext(os.path.basename(csv_file))[0]
+    def get_missing_task_set(self, kind: str = "images") -> frozenset:
+        """
+        Get the renumbered tasks missing from the subject folder
 
-            # Normalize to TaskN format and get original task number
-            normalized_name, original_task_number = normalize_task_name(filename)
+        Args:
+            kind (str): "images" or "csv"
+
+        Returns:
+            frozenset: Task names in TaskN format
+        """
+        return EXPECTED_TASKS - self.get_task_set(kind)
 
-            if normalized_name:
-                # If renumbering is enabled, convert to new task number
-                if use_renumbering and original_task_number:
-                    renumbered_name = get_renumbered_task_name(original_task_number)
-                    if renumbered_name:
-                        task_list.append(renumbered_name)
-                else:
-                    task_list.append(normalized_name)
+    def has_task(self, task_name: str, kind: str = "images") -> bool:
+        """ Check if a renumbered task is present in the subject folder"""
+        return task_name in self.get_task_set(kind)
 
-        # Remove duplicates
-        task_list = list(set(task_list))
+    def get_list_of_csv_files(self, use_renumbering=True):
+        """
+        Get the list of csv files in the subject folder
 
-        # Sort by task number
-        task_list = sorted(task_list, key=lambda x: int(re.search(r"Task(\d+)", x).group(1)))
+        Args:
+            use_renumbering (bool): Whether to use task renumbering
 
-        return task_list
+        Returns:
+            list: List of task names in TaskN format
+        """
+        return sorted(self.get_task_set("csv", use_renumbering), key=_task_number)
 
     def get_list_of_images_files(self, use_renumbering=True):
         """
@@ -177,37 +167,31 @@ class Subject:
         Returns:
             list: List of task names in TaskN format
         """
-        image_files = glob.glob(self.folder_path + "\\Images\\*.png")
-
-        task_list = []
-        for image_file in image_files:
-            # Get just the filename without path and extension
-            filename = os.path.splitext(os.path.basename(image_file))[0]
-
-            # Normalize to TaskN format and get original task number
-            normalized_name, original_task_number = normalize_task_name(filename)
-
-            if normalized_name:
-                # If renumbering is enabled, convert to new task number
-                if use_renumbering and original_task_number:
-                    renumbered_name = get_renumbered_task_name(original_task_number)
-                    if renumbered_name:
-                        task_list.append(renumbered_name)
-                else:
-                    task_list.append(normalized_name)
-
-        # Remove duplicates
-        task_list = list(set(task_list))
-
-        # Sort by task number
-        task_list = sorted(task_list, key=lambda x: int(re.search(r"Task(\d+)", x).group(1)))
-
-        return task_list
+        return sorted(self.get_task_set("images", use_renumbering), key=_task_number)
 
     def get_list_of_missing_csv_files(self):
         """ Get the list of missing csv files in the subject folder"""
-        return [x for x in get_list_of_tasks("csv") if x not in self.get_list_of_csv_files()]
+        return sorted(self.get_missing_task_set("csv"), key=_task_number)
 
     def get_list_of_missing_images_files(self):
         """ Get the list of missing images files in the subject folder"""
-        return [x for x in get_list_of_tasks("images") if x not in self.get_list_of_images_files()]
\ No newline at end of file
+        return sorted(self.get_missing_task_set("images"), key=_task_number)
+
+
+def load_subjects(subject_folder: str, code_index: SubjectCodeIndex = None, year: str = None) -> list:
+    """
+    Load every subject of a folder with a single concurrent scan
+
+    Args:
+        subject_folder (str): The folder containing the subject folders (Soggetti)
+        code_index (SubjectCodeIndex): If given with the year, used to fill in the new codes
+        year (str): The year column of the native codes, e.g. 'Anno_3'
+
+    Returns:
+        list: The subjects, sorted by native code
+    """
+    subjects = []
+    for native_code, inventory in scan_subjects(subject_folder).items():
+        new_code = code_index.get_id(year, native_code) if code_index is not None else None
+        subjects.append(Subject.from_inventory(inventory, new_code))
+    return subjects
@@ -0,0 +1,158 @@
+import os
+import zlib
+import struct
+import argparse
+import random
+import numpy as np
+import cv2
+from inventory import ORIGINAL_TASK_NUMBERS
+
+# Years of the longitudinal study, as in codici.csv
+YEARS = ("Anno_1", "Anno_2", "Anno_3")
+
+# Task filename patterns found in the acquisitions
+TASK_NAME_PATTERNS = ("Task_{}", "Task{}_", "Task{}")
+
+# Size of the acquired screenshots, the drawing area is the top left 1280x720 region
+ACQUIRED_WIDTH = 1920
+ACQUIRED_HEIGHT = 1080
+
+# Number of samples of a generated task recording
+CSV_ROWS = 200
+
+
+def _make_task_image(rng, width, height):
+    """ Draw random pen strokes on a white canvas, so the images compress like real ones"""
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(rng.randint(3, 12)):
+        points = np.array([[rng.randint(0, width - 1), rng.randint(0, height - 1)] for _ in range(rng.randint(5, 40))],
+                          dtype=np.int32)
+        cv2.polylines(img, [points], False, (rng.randint(0, 80),) * 3, rng.randint(1, 4))
+    return img
+
+
+def _tag_png(data, text):
+    """ Insert a tEXt chunk after the IHDR chunk, so reused images are distinct files with the same pixels"""
+    body = b"Comment\x00" + text.encode("ascii")
+    chunk = struct.pack(">I", len(body)) + b"tEXt" + body + struct.pack(">I", zlib.crc32(b"tEXt" + body))
+    # 8 bytes of signature and 25 bytes of IHDR chunk
+    return data[:33] + chunk + data[33:]
+
+
+def _make_task_csv(rng):
+    """ Build the content of a task recording (x, y, pressure, timestamp)"""
+    rows = ["x,y,pressure,timestamp"]
+    x, y = rng.randint(0, 1280), rng.randint(0, 720)
+    for t in range(CSV_ROWS):
+        x = min(max(x + rng.randint(-5, 5), 0), 1280)
+        y = min(max(y + rng.randint(-5, 5), 0), 720)
+        rows.append(f"{x},{y},{rng.randint(0, 1024)},{t * 10}")
+    return "\n".join(rows) + "\n"
+
+
+def _make_anagrafica(rng, number, first_year_code):
+    """ Build an anagrafica file in the layout written by the acquisition software"""
+    return "\n".join([
+        "Anagrafica",
+        f"Nome: Nome{number}",
+        f"Cognome: Cognome{number}",
+        f"Sesso: {rng.choice('MF')}",
+        f"Data di nascita: {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2012, 2016)}",
+        f"Mano dominante: {rng.choice(['Destra', 'Sinistra'])}",
+        f"Classe: {rng.randint(1, 5)}{rng.choice('ABC')}",
+        "Scuola: Scuola",
+        "Note: -",
+        f"Cartella: {first_year_code}",
+    ]) + "\n"
+
+
+def generate_cohort(root, num_subjects, years=("Anno_3",), missing_subject_rate=0.1, missing_task_rate=0.1,
+                    with_csv=True, width=ACQUIRED_WIDTH, height=ACQUIRED_HEIGHT, seed=0, duplicate_rate=0.0):
+    """
+    Generate a fake data folder with the layout of the real one:
+    codici.csv, anagrafica.csv and <year>/Soggetti/<native code>/ folders with the task images
+    (mixed Task_N / TaskN_ / TaskN names, some of them missing), the task csv files and the anagrafica file
+
+    Args:
+        root (str): The folder to create the data in
+        num_subjects (int): The number of subjects of the cohort
+        years (tuple): The years for which subject folders are generated
+        missing_subject_rate (float): Probability that a subject was not acquired in a year (after Anno_1)
+        missing_task_rate (float): Probability that a task image or csv file is missing
+        with_csv (bool): Whether to generate the task csv files
+        width (int): Width of the acquired images
+        height (int): Height of the acquired images
+        seed (int): Seed of the random generator, the same seed generates the same cohort
+        duplicate_rate (float): Probability that a task image is a byte for byte copy of the previous one,
+            as after a merge or a re-acquired session
+
+    Returns:
+        dict: Subject Id -> {year: native code}, an empty code for the years the subject is missing
+    """
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+
+    # Codes of every subject for every year
+    codes = {}
+    for number in range(1, num_subjects + 1):
+        subject_id = f"CRC_SUBJECT_{number:03d}"
+        codes[subject_id] = {}
+        for year_number, year in enumerate(YEARS, start=1):
+            acquired = year_number == 1 or rng.random() >= missing_subject_rate
+            codes[subject_id][year] = f"{year_number}{number:05d}" if acquired else ""
+
+    with open(os.path.join(root, "codici.csv"), "w", encoding="utf-8") as f:
+        f.write("Id," + ",".join(YEARS) + "\n")
+        for subject_id, subject_codes in codes.items():
+            f.write(subject_id + "," + ",".join(subject_codes[year] for year in YEARS) + "\n")
+
+    with open(os.path.join(root, "anagrafica.csv"), "w", encoding="utf-8") as f:
+        f.write("Id;Nome;Cognome;Sesso;Data_di_Nascita;Mano_dominante;Classe\n")
+        for number, subject_id in enumerate(codes, start=1):
+            f.write(f"{subject_id};Nome{number};Cognome{number};M;01/01/2015;Destra;3A\n")
+
+    # A few distinct images are reused, drawing every image would dominate the generation time
+    images = [cv2.imencode(".png", _make_task_image(rng, width, height))[1].tobytes() for _ in range(8)]
+
+    for year in years:
+        subject_folder = os.path.join(root, year, "Soggetti")
+        os.makedirs(subject_folder, exist_ok=True)
+        for number, (subject_id, subject_codes) in enumerate(codes.items(), start=1):
+            native_code = subject_codes[year]
+            if not native_code:
+                continue
+            subject_path = os.path.join(subject_folder, native_code)
+            os.makedirs(os.path.join(subject_path, "Images"), exist_ok=True)
+
+            with open(os.path.join(subject_path, f"{native_code}_Anagrafica.txt"), "w") as f:
+                f.write(_make_anagrafica(rng, number, subject_codes["Anno_1"]))
+
+            previous_image = None
+            for task_number in ORIGINAL_TASK_NUMBERS:
+                name = rng.choice(TASK_NAME_PATTERNS).format(task_number)
+                if rng.random() >= missing_task_rate:
+                    if previous_image is None or rng.random() >= duplicate_rate:
+                        previous_image = _tag_png(rng.choice(images), f"{year} {native_code} {name}")
+                    with open(os.path.join(subject_path, "Images", name + ".png"), "wb") as f:
+                        f.write(previous_image)
+                if with_csv and task_number <= 21 and rng.random() >= missing_task_rate:
+                    with open(os.path.join(subject_path, name + ".csv"), "w") as f:
+                        f.write(_make_task_csv(rng))
+
+    return codes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic cohort with the layout of the real data")
+    parser.add_argument("root", help="Folder to create the cohort in")
+    parser.add_argument("--subjects", type=int, default=50, help="Number of subjects")
+    parser.add_argument("--years", default="Anno_3", help="Comma separated years to generate subject folders for")
+    parser.add_argument("--missing-subjects", type=float, default=0.1, help="Probability that a subject is missing")
+    parser.add_argument("--missing-tasks", type=float, default=0.1, help="Probability that a task is missing")
+    parser.add_argument("--duplicates", type=float, default=0.0,
+                        help="Probability that a task image is a copy of the previous one")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    args = parser.parse_args()
+
+    generate_cohort(args.root, args.subjects, tuple(args.years.split(",")), args.missing_subjects,
+                    args.missing_tasks, seed=args.seed, duplicate_rate=args.duplicates)
@@ -0,0 +1,186 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from file_io import materialize_file
+from inventory import get_task_renumbering_map, scan_subjects
+
+# Number of files linked or copied at the same time, latency dominates on network shares
+EXTRACTION_WORKERS = 16
+
+
+@dataclass
+class TaskImage:
+    """ A task image of a subject to extract"""
+    subject_id: str
+    year: str
+    # Name of the collection, 'Task_N' for an original task and 'TaskN' for a renumbered one
+    task_name: str
+    image_path: str
+
+
+@dataclass
+class ExtractionReport:
+    """ Outcome of an extraction"""
+    destination: str
+    # Mode actually used -> number of files, links fall back to copies across filesystems
+    modes: dict = field(default_factory=dict)
+    # Files already extracted by a previous run
+    up_to_date: int = 0
+    # (image path, error) of the files that could not be extracted
+    errors: list = field(default_factory=list)
+
+
+def get_collection_name(task_number, renumbered=False):
+    """
+    Get the name of the collection of a task, which tells the two numberings apart
+
+    Args:
+        task_number (int): The task number
+        renumbered (bool): Whether the number is a renumbered one
+
+    Returns:
+        str: 'TaskN' for a renumbered task, 'Task_N' like the acquired files for an original one
+    """
+    return f"Task{task_number}" if renumbered else f"Task_{task_number}"
+
+
+def find_task_images(subject_folder, year, task_numbers, renumbered=False, code_index=None):
+    """
+    List the images of some tasks of a year with a single scan of the subject folders. The filenames
+    are resolved with the task-name normalization of the inventory, so 'Task_26', 'Task26_' and
+    'Task26' are the same task.
+
+    Args:
+        subject_folder (str): The folder containing the subject folders (Soggetti)
+        year (str): The year column, e.g. 'Anno_2', selects the task renumbering map
+        task_numbers (list): The task numbers to extract
+        renumbered (bool): Whether the task numbers are renumbered ones instead of original ones
+        code_index (SubjectCodeIndex): The index of the codici.csv codes, to recognise the folders that
+            still have their native code. Without it the folder names are used as Ids
+
+    Returns:
+        list: The TaskImage of every task image found, sorted by task and subject Id
+    """
+    # Original task number -> collection name
+    if renumbered:
+        wanted = set(task_numbers)
+        collections = {original: get_collection_name(new, True)
+                       for original, new in get_task_renumbering_map(year).items() if new in wanted}
+    else:
+        collections = {number: get_collection_name(number) for number in task_numbers}
+
+    images = []
+    for folder, inventory in scan_subjects(subject_folder).items():
+        subject_id = folder
+        if code_index is not None and folder not in code_index.code_by_id:
+            subject_id = code_index.get_id(year, folder)
+            if subject_id is None:
+                print(f"Warning: Subject {folder} not found in codici.csv")
+                continue
+        for original_number, collection in collections.items():
+            image_path = inventory.images.get(original_number)
+            if image_path is not None:
+                images.append(TaskImage(subject_id, year, collection, image_path))
+
+    images.sort(key=lambda image: (image.year, image.task_name, image.subject_id))
+    return images
+
+
+def get_extraction_path(destination, image, flat=False):
+    """
+    Get the path of an extracted image: <destination>/<year>/<collection>/<Id><ext>,
+    or <destination>/<Id><ext> for a flat extraction of a single collection
+    """
+    filename = image.subject_id + os.path.splitext(image.image_path)[1]
+    if flat:
+        return os.path.join(destination, filename)
+    return os.path.join(destination, image.year, image.task_name, filename)
+
+
+def _is_extracted(image_path, destination_path):
+    """ Check if a previous run already extracted the image, as a link or as a copy at least as recent"""
+    try:
+        destination_stat = os.stat(destination_path)
+    except FileNotFoundError:
+        return False
+    source_stat = os.stat(image_path)
+    if os.path.samestat(source_stat, destination_stat):
+        return True
+    return (destination_stat.st_size == source_stat.st_size
+            and destination_stat.st_mtime_ns >= source_stat.st_mtime_ns)
+
+
+def extract_task_images(images, destination, mode="hardlink", flat=False, workers=EXTRACTION_WORKERS):
+    """
+    Extract task images into flat collections of <Id> files, concurrently. Hardlinks and reflinks
+    take no extra disk space and copies run in the kernel with copy_file_range, so no byte goes
+    through Python. The images extracted by a previous run are skipped.
+
+    Args:
+        images (list): The TaskImage to extract, e.g. from find_task_images
+        destination (str): The folder to extract the collections to
+        mode (str): "hardlink", "reflink" or "copy", links fall back to a copy when not supported
+        flat (bool): Write the images directly in the destination, only for a single collection
+        workers (int): Number of files extracted at the same time
+
+    Returns:
+        ExtractionReport: The files extracted and the errors
+    """
+    if flat and len({(image.year, image.task_name) for image in images}) > 1:
+        raise ValueError("A flat extraction can only hold one task of one year")
+
+    paths = [(image.image_path, get_extraction_path(destination, image, flat)) for image in images]
+    for folder in sorted({destination} | {os.path.dirname(destination_path) for _, destination_path in paths}):
+        os.makedirs(folder, exist_ok=True)
+
+    def extract(image_path, destination_path):
+        if _is_extracted(image_path, destination_path):
+            return None
+        return materialize_file(image_path, destination_path, mode)
+
+    report = ExtractionReport(destination)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [(image_path, executor.submit(extract, image_path, destination_path))
+                   for image_path, destination_path in paths]
+        for image_path, future in futures:
+            try:
+                used_mode = future.result()
+            except OSError as e:
+                report.errors.append((image_path, f"{e}"))
+                continue
+            if used_mode is None:
+                report.up_to_date += 1
+            else:
+                report.modes[used_mode] = report.modes.get(used_mode, 0) + 1
+    return report
+
+
+def extract_task_collections(subject_folders, code_index, destination, task_numbers, renumbered=False,
+                             mode="hardlink", flat=False):
+    """
+    Find and extract the images of some tasks of one or more years, printing a summary
+
+    Args:
+        subject_folders (dict): Year -> the folder containing its subject folders (Soggetti)
+        code_index (SubjectCodeIndex): The index of the codici.csv codes
+        destination (str): The folder to extract the collections to
+        task_numbers (list): The task numbers to extract
+        renumbered (bool): Whether the task numbers are renumbered ones instead of original ones
+        mode (str): "hardlink", "reflink" or "copy"
+        flat (bool): Write the images directly in the destination, for a single task of a single year
+
+    Returns:
+        int: 0 if every image was extracted, 1 otherwise
+    """
+    # The subject folders of every year are listed once
+    images = []
+    for year, subject_folder in subject_folders.items():
+        images += find_task_images(subject_folder, year, task_numbers, renumbered, code_index)
+
+    report = extract_task_images(images, destination, mode, flat)
+    for image_path, error in report.errors:
+        print(f"Error extracting {image_path}: {error}")
+    modes = ", ".join(f"{number} {used_mode}" for used_mode, number in sorted(report.modes.items())) or "none"
+    print(f"Extracted {len(images)} images to {destination}: {modes}, {report.up_to_date} already up to date, "
+          f"{len(report.errors)} errors")
+    return 0 if not report.errors else 1
@@ -0,0 +1,146 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from image_io import DEFAULT_CODEC, WIDTH_IMAGE, HEIGHT_IMAGE
+
+# Number of images decoded at the same time
+EXPORT_WORKERS = os.cpu_count() or 1
+
+# Ways of laying out the exported arrays
+EXPORT_LAYOUTS = ("task", "cohort")
+
+
+def get_task_image_path(tasks_folder, subject_id, task_name, codec=DEFAULT_CODEC):
+    """
+    Get the path of a processed task image
+
+    Args:
+        tasks_folder (str): The folder containing the TaskN folders
+        subject_id (str): The subject's ID from codici.csv
+        task_name (str): The renumbered task name
+        codec (OutputCodec): The codec of the processed images
+
+    Returns:
+        str: The path of the image
+    """
+    return os.path.join(tasks_folder, task_name, f"{subject_id}_{task_name}{codec.extension}")
+
+
+def _load_into(array, index, image_path, record, width, height):
+    """
+    Decode an image into a slot of the exported array
+
+    Returns:
+        bool: True if the slot holds real data, False for missing or placeholder images
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        return False
+    if img.shape[:2] != (height, width):
+        img = cv2.resize(img, (width, height))
+    array[index] = img
+
+    # Placeholders are known from the manifest, otherwise recognised as fully white
+    if record is not None:
+        return not record.get("params", {}).get("placeholder", False)
+    return not bool((img == 255).all())
+
+
+def export_tensors(tasks_folder, subject_ids, task_names, output_folder, layout="task", manifest=None,
+                   codec=DEFAULT_CODEC, width=WIDTH_IMAGE, height=HEIGHT_IMAGE, workers=EXPORT_WORKERS):
+    """
+    Export the processed task images as memory-mappable .npy arrays with a JSON header,
+    so that training loaders can np.load(..., mmap_mode="r") them instead of decoding PNGs
+
+    With the "task" layout every task is written to TaskN.npy with shape (subjects, height, width, 3),
+    with the "cohort" layout all tasks are written to cohort.npy with shape (subjects, tasks, height, width, 3).
+    The JSON header lists the subject Ids (the first axis), the tasks and a mask that is False for
+    the missing and placeholder images.
+
+    Args:
+        tasks_folder (str): The folder containing the TaskN folders
+        subject_ids (list): The subject Ids from codici.csv, in the order of the first axis
+        task_names (list): The renumbered task names to export
+        output_folder (str): The folder to write the arrays to
+        layout (str): "task" or "cohort"
+        manifest (Manifest): The manifest of the run, used to recognise the placeholders
+        codec (OutputCodec): The codec of the processed images
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        workers (int): Number of images decoded at the same time
+
+    Returns:
+        list: The paths of the JSON headers written
+    """
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"Unknown layout {layout}, expected one of {EXPORT_LAYOUTS}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    if layout == "cohort":
+        groups = [("cohort", task_names)]
+    else:
+        groups = [(task_name, [task_name]) for task_name in task_names]
+
+    header_paths = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for name, group_tasks in groups:
+            array_path = os.path.join(output_folder, f"{name}.npy")
+            if layout == "cohort":
+                shape = (len(subject_ids), len(group_tasks), height, width, 3)
+            else:
+                shape = (len(subject_ids), height, width, 3)
+            array = np.lib.format.open_memmap(array_path, mode="w+", dtype=np.uint8, shape=shape)
+
+            # Every slot is decoded straight into the memory-mapped file
+            futures = {}
+            for subject_index, subject_id in enumerate(subject_ids):
+                for task_index, task_name in enumerate(group_tasks):
+                    index = (subject_index, task_index) if layout == "cohort" else subject_index
+                    image_path = get_task_image_path(tasks_folder, subject_id, task_name, codec)
+                    record = None
+                    if manifest is not None:
+                        record = manifest.get(f"{task_name}/{os.path.basename(image_path)}")
+                    futures[(subject_index, task_index)] = executor.submit(
+                        _load_into, array, index, image_path, record, width, height)
+
+            mask = [[futures[(subject_index, task_index)].result() for task_index in range(len(group_tasks))]
+                    for subject_index in range(len(subject_ids))]
+            array.flush()
+            del array
+
+            header = {
+                "array": os.path.basename(array_path),
+                "layout": layout,
+                "shape": list(shape),
+                "dtype": "uint8",
+                "channels": "BGR",
+                "ids": list(subject_ids),
+                "tasks": list(group_tasks),
+                # mask[subject][task] is True for real images
+                "mask": mask,
+            }
+            header_path = os.path.join(output_folder, f"{name}.json")
+            with open(header_path, "w", encoding="utf-8") as f:
+                json.dump(header, f)
+            header_paths.append(header_path)
+
+    return header_paths
+
+
+def load_tensor(header_path):
+    """
+    Memory-map an exported array without copying it
+
+    Args:
+        header_path (str): The path of the JSON header of the array
+
+    Returns:
+        tuple: (array, mask, header) - the read-only memory-mapped array, the boolean mask
+            of the real images with shape (subjects, tasks) and the JSON header
+    """
+    with open(header_path, "r", encoding="utf-8") as f:
+        header = json.load(f)
+    array = np.load(os.path.join(os.path.dirname(header_path), header["array"]), mmap_mode="r")
+    return array, np.array(header["mask"], dtype=bool), header
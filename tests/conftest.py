@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from synthetic_cohort import generate_cohort
+
+
+@pytest.fixture
+def cohort(tmp_path):
+    """
+    Generate synthetic cohorts and point main to them. The paths and image sizes of main are
+    restored afterwards, so that the next tests do not run against a removed folder.
+
+    Returns:
+        callable: make(number_of_subjects, root=None, **options) generates a cohort in root, tmp_path
+            by default, configures main for its Anno_3 and returns the codes of generate_cohort
+    """
+    saved = {name: value for name, value in vars(main).items() if name.isupper()}
+
+    def make(number_of_subjects, root=None, **options):
+        root = str(root or tmp_path)
+        options = {"with_csv": False, "width": 160, "height": 90, **options}
+        codes = generate_cohort(root, number_of_subjects, **options)
+        main.configure_paths(root, "Anno_3")
+        return codes
+
+    yield make
+    for name, value in saved.items():
+        setattr(main, name, value)
+
+
+@pytest.fixture
+def run_report():
+    """
+    Returns:
+        callable: Load the JSON run report main wrote last
+    """
+    def load():
+        with open(main.RUN_REPORT_FILE) as f:
+            return json.load(f)
+
+    return load
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import cli
+from synthetic_cohort import generate_cohort
+
+
+def test_importing_the_cli_loads_no_heavy_library():
+    """ Test that the entry point starts without OpenCV, numpy, pandas or the progress bar. """
+    code = "import sys, cli; print(sorted({'cv2', 'numpy', 'pandas', 'alive_progress'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), ".."),
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+@pytest.mark.parametrize("command", ["plan", "verify"])
+def test_planning_and_verifying_load_no_opencv(tmp_path, command):
+    """ Test that the plan and verify subcommands run without loading OpenCV. """
+    generate_cohort(str(tmp_path), 2, missing_subject_rate=0, with_csv=False, width=32, height=18, seed=8)
+    code = (f"import sys, cli\n"
+            f"cli.run([{command!r}, '--workdir', {str(tmp_path)!r}, '--years', 'Anno_3'])\n"
+            f"print('cv2' in sys.modules)")
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.join(os.path.dirname(__file__), ".."),
+                            capture_output=True, text=True, check=True).stdout
+    assert output.splitlines()[-1] == "False"
+
+
+def test_config_file_defaults(tmp_path, capsys):
+    """ Test that the config file sets the defaults, per subcommand, and that the command line wins. """
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"workdir": str(tmp_path), "years": "Anno_2,Anno_3", "mode": "copy",
+                                       "organize": {"workers": 4}}))
+
+    args = cli.parse_arguments(["--config", str(config_path), "organize", "--years", "Anno_1"])
+    assert (args.workdir, args.years, args.workers) == (str(tmp_path), ["Anno_1"], 4)
+    args = cli.parse_arguments(["--config", str(config_path), "extract", "26"])
+    assert (args.years, args.mode, args.tasks) == (["Anno_2", "Anno_3"], "copy", [26])
+
+    config_path.write_text(json.dumps({"wrokers": 4}))
+    with pytest.raises(SystemExit):
+        cli.parse_arguments(["--config", str(config_path), "verify"])
+    assert "Unknown options" in capsys.readouterr().err
+
+
+def test_extract_subcommand(tmp_path):
+    """ Test that the extract subcommand links the task of every acquired subject. """
+    codes = generate_cohort(str(tmp_path), 3, missing_subject_rate=0, missing_task_rate=0, with_csv=False,
+                            width=32, height=18, seed=6)
+    destination = tmp_path / "extracted"
+    assert cli.run(["extract", "26", "--workdir", str(tmp_path), "--to", str(destination), "--flat"]) == 0
+    assert sorted(os.listdir(destination)) == [f"{subject_id}.png" for subject_id in sorted(codes)]
+
+
+def test_export_and_consolidate_subcommands(cohort, tmp_path):
+    """ Test that the processed tasks are exported and the task csv files consolidated by their subcommands. """
+    cohort(2, missing_subject_rate=0, with_csv=True, width=32, height=18, seed=4)
+    workdir = ["--workdir", str(tmp_path)]
+    assert cli.run(["organize"] + workdir) == 0
+    assert cli.run(["export-tensors", str(tmp_path / "tensors"), "--layout", "cohort"] + workdir) == 0
+    assert sorted(name for name in os.listdir(tmp_path / "tensors") if name.endswith(".json")) == ["cohort.json"]
+    assert cli.run(["consolidate-csv", str(tmp_path / "parquet")] + workdir) == 0
+    assert any(name.endswith(".parquet") for name in os.listdir(tmp_path / "parquet"))
+
+    with pytest.raises(SystemExit):
+        cli.parse_arguments(["export-tensors", str(tmp_path / "tensors"), "--layout", "partitioned"])
+
+
+def test_main_script_runs_the_cli():
+    """ Test that main.py has no command line of its own. """
+    output = subprocess.run([sys.executable, "main.py", "--help"], cwd=os.path.join(os.path.dirname(__file__), ".."),
+                            capture_output=True, text=True, check=True).stdout
+    for command in cli.RUNNERS:
+        assert command in output
@@ -0,0 +1,62 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from code_index import SubjectCodeIndex
+
+
+@pytest.fixture
+def codici_df():
+    return pd.DataFrame({
+        "Id": ["CRC_SUBJECT_001", "CRC_SUBJECT_002", "CRC_SUBJECT_003", "CRC_SUBJECT_002"],
+        "Anno_1": ["A1", "A2", "A3", "A9"],
+        "Anno_2": ["B1", None, "B1", ""],
+        "Anno_3": ["C1", "C2", "", "C9"],
+    })
+
+
+def test_lookup_in_every_year(codici_df):
+    """ Test that every year's native code resolves to the subject Id. """
+    index = SubjectCodeIndex.from_dataframe(codici_df)
+    assert index.get_id("Anno_1", "A2") == "CRC_SUBJECT_002"
+    assert index.get_id("Anno_3", "C1") == "CRC_SUBJECT_001"
+    assert index.get_id("Anno_3", "unknown") is None
+    assert index.get_code("CRC_SUBJECT_002", "Anno_3") == "C2"
+
+
+def test_subjects_without_code(codici_df):
+    """ Test that subjects with an empty or missing code for a year are reported as missing. """
+    index = SubjectCodeIndex.from_dataframe(codici_df)
+    assert index.get_ids_without_code("Anno_2") == ["CRC_SUBJECT_002"]
+    assert index.get_ids_without_code("Anno_3") == ["CRC_SUBJECT_003"]
+
+
+def test_duplicates_and_conflicts_are_reported(codici_df):
+    """ Test that duplicated Ids and codes shared by two subjects are found while building the index. """
+    index = SubjectCodeIndex.from_dataframe(codici_df)
+    assert any("CRC_SUBJECT_002 appears more than once" in problem for problem in index.problems)
+    assert any("B1 is used by both CRC_SUBJECT_001 and CRC_SUBJECT_003" in problem for problem in index.problems)
+    # The first subject keeps the conflicting code
+    assert index.get_id("Anno_2", "B1") == "CRC_SUBJECT_001"
+
+
+def test_csv_index_matches_the_dataframe_index(codici_df, tmp_path):
+    """ Test that reading codici.csv without pandas builds the same index. """
+    codici_path = str(tmp_path / "codici.csv")
+    codici_df.to_csv(codici_path, index=False)
+    from_csv = SubjectCodeIndex.from_csv(codici_path)
+    from_dataframe = SubjectCodeIndex.from_dataframe(codici_df)
+    assert (from_csv.ids, from_csv.code_by_id, from_csv.id_by_code, from_csv.problems) == \
+        (from_dataframe.ids, from_dataframe.code_by_id, from_dataframe.id_by_code, from_dataframe.problems)
+
+
+def test_csv_index_of_a_file_saved_with_a_bom(tmp_path):
+    """ Test that the byte order mark Excel writes before the header does not hide the Id column. """
+    codici_path = tmp_path / "codici.csv"
+    codici_path.write_bytes("\ufeffId,Anno_1,Anno_2\r\nCRC_SUBJECT_001,101,201\r\n".encode("utf-8"))
+    index = SubjectCodeIndex.from_csv(str(codici_path))
+    assert index.ids == ["CRC_SUBJECT_001"]
+    assert index.get_id("Anno_2", "201") == "CRC_SUBJECT_001"
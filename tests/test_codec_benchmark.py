@@ -0,0 +1,44 @@
+import os
+import sys
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from codec_benchmark import benchmark_codecs, sample_task_images
+from image_io import parse_codec
+
+
+def _write_images(tmp_path):
+    """ Write two small task images in the folder of a subject"""
+    images_folder = tmp_path / "S01" / "Images"
+    images_folder.mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    for name in ["Task_3.png", "Task_4.png"]:
+        cv2.imwrite(str(images_folder / name), rng.integers(0, 256, (36, 64, 3), dtype=np.uint8))
+
+
+def test_benchmark_codecs(tmp_path):
+    """ Test that every candidate is measured on every sampled image. """
+    _write_images(tmp_path)
+    image_paths = sample_task_images(str(tmp_path), 10)
+    assert len(image_paths) == 2
+
+    results = benchmark_codecs(image_paths, [parse_codec("png:1"), parse_codec("jpeg:50")])
+    assert [result["codec"] for result in results] == ["png:1", "jpeg:50"]
+    for result in results:
+        assert result["images"] == 2
+        assert result["encode_ms"] >= 0 and result["decode_ms"] >= 0
+    # Noise is incompressible without loss, the lossy candidate is smaller
+    assert results[1]["size_kb"] < results[0]["size_kb"]
+
+
+def test_benchmark_codecs_applies_the_transform(tmp_path):
+    """ Test that the candidates are measured on the transformed images and unreadable files are skipped. """
+    _write_images(tmp_path)
+    image_paths = sample_task_images(str(tmp_path), 10) + [str(tmp_path / "missing.png")]
+
+    full = benchmark_codecs(image_paths, [parse_codec("png:0")])
+    cropped = benchmark_codecs(image_paths, [parse_codec("png:0")], transform=lambda img: img[:18, :32])
+    assert full[0]["images"] == cropped[0]["images"] == 2
+    assert cropped[0]["size_kb"] < full[0]["size_kb"]
@@ -0,0 +1,79 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from code_index import SubjectCodeIndex
+from inventory import TASK_NAME_PATTERN, TASK_RENUMBERING_MAP
+from csv_consolidation import TaskRecording, consolidate_task_recordings, find_task_recordings
+from synthetic_cohort import generate_cohort
+import pandas as pd
+
+
+@pytest.fixture
+def cohort(tmp_path):
+    codes = generate_cohort(str(tmp_path), 3, missing_subject_rate=0, missing_task_rate=0.2, seed=4, width=32,
+                            height=18)
+    code_index = SubjectCodeIndex.from_dataframe(pd.read_csv(tmp_path / "codici.csv", dtype=str))
+    return str(tmp_path / "Anno_3" / "Soggetti"), code_index, codes
+
+
+def test_recordings_are_renumbered(cohort):
+    """ Test that the csv files are listed under their Id and renumbered task, without the skipped tasks. """
+    subject_folder, code_index, codes = cohort
+    recordings = find_task_recordings(subject_folder, code_index, "Anno_3")
+
+    assert {recording.subject_id for recording in recordings} == set(codes)
+    # Original tasks 1, 2 and 5 are skipped, 3 to 21 become Task1 to Task18
+    assert {recording.task_name for recording in recordings} <= {f"Task{i}" for i in range(1, 19)}
+    renumbered = [name for _, _, files in os.walk(subject_folder) for name in files if name.endswith(".csv")
+                  and TASK_RENUMBERING_MAP[int(TASK_NAME_PATTERN.search(name).group(1))] is not None]
+    assert len(recordings) == len(renumbered)
+
+
+@pytest.mark.parametrize("layout", ["task", "partitioned"])
+def test_consolidated_rows_match_the_csv_files(cohort, tmp_path, layout):
+    """ Test that every row of every csv file ends up in the Parquet files. """
+    pytest.importorskip("pyarrow")
+    subject_folder, code_index, codes = cohort
+    recordings = find_task_recordings(subject_folder, code_index, "Anno_3")
+    report = consolidate_task_recordings(recordings, str(tmp_path / "out"), layout, chunk_rows=50, workers=2)
+
+    assert not report.errors
+    assert report.recordings == len(recordings)
+    assert report.rows == sum(len(pd.read_csv(recording.csv_path)) for recording in recordings)
+    assert sum(len(pd.read_parquet(path)) for path in report.files) == report.rows
+    if layout == "task":
+        assert set(pd.read_parquet(report.files[0]).columns[:2]) == {"Id", "year"}
+    else:
+        assert len(report.files) == len(codes)
+
+
+def test_recordings_with_other_column_types_are_kept(tmp_path):
+    """ Test that empty and text columns are converted to the file schema or written under another schema. """
+    pytest.importorskip("pyarrow")
+    contents = {"S1": "t,x,label\n0,1.5,a\n1,2.5,b\n",
+                # Empty label column and numbers written as text fit the first schema
+                "S2": 't,x,label\n0,"3",\n1,"4",\n',
+                # Text in the numeric column does not fit, it gets a file of its own
+                "S3": "t,x,label\n0,error,c\n1,5,d\n"}
+    recordings = []
+    for subject_id, content in contents.items():
+        (tmp_path / f"{subject_id}.csv").write_text(content)
+        recordings.append(TaskRecording(subject_id, "Anno_3", "Task1", str(tmp_path / f"{subject_id}.csv")))
+    # A file of an extra schema left by a previous run
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "Task1-schema3.parquet").write_bytes(b"stale")
+
+    report = consolidate_task_recordings(recordings, str(tmp_path / "out"), chunk_rows=2, workers=1)
+    assert not report.errors
+    assert report.recordings == 3 and report.rows == 6
+    assert [os.path.basename(path) for path in report.files] == ["Task1.parquet", "Task1-schema2.parquet"]
+    assert sorted(os.listdir(tmp_path / "out")) == ["Task1-schema2.parquet", "Task1.parquet"]
+
+    first = pd.read_parquet(report.files[0])
+    assert first["x"].tolist() == [1.5, 2.5, 3.0, 4.0]
+    assert first["label"].tolist()[:2] == ["a", "b"] and first["label"].isna().sum() == 2
+    second = pd.read_parquet(report.files[1])
+    assert second["Id"].tolist() == ["S3", "S3"] and second["x"].tolist() == ["error", "5"]
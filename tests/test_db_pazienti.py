@@ -0,0 +1,59 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_pazienti import parse_anagrafica_file, subjects_code_creation
+
+FIXED_LAYOUT = "Anagrafica\nNome: Mario\nCognome: Rossi\nSesso: M\nData di nascita: 01/01/2015\n" \
+               "Mano dominante: Destra\nClasse: 3A\nScuola: X\nNote: -\nCartella: 1 23\n"
+
+UNLABELLED = "Anagrafica\nN: Luca\nC: Verdi\nS: M\nD: 03/03/2015\nM: Destra\nK: 2C\nX: -\nY: -\nZ: 789\n"
+
+LABELLED = "Classe: 3B\nNome: Anna\nCognome: Bianchi\nSesso: F\nData_di_Nascita: 02/02/2015\n" \
+           "Mano_dominante: Sinistra\nCodice: 456\n"
+
+
+@pytest.fixture
+def subject_folder(tmp_path):
+    files = {"S01": FIXED_LAYOUT, "S02": "Anagrafica\nNome: broken\n", "S03": LABELLED}
+    for subject, content in files.items():
+        (tmp_path / "Soggetti" / subject).mkdir(parents=True)
+        (tmp_path / "Soggetti" / subject / f"{subject}_Anagrafica.txt").write_text(content)
+    (tmp_path / "Soggetti" / "S04").mkdir()
+    return tmp_path
+
+
+def test_subjects_code_creation(subject_folder):
+    """ Test that parse failures are reported without dropping or renumbering the other subjects. """
+    anagrafica_file = str(subject_folder / "anagrafica.csv")
+    codici_file = str(subject_folder / "codici.csv")
+    failures = subjects_code_creation(str(subject_folder / "Soggetti"), anagrafica_file, codici_file)
+
+    assert [os.path.basename(path) for path, _ in failures] == ["S02_Anagrafica.txt"]
+
+    codici_df = pd.read_csv(codici_file, dtype=str)
+    assert codici_df["Id"].tolist() == ["CRC_SUBJECT_001", "CRC_SUBJECT_003"]
+    assert codici_df["Anno_1"].tolist() == ["123", "456"]
+
+    anagrafica_df = pd.read_csv(anagrafica_file, dtype=str)
+    assert anagrafica_df["Classe"].str.strip().tolist() == ["3A", "3B"]
+
+
+def test_labelled_file_with_an_unknown_code_label(tmp_path, capsys):
+    """ Test that the code of a labelled file is read from its historical line when its label is unknown. """
+    path = tmp_path / "S05_Anagrafica.txt"
+    path.write_text(FIXED_LAYOUT.replace("Cartella: 1 23", "Numero cartella: 1 23"))
+    record = parse_anagrafica_file(str(path))
+    assert (record["Nome"].strip(), record["Anno_1"].strip()) == ("Mario", "1 23")
+    assert "no Anno_1 label" in capsys.readouterr().out
+
+
+def test_file_without_labels_uses_the_fixed_layout(tmp_path):
+    """ Test that the historical line numbers are used when none of the labels is in the file. """
+    path = tmp_path / "S06_Anagrafica.txt"
+    path.write_text(UNLABELLED)
+    record = parse_anagrafica_file(str(path))
+    assert (record["Nome"].strip(), record["Classe"].strip(), record["Anno_1"].strip()) == ("Luca", "2C", "789")
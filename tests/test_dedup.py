@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from dedup import find_duplicate_sources
+from plan import Operation
+
+
+def test_duplicates_point_to_the_first_source(tmp_path):
+    """ Test that identical sources are reused from the first one and the others are kept. """
+    contents = {"a.png": b"same", "b.png": b"diff", "c.png": b"same", "d.png": b"longer content"}
+    operations = []
+    for name, content in contents.items():
+        (tmp_path / name).write_bytes(content)
+        operations.append(Operation("transform", str(tmp_path / f"out_{name}"), str(tmp_path / name)))
+    operations.append(Operation("transform", str(tmp_path / "out_missing.png"), str(tmp_path / "missing.png")))
+
+    unique, duplicates = find_duplicate_sources(operations, workers=2)
+
+    assert [os.path.basename(operation.source_path) for operation in unique] == ["a.png", "b.png", "d.png",
+                                                                                 "missing.png"]
+    assert [(os.path.basename(operation.source_path), os.path.basename(original.source_path))
+            for operation, original in duplicates] == [("c.png", "a.png")]
+
+
+def test_outputs_are_reused_from_the_same_output(tmp_path):
+    """ Test that the outputs of a source are not duplicates of each other, and pair with the same output. """
+    full, preview = {"size": [1920, 1080]}, {"size": [960, 540]}
+    operations = []
+    for name in ("a.png", "b.png"):
+        (tmp_path / name).write_bytes(b"same")
+        for params in (full, preview):
+            operations.append(Operation("transform", str(tmp_path / f"{params['size'][0]}_{name}"),
+                                        str(tmp_path / name), params=params))
+
+    unique, duplicates = find_duplicate_sources(operations, workers=2)
+
+    assert unique == operations[:2]
+    assert [(operation.destination_path, original.destination_path) for operation, original in duplicates] == \
+        [(operations[2].destination_path, operations[0].destination_path),
+         (operations[3].destination_path, operations[1].destination_path)]
+
+
+def test_duplicate_sources_are_transformed_once(cohort, tmp_path, run_report):
+    """ Test that the outputs of identical sources are reused instead of transformed again. """
+    counters = {}
+    for dedup in (True, False):
+        cohort(2, tmp_path / f"dedup_{dedup}", missing_subject_rate=0, missing_task_rate=0, seed=5,
+               duplicate_rate=0.5)
+        main.main(placeholder_mode="hardlink", dedup=dedup)
+        assert main.verify_outputs() == 0
+        counters[dedup] = run_report()["counters"]
+
+    assert counters[True]["duplicates"] > 0
+    assert counters[True]["images_processed"] + counters[True]["duplicates"] == counters[False]["images_processed"]
@@ -0,0 +1,33 @@
+import os
+import sys
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from output_formats import OutputSpec, parse_codec
+
+
+def test_derived_outputs_share_the_decode(cohort, run_report):
+    """ Test that the derived outputs are written from the same decode, placeholders included. """
+    codes = cohort(4, missing_subject_rate=0.5, seed=11)
+    missing = [subject_id for subject_id, years in codes.items() if not years["Anno_3"]]
+    assert missing
+    preview = OutputSpec("Previews", 48, 27, parse_codec("webp"), "area")
+    main.main(outputs=[preview])
+    assert main.verify_outputs() == 0
+
+    for subject_id in codes:
+        for task_number in range(1, 20):
+            image_path = os.path.join(main.PARENT_FOLDER, "Previews", f"Task{task_number}",
+                                      f"{subject_id}_Task{task_number}.webp")
+            assert cv2.imread(image_path).shape == (27, 48, 3)
+    report = run_report()
+    # One decode per source image, two outputs written from each
+    assert report["counters"]["images_processed"] == 2 * report["stages"]["decode"]["calls"]
+
+    # A second run finds the placeholders of both outputs of the missing subjects up to date
+    main.main(outputs=[preview])
+    operations = run_report()["info"]["operations"]["Anno_3"]
+    assert operations["skip"] == 2 * 19 * len(missing)
+    assert operations["placeholder"] == 0
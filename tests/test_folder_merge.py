@@ -0,0 +1,79 @@
+import os
+import sys
+import errno
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import folder_merge
+from folder_merge import merge_folders, move_entry, snapshot_tree
+
+
+@pytest.fixture
+def folders(tmp_path):
+    source = tmp_path / "300001"
+    destination = tmp_path / "CRC_SUBJECT_001"
+    (source / "Images" / "deep" / "deeper").mkdir(parents=True)
+    (source / "Images" / "deep" / "deeper" / "Task_1.png").write_bytes(b"task 1")
+    (source / "Images" / "Task_2.png").write_bytes(b"task 2")
+    (source / "Images" / "Task_3.png").write_bytes(b"same")
+    (source / "Task_1.csv").write_bytes(b"source csv")
+    (source / "New").mkdir()
+    (source / "New" / "note.txt").write_bytes(b"note")
+    (destination / "Images").mkdir(parents=True)
+    (destination / "Images" / "Task_3.png").write_bytes(b"same")
+    (destination / "Task_1.csv").write_bytes(b"destination csv")
+    return source, destination
+
+
+def test_snapshot_is_recursive(folders):
+    """ Test that the snapshot lists the entries at every depth. """
+    source, _ = folders
+    entries = snapshot_tree(str(source))
+    assert entries[os.path.join("Images", "deep", "deeper")] is True
+    assert entries[os.path.join("Images", "deep", "deeper", "Task_1.png")] is False
+
+
+def test_merge_moves_deduplicates_and_reports(folders):
+    """ Test that the merge moves at any depth, drops identical files and keeps the conflicting ones. """
+    source, destination = folders
+    report = merge_folders(str(source), str(destination))
+
+    assert (destination / "Images" / "deep" / "deeper" / "Task_1.png").read_bytes() == b"task 1"
+    assert (destination / "Images" / "Task_2.png").read_bytes() == b"task 2"
+    assert (destination / "New" / "note.txt").read_bytes() == b"note"
+    assert report.duplicates == [os.path.join("Images", "Task_3.png")]
+    # Moved as a whole, its content is not listed
+    assert "New" in report.moved and os.path.join("New", "note.txt") not in report.moved
+
+    # The conflicting file stays in the source, nothing else does
+    assert [path for path, _ in report.conflicts] == ["Task_1.csv"]
+    assert (destination / "Task_1.csv").read_bytes() == b"destination csv"
+    assert sorted(snapshot_tree(str(source))) == ["Task_1.csv"]
+    assert not report.complete
+
+
+def test_complete_merge_removes_source(folders):
+    """ Test that the source folder is removed once everything was moved. """
+    source, destination = folders
+    (source / "Task_1.csv").unlink()
+    report = merge_folders(str(source), str(destination))
+    assert report.complete
+    assert not source.exists()
+
+
+def test_move_across_devices(tmp_path, monkeypatch):
+    """ Test that a folder is copied then removed when it cannot be renamed to another device. """
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "file.png").write_bytes(b"data")
+    rename = os.rename
+
+    def cross_device_rename(source, destination):
+        if not source.endswith(".tmp"):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        rename(source, destination)
+
+    monkeypatch.setattr(folder_merge.os, "rename", cross_device_rename)
+    move_entry(str(tmp_path / "a"), str(tmp_path / "c"))
+    assert (tmp_path / "c" / "b" / "file.png").read_bytes() == b"data"
+    assert not (tmp_path / "a").exists()
@@ -0,0 +1,85 @@
+import os
+import sys
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from image_io import (CODECS, FrameBuffers, OutputCodec, get_placeholder_bytes, materialize_file, parse_codec,
+                      write_placeholder_image)
+
+
+@pytest.fixture
+def canonical_path(tmp_path):
+    return str(tmp_path / "placeholder.png")
+
+
+def test_placeholder_is_encoded_once():
+    """ Test that the placeholder bytes are cached between calls. """
+    assert get_placeholder_bytes(64, 32) is get_placeholder_bytes(64, 32)
+
+
+def test_hardlink_placeholder_shares_inode(tmp_path, canonical_path):
+    """ Test that hardlinked placeholders point to the canonical file. """
+    destination = str(tmp_path / "Subject_Task1.png")
+    write_placeholder_image(destination, "hardlink", canonical_path, 64, 32)
+    assert os.path.samefile(destination, canonical_path)
+
+
+def test_replacing_a_hardlink_keeps_the_canonical_file(tmp_path, canonical_path):
+    """ Test that materializing over a hardlinked placeholder does not modify the canonical file. """
+    destination = str(tmp_path / "Subject_Task1.png")
+    other = tmp_path / "other.png"
+    other.write_bytes(b"other")
+    write_placeholder_image(destination, "hardlink", canonical_path, 64, 32)
+    materialize_file(str(other), destination, "copy")
+    with open(canonical_path, "rb") as f:
+        assert f.read() == get_placeholder_bytes(64, 32)
+
+
+def test_frame_buffers_are_reused(tmp_path):
+    """ Test that the source buffer and the output frames are allocated once for files that fit. """
+    (tmp_path / "long").write_bytes(b"x" * 100)
+    (tmp_path / "short").write_bytes(b"y" * 10)
+    buffers = FrameBuffers()
+
+    assert bytes(buffers.read(str(tmp_path / "long"))) == b"x" * 100
+    source = buffers.source
+    assert bytes(buffers.read(str(tmp_path / "short"))) == b"y" * 10
+    assert buffers.source is source
+    assert buffers.get_frame(8, 4) is buffers.get_frame(8, 4)
+    assert buffers.get_frame(8, 4).shape == (4, 8, 3)
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ("png", OutputCodec("png")),
+    ("png:3", OutputCodec("png", 3)),
+    (" JPG:95 ", OutputCodec("jpeg", 95)),
+    ("jpeg:0", OutputCodec("jpeg", 0)),
+])
+def test_parse_codec(spec, expected):
+    """ Test that codec specifications with and without a level are parsed. """
+    codec = parse_codec(spec)
+    assert codec == expected
+    assert parse_codec(codec.spec) == codec
+
+
+@pytest.mark.parametrize("spec", ["gif", "png:10", "jpeg:101", "png:fast", "qoi:1"])
+def test_parse_codec_rejects_invalid_specs(spec):
+    """ Test that unknown codecs and levels out of range are rejected. """
+    with pytest.raises(ValueError):
+        parse_codec(spec)
+
+
+@pytest.mark.parametrize("name", [name for name, (extension, _, _) in CODECS.items()
+                                  if cv2.haveImageWriter("image" + extension)])
+def test_codec_round_trip(name):
+    """ Test that every codec OpenCV can write encodes an image that decodes to the same size. """
+    image = np.random.default_rng(0).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+    codec = OutputCodec(name)
+    decoded = cv2.imdecode(np.frombuffer(codec.encode(image), dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape == image.shape
+    if name != "jpeg":
+        # Every codec but JPEG is lossless without a level
+        assert np.array_equal(decoded, image)
@@ -0,0 +1,46 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from inventory import normalize_task_name, scan_subjects
+
+
+@pytest.fixture
+def subject_folder(tmp_path):
+    images = tmp_path / "S01" / "Images"
+    images.mkdir(parents=True)
+    for name in ["Task_3.png", "Task4_.png", "Task26.png", "notes.txt"]:
+        (images / name).write_bytes(b"")
+    for name in ["Task_3.csv", "Task4.csv", "S01_Anagrafica.txt"]:
+        (tmp_path / "S01" / name).write_bytes(b"")
+    (tmp_path / "S02").mkdir()
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("filename, expected", [
+    ("Task_7", ("Task7", 7)),
+    ("Task12_", ("Task12", 12)),
+    ("Task3", ("Task3", 3)),
+    ("S01_Task_21", ("Task21", 21)),
+    ("Anagrafica", (None, None)),
+])
+def test_normalize_task_name(filename, expected):
+    """ Test that every naming pattern is normalized to TaskN. """
+    assert normalize_task_name(filename) == expected
+
+
+def test_scan_subjects(subject_folder):
+    """ Test that a single scan finds the images, csv and anagrafica files of every subject. """
+    inventories = scan_subjects(subject_folder)
+    assert list(inventories) == ["S01", "S02"]
+
+    s01 = inventories["S01"]
+    assert sorted(s01.images) == [3, 4, 26]
+    assert sorted(s01.csv_files) == [3, 4]
+    assert len(s01.anagrafica_files) == 1
+    assert s01.number_of_images_files == 4
+    assert s01.get_renumbered_tasks() == ["Task1", "Task2"]
+    assert "Task5" in s01.get_missing_tasks()
+    assert inventories["S02"].images == {}
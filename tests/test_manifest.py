@@ -0,0 +1,61 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from manifest import Manifest, is_record_current, make_record
+
+
+@pytest.fixture
+def params():
+    return {"crop": [1280, 720], "size": [1920, 1080], "format": "png"}
+
+
+@pytest.fixture
+def source_and_output(tmp_path):
+    source = tmp_path / "Task_3.png"
+    source.write_bytes(b"source")
+    output = tmp_path / "Task1.png"
+    output.write_bytes(b"output")
+    return str(source), str(output)
+
+
+def test_unchanged_source_is_current(source_and_output, params):
+    """ Test that an output produced from an unchanged source is up to date. """
+    source, output = source_and_output
+    record = make_record("Task1/Subject_Task1.png", source, params)
+    assert is_record_current(record, output, source, params)
+
+
+def test_changed_source_or_params_is_not_current(source_and_output, params):
+    """ Test that a modified source or different parameters invalidate the output. """
+    source, output = source_and_output
+    record = make_record("Task1/Subject_Task1.png", source, params)
+    assert not is_record_current(record, output, source, dict(params, format="webp"))
+    with open(source, "ab") as f:
+        f.write(b"more")
+    assert not is_record_current(record, output, source, params)
+
+
+def test_touched_source_is_current_with_hash(source_and_output, params):
+    """ Test that a touched but identical source is up to date when hashes are used. """
+    source, output = source_and_output
+    record = make_record("Task1/Subject_Task1.png", source, params, use_hash=True)
+    os.utime(source, ns=(0, 0))
+    assert not is_record_current(record, output, source, params)
+    assert is_record_current(record, output, source, params, use_hash=True)
+
+
+def test_journal_survives_truncated_line(tmp_path, source_and_output, params):
+    """ Test that records written before a crash are kept and the journal can be appended again. """
+    source, _ = source_and_output
+    journal = str(tmp_path / "manifest.jsonl")
+    Manifest(journal).append([make_record("Task1/A_Task1.png", source, params)])
+    with open(journal, "a") as f:
+        f.write('{"version": 1, "outp')
+
+    manifest = Manifest(journal).load()
+    manifest.append([make_record("Task2/A_Task2.png", None, params)])
+
+    assert sorted(Manifest(journal).load().records) == ["Task1/A_Task1.png", "Task2/A_Task2.png"]
@@ -0,0 +1,26 @@
+import os
+import sys
+import filecmp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from pipeline import PipelineConfig
+
+
+def test_memory_budget_writes_the_same_outputs(cohort, tmp_path):
+    """ Test that the bounded-memory mode, with reused buffers, writes the same images in and out of the pipeline. """
+    task_folders = []
+    for name, memory_budget, pipeline in [("default", None, None), ("budget", 1, None),
+                                          ("pipeline", 1, PipelineConfig(2, 2, 2, 2))]:
+        cohort(2, tmp_path / name, missing_subject_rate=0, seed=13)
+        main.main(memory_budget=memory_budget, pipeline=pipeline)
+        task_folders.append(main.TASKS_FOLDER)
+
+    for task_folder in task_folders[1:]:
+        for task_number in range(1, 20):
+            comparison = filecmp.dircmp(os.path.join(task_folders[0], f"Task{task_number}"),
+                                        os.path.join(task_folder, f"Task{task_number}"))
+            assert comparison.left_list == comparison.right_list
+            assert filecmp.cmpfiles(comparison.left, comparison.right, comparison.common_files,
+                                    shallow=False)[0] == comparison.common_files
@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from metrics import RunMetrics, format_prometheus, write_json_report
+
+
+def test_merge_worker_snapshot():
+    """ Test that the snapshot of a worker adds its timings and counters to the run. """
+    run_metrics = RunMetrics()
+    run_metrics.add_time("decode", 1.0)
+    run_metrics.count("images_processed")
+
+    worker_metrics = RunMetrics()
+    with worker_metrics.time("decode"):
+        pass
+    worker_metrics.count("images_processed", 2)
+    worker_metrics.count("bytes_written", 100)
+
+    run_metrics.merge(worker_metrics.snapshot())
+    snapshot = run_metrics.snapshot()
+    assert snapshot["stage_calls"]["decode"] == 2
+    assert snapshot["stage_seconds"]["decode"] >= 1.0
+    assert snapshot["counters"]["images_processed"] == 3
+    assert snapshot["counters"]["bytes_written"] == 100
+
+
+def test_report_formats(tmp_path):
+    """ Test that the report is written as JSON and formatted as Prometheus samples. """
+    run_metrics = RunMetrics()
+    run_metrics.add_time("resize", 0.5)
+    run_metrics.count("errors", 2)
+    report = run_metrics.get_report(year="Anno_3")
+
+    write_json_report(report, str(tmp_path / "report.json"))
+    assert json.loads((tmp_path / "report.json").read_text())["info"] == {"year": "Anno_3"}
+
+    lines = format_prometheus(report).splitlines()
+    assert 'crc_organizer_stage_seconds{stage="resize"} 0.500000' in lines
+    assert 'crc_organizer_stage_calls{stage="resize"} 1' in lines
+    assert "crc_organizer_errors 2" in lines
+    if report["peak_rss_bytes"]["main"] is not None:
+        assert report["peak_rss_bytes"]["main"] > 0
+        assert any(line.startswith('crc_organizer_peak_rss_bytes{process="main"}') for line in lines)
@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from missing_report import MissingTaskReport, get_aggregate_paths
+
+
+@pytest.fixture
+def report():
+    """ A report of two complete subjects and one missing the original tasks 3 and 26. """
+    report = MissingTaskReport("Anno_3")
+    report.add_subject("A01", "CRC_SUBJECT_001", [])
+    report.add_subject("A02", "CRC_SUBJECT_002", ["Task26", "Task3"])
+    report.add_subject("CRC_SUBJECT_003", "CRC_SUBJECT_003", [])
+    return report
+
+
+def test_aggregates(report):
+    """ Test the missing rows and the per-subject and per-task completeness. """
+    assert report.get_missing_rows() == [
+        {"native_code": "A02", "Id": "CRC_SUBJECT_002", "original_task": 3, "task": "Task1"},
+        {"native_code": "A02", "Id": "CRC_SUBJECT_002", "original_task": 26, "task": ""},
+    ]
+    subject = report.get_subject_rows()[1]
+    assert (subject["tasks_expected"], subject["tasks_missing"], subject["renumbered_missing"]) == (23, 2, 1)
+    tasks = {row["original_task"]: row for row in report.get_task_rows()}
+    assert (tasks[3]["missing"], tasks[3]["completeness"]) == (1, round(2 / 3, 4))
+    assert (tasks[4]["task"], tasks[4]["missing"], tasks[4]["completeness"]) == ("Task2", 0, 1.0)
+
+
+@pytest.mark.parametrize("file_name", ["missing.json", "missing.csv"])
+def test_save_and_load(report, tmp_path, file_name):
+    """ Test that a saved report is read back, and that csv reports get their aggregates next to them. """
+    report_path = str(tmp_path / file_name)
+    report.save(report_path)
+    if file_name.endswith(".csv"):
+        assert all(os.path.exists(path) for path in get_aggregate_paths(report_path))
+    else:
+        with open(report_path) as f:
+            assert json.load(f)["incomplete_subjects"] == 1
+
+    loaded = MissingTaskReport.load(report_path, "Anno_3")
+    assert loaded.subjects == report.subjects
@@ -0,0 +1,26 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+
+
+def test_several_years_in_one_run(cohort, tmp_path, run_report):
+    """ Test that main() organizes every requested year in one run, each in its own folders. """
+    years = ["Anno_2", "Anno_3"]
+    codes = cohort(3, years=tuple(years), missing_subject_rate=0.3, seed=7)
+    main.main(years=years)
+    assert main.verify_outputs(years=years) == 0
+
+    # The configured year is restored after the run
+    assert main.ANNO == "Anno_3"
+    report = run_report()
+    assert report["info"]["years"] == years
+    assert sum(counts["transform"] + counts["placeholder"] for counts in report["info"]["operations"].values()) == \
+        19 * len(codes) * len(years)
+    for year in years:
+        main.configure_paths(str(tmp_path), year)
+        assert os.path.exists(main.MANIFEST_FILE)
+        # Acquired subjects are renamed to their Id, the missing ones get an empty folder
+        assert sorted(os.listdir(main.SUBJECT_FOLDER)) == sorted(codes)
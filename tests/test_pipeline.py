@@ -0,0 +1,60 @@
+import os
+import sys
+import numpy as np
+import cv2
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pipeline import ImageJob, PipelineConfig, fit_to_memory_budget, run_pipeline
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    jobs = []
+    for i in range(20):
+        source = str(tmp_path / f"Task{i}.png")
+        cv2.imwrite(source, np.full((8, 8, 3), i, dtype=np.uint8))
+        jobs.append(ImageJob(source, str(tmp_path / "out" / f"Task{i}.png"), tag=i))
+    jobs.append(ImageJob(str(tmp_path / "missing.png"), str(tmp_path / "out" / "missing.png"), tag="missing"))
+    return jobs
+
+
+def test_every_job_completes_once(jobs):
+    """ Test that every job comes out of the pipeline once, failures included. """
+    results = list(run_pipeline(jobs, lambda img: img[:4, :4], read_workers=2, transform_workers=3,
+                                write_workers=2, queue_size=2))
+
+    assert sorted(str(job.tag) for job, _ in results) == sorted(str(job.tag) for job in jobs)
+    errors = {job.tag for job, error in results if error is not None}
+    assert errors == {"missing"}
+    assert cv2.imread(jobs[5].destination_path).shape == (4, 4, 3)
+
+
+def test_outputs_of_a_job_share_one_decode(jobs):
+    """ Test that a job with several outputs writes every output from one transformed image. """
+    source = jobs[3]
+    outputs = [(source.destination_path, source.codec, lambda img: img),
+               (source.destination_path + ".small.png", source.codec, lambda img: cv2.resize(img, (2, 2)))]
+    job = ImageJob(source.source_path, source.destination_path, source.codec, "multi", outputs)
+    transforms = []
+
+    def transform(img):
+        transforms.append(img.shape)
+        return img[:4, :4]
+
+    results = list(run_pipeline([job], transform, read_workers=1, transform_workers=1, write_workers=1))
+
+    assert [(job.tag, error) for job, error in results] == [("multi", None)]
+    assert len(transforms) == 1
+    assert cv2.imread(source.destination_path).shape == (4, 4, 3)
+    assert cv2.imread(source.destination_path + ".small.png").shape == (2, 2, 3)
+
+
+def test_concurrency_fits_the_memory_budget():
+    """ Test that the frames in flight fit the budget, with at least one thread per stage. """
+    config = PipelineConfig(read_workers=4, transform_workers=8, write_workers=4, queue_size=16)
+    fitted = fit_to_memory_budget(config, image_bytes=10, budget_bytes=90)
+    assert fitted.transform_workers + fitted.write_workers + fitted.queue_size <= 9
+    assert fit_to_memory_budget(config, image_bytes=10, budget_bytes=10_000) == config
+    assert fit_to_memory_budget(config, image_bytes=10, budget_bytes=1) == PipelineConfig(4, 1, 1, 1)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from plan import load_plans
+
+
+def test_plan_does_not_touch_the_cohort(cohort, tmp_path):
+    """ Test that planning lists the operations without writing, and that the saved plan can be executed. """
+    codes = cohort(3, missing_subject_rate=0.5, seed=3)
+    subject_folders = sorted(os.listdir(main.SUBJECT_FOLDER))
+    plan_path = str(tmp_path / "plan.json")
+
+    main.main(plan_only=True, plan_output=plan_path)
+    assert not os.path.exists(main.TASKS_FOLDER)
+    assert sorted(os.listdir(main.SUBJECT_FOLDER)) == subject_folders
+
+    plans = load_plans(plan_path)
+    assert [plan.year for plan in plans] == ["Anno_3"]
+    counts = plans[0].count()
+    assert counts["transform"] + counts["placeholder"] == 19 * len(codes)
+    assert counts["rename"] == len(subject_folders)
+
+    main.main(plan_input=plan_path)
+    assert sorted(os.listdir(main.SUBJECT_FOLDER)) == sorted(codes)
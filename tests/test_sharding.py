@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from plan import load_plans
+from sharding import Shard, get_shard_number, get_shards, parse_shard
+
+
+def test_every_subject_has_one_stable_shard():
+    """ Test that the shards split the subjects without overlap, with the same assignment every time. """
+    subject_ids = [f"CRC_SUBJECT_{number:03d}" for number in range(1, 201)]
+    shards = get_shards(3)
+    for subject_id in subject_ids:
+        assert [shard.contains(subject_id) for shard in shards].count(True) == 1
+    # sha256 based, not the salted built-in hash
+    assert get_shard_number("CRC_SUBJECT_001", 4) == 4
+    assert all(sum(shard.contains(subject_id) for subject_id in subject_ids) > 40 for shard in shards)
+
+
+def test_parse_shard_and_paths():
+    """ Test the i/N spec and the shard's own file names. """
+    shard = parse_shard("2/4")
+    assert shard == Shard(2, 4) and str(shard) == "2/4"
+    shard_path = shard.get_path("/data/manifest_crc_Anno_3.jsonl")
+    assert shard_path == "/data/manifest_crc_Anno_3.shard-2-of-4.jsonl"
+    assert shard.get_shared_path(shard_path) == "/data/manifest_crc_Anno_3.jsonl"
+    for value in ("0/4", "5/4", "1-4", "1/0"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shards_merge_into_one_run(cohort, tmp_path, run_report):
+    """ Test that two shards process disjoint subjects and merge into the manifest and reports of one run. """
+    codes = cohort(6, missing_subject_rate=0.3, seed=17)
+    shards = get_shards(2)
+    for shard in shards:
+        main.main(shard=shard)
+    assert os.path.exists(shards[0].get_path(main.MANIFEST_FILE))
+    assert main.merge_shards(2) == 0
+    assert main.verify_outputs() == 0
+
+    assert sorted(os.listdir(main.SUBJECT_FOLDER)) == sorted(codes)
+    assert not [name for name in os.listdir(str(tmp_path)) if ".shard-" in name]
+    with open(main.MANIFEST_FILE) as f:
+        assert len(f.readlines()) == 19 * len(codes)
+    acquired = sorted(subject_id for subject_id, years in codes.items() if years["Anno_3"])
+    with open(main.MISSING_TASKS_FILE) as f:
+        assert sorted(row["Id"] for row in json.load(f)["subject_completeness"]) == acquired
+    report = run_report()
+    assert len(report["info"]["runs"]) == 2
+    counters = report["counters"]
+    assert counters["images_processed"] + counters["placeholders_written"] + counters["duplicates"] == \
+        19 * len(codes)
+
+    # The shards of the next run find every output up to date in the merged manifest
+    main.main(shard=shards[0], plan_only=True, plan_output=str(tmp_path / "plan.json"))
+    plan = load_plans(str(tmp_path / "plan.json"))[0]
+    assert plan.shard == "1/2" and plan.count()["transform"] == plan.count()["placeholder"] == 0
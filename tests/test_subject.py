@@ -0,0 +1,56 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from code_index import SubjectCodeIndex
+from subject import Subject
+
+
+@pytest.fixture
+def subject(tmp_path):
+    images = tmp_path / "S01" / "Images"
+    images.mkdir(parents=True)
+    for name in ["Task_3.png", "Task4_.png", "Task6.png"]:
+        (images / name).write_bytes(b"")
+    return Subject("S01", str(tmp_path / "S01"))
+
+
+def test_missing_and_present_tasks(subject):
+    """ Test the set based queries on the renumbered tasks. """
+    assert subject.get_task_set() == {"Task1", "Task2", "Task3"}
+    assert subject.has_task("Task2")
+    assert len(subject.get_missing_task_set()) == 16
+    assert subject.get_list_of_missing_images_files()[:2] == ["Task4", "Task5"]
+
+
+def test_inventory_is_cached_until_invalidated(subject):
+    """ Test that the folder is listed once and listed again only after invalidate(). """
+    assert not subject.has_task("Task4")
+    open(os.path.join(subject.folder_path, "Images", "Task7.png"), "wb").close()
+    assert not subject.has_task("Task4")
+
+    subject.invalidate()
+    assert subject.has_task("Task4")
+
+
+def test_subject_has_no_instance_dict(subject):
+    """ Test that subjects are slot based. """
+    assert not hasattr(subject, "__dict__")
+
+
+def test_cache_fields_are_not_constructor_arguments(subject):
+    """ Test that an inventory cannot be passed in, only listed or taken from a cohort scan. """
+    with pytest.raises(TypeError):
+        Subject("S01", subject.folder_path, _inventory=subject.inventory)
+    assert "_inventory" not in repr(subject)
+
+
+def test_new_code_from_the_code_index(subject):
+    """ Test that the new code is looked up in the codici.csv index. """
+    index = SubjectCodeIndex.from_rows([("CRC_SUBJECT_001", "S01")], ["Anno_3"])
+    assert subject.get_new_code(index, "Anno_3") == "CRC_SUBJECT_001"
+    assert subject.new_code == "CRC_SUBJECT_001"
+    with pytest.raises(KeyError):
+        Subject("S02", subject.folder_path).get_new_code(index, "Anno_3")
@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from benchmark import find_regressions
+
+
+def test_generated_cohort_is_organized(cohort, run_report):
+    """ Test that main() organizes a generated cohort: every subject gets every task, real or placeholder. """
+    codes = cohort(4, years=("Anno_3",), missing_subject_rate=0.25, missing_task_rate=0.2, seed=1)
+    main.WIDTH_ACQUIRED, main.HEIGHT_ACQUIRED, main.WIDTH_IMAGE, main.HEIGHT_IMAGE = 80, 45, 160, 90
+    main.main()
+
+    for subject_id in codes:
+        for task_number in range(1, 20):
+            image_path = os.path.join(main.TASKS_FOLDER, f"Task{task_number}", f"{subject_id}_Task{task_number}.png")
+            assert cv2.imread(image_path).shape == (90, 160, 3)
+    # The run report counts every output, the missing subjects get placeholders only
+    counters = run_report()["counters"]
+    assert counters["images_processed"] + counters["placeholders_written"] + counters["duplicates"] == \
+        19 * len(codes)
+    assert counters["errors"] == 0
+    assert os.path.exists(main.METRICS_TEXTFILE)
+    # Acquired subjects are renamed to their Id
+    acquired = sorted(subject_id for subject_id, years in codes.items() if years["Anno_3"])
+    assert sorted(os.listdir(main.SUBJECT_FOLDER)) == acquired
+    # The missing-task report lists every acquired subject by Id
+    with open(main.MISSING_TASKS_FILE) as f:
+        missing_report = json.load(f)
+    assert sorted(row["Id"] for row in missing_report["subject_completeness"]) == acquired
+    assert missing_report["missing_tasks"] == len(missing_report["missing"])
+
+    # The verifier finds every output at the output size
+    assert main.verify_outputs() == 0
+
+
+def test_find_regressions():
+    """ Test that only the benchmarks slower than the tolerance are reported. """
+    baseline = {"a": 100.0, "b": 100.0, "c": 100.0}
+    results = {"a": 90.0, "b": 50.0, "d": 1.0}
+    assert find_regressions(results, baseline, tolerance=0.25) == [("b", 100.0, 50.0)]
@@ -0,0 +1,49 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from code_index import SubjectCodeIndex
+from task_extraction import extract_task_images, find_task_images
+from synthetic_cohort import generate_cohort
+import pandas as pd
+
+
+@pytest.fixture
+def cohort(tmp_path):
+    codes = generate_cohort(str(tmp_path / "data"), 4, missing_subject_rate=0, missing_task_rate=0.2, with_csv=False,
+                            seed=5, width=32, height=18)
+    code_index = SubjectCodeIndex.from_dataframe(pd.read_csv(tmp_path / "data" / "codici.csv", dtype=str))
+    return str(tmp_path / "data" / "Anno_3" / "Soggetti"), code_index, codes
+
+
+def test_original_and_renumbered_tasks_are_found(cohort):
+    """ Test that the tasks are found under their Id, in both numberings, whatever their filename pattern. """
+    subject_folder, code_index, codes = cohort
+    original = find_task_images(subject_folder, "Anno_3", [3], code_index=code_index)
+    renumbered = find_task_images(subject_folder, "Anno_3", [1], renumbered=True, code_index=code_index)
+
+    assert {image.task_name for image in original} == {"Task_3"}
+    assert {image.task_name for image in renumbered} == {"Task1"}
+    # Original task 3 is renumbered Task1
+    assert [image.image_path for image in original] == [image.image_path for image in renumbered]
+    assert {image.subject_id for image in original} <= set(codes)
+
+
+def test_extraction_links_the_images(cohort, tmp_path):
+    """ Test that the images are hardlinked as <Id>.png, and that a second run finds them up to date. """
+    subject_folder, code_index, codes = cohort
+    images = find_task_images(subject_folder, "Anno_3", [3, 26], code_index=code_index)
+    destination = str(tmp_path / "extracted")
+
+    report = extract_task_images(images, destination, "hardlink")
+    assert not report.errors
+    assert sum(report.modes.values()) == len(images)
+    for image in images:
+        extracted = os.path.join(destination, "Anno_3", image.task_name, f"{image.subject_id}.png")
+        assert os.path.samefile(extracted, image.image_path)
+
+    assert extract_task_images(images, destination, "copy").up_to_date == len(images)
+    with pytest.raises(ValueError):
+        extract_task_images(images, destination, flat=True)
@@ -0,0 +1,40 @@
+import os
+import sys
+import numpy as np
+import cv2
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tensor_export import export_tensors, load_tensor
+
+
+@pytest.fixture
+def tasks_folder(tmp_path):
+    for task in ["Task1", "Task2"]:
+        (tmp_path / "Tasks" / task).mkdir(parents=True)
+    cv2.imwrite(str(tmp_path / "Tasks" / "Task1" / "A_Task1.png"), np.full((32, 64, 3), 7, dtype=np.uint8))
+    cv2.imwrite(str(tmp_path / "Tasks" / "Task2" / "A_Task2.png"), np.full((32, 64, 3), 255, dtype=np.uint8))
+    cv2.imwrite(str(tmp_path / "Tasks" / "Task1" / "B_Task1.png"), np.full((32, 64, 3), 9, dtype=np.uint8))
+    return str(tmp_path / "Tasks")
+
+
+@pytest.mark.parametrize("layout", ["task", "cohort"])
+def test_export_and_mask(tmp_path, tasks_folder, layout):
+    """ Test that the exported arrays are indexed by Id and mask the placeholder and missing images. """
+    headers = export_tensors(tasks_folder, ["A", "B"], ["Task1", "Task2"], str(tmp_path / "export"), layout,
+                             width=64, height=32, workers=2)
+
+    arrays = [load_tensor(header) for header in headers]
+    if layout == "task":
+        (task1, mask1, header), (_, mask2, _) = arrays
+        assert header["ids"] == ["A", "B"]
+        assert task1.shape == (2, 32, 64, 3)
+        assert task1[1, 0, 0, 0] == 9
+        assert mask1.ravel().tolist() == [True, True]
+        assert mask2.ravel().tolist() == [False, False]
+    else:
+        ((cohort, mask, _),) = arrays
+        assert cohort.shape == (2, 2, 32, 64, 3)
+        assert cohort[0, 0, 0, 0, 0] == 7
+        assert mask.tolist() == [[True, False], [True, False]]
@@ -0,0 +1,72 @@
+import os
+import sys
+import numpy as np
+import cv2
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from code_index import SubjectCodeIndex
+from image_io import CODECS, OutputCodec
+from verifier import read_image_size, verify_dataset
+
+
+@pytest.mark.parametrize("codec", [name for name, (extension, _, _) in CODECS.items()
+                                   if cv2.haveImageWriter("image" + extension)])
+def test_header_size(tmp_path, codec):
+    """ Test that the size read from the header matches the encoded image. """
+    extension = CODECS[codec][0]
+    image_path = str(tmp_path / f"image{extension}")
+    cv2.imwrite(image_path, np.zeros((37, 53, 3), dtype=np.uint8))
+    assert tuple(read_image_size(image_path)) == (53, 37)
+
+
+def test_truncated_header(tmp_path):
+    """ Test that a truncated image has no size. """
+    (tmp_path / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+    assert read_image_size(str(tmp_path / "image.png")) is None
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    codici_df = pd.DataFrame({"Id": ["A", "B", "C"], "Anno_3": ["300001", "300002", None]}).convert_dtypes()
+    tasks_folder = tmp_path / "Tasks"
+    subject_folder = tmp_path / "Soggetti"
+    for task in ["Task1", "Task2"]:
+        (tasks_folder / task).mkdir(parents=True)
+        for subject_id in ["A", "B", "C"]:
+            cv2.imwrite(str(tasks_folder / task / f"{subject_id}_{task}.png"), np.zeros((20, 40, 3), dtype=np.uint8))
+    for folder in ["A", "300002", "C", "999999"]:
+        (subject_folder / folder).mkdir(parents=True)
+    return str(tasks_folder), str(subject_folder), SubjectCodeIndex.from_dataframe(codici_df)
+
+
+def test_verify_dataset(dataset):
+    """ Test that the verifier reports every kind of problem of the layout. """
+    tasks_folder, subject_folder, code_index = dataset
+    os.remove(os.path.join(tasks_folder, "Task2", "C_Task2.png"))
+    cv2.imwrite(os.path.join(tasks_folder, "Task1", "B_Task1.png"), np.zeros((10, 40, 3), dtype=np.uint8))
+    open(os.path.join(tasks_folder, "Task1", "Z_Task1.png"), "wb").close()
+
+    report = verify_dataset(tasks_folder, subject_folder, code_index, "Anno_3", ["Task1", "Task2"],
+                            OutputCodec("png"), width=40, height=20, workers=4)
+
+    assert report.images_checked == 5
+    assert report.count() == {"missing_output": 1, "unexpected_output": 1, "wrong_size": 1,
+                               "missing_subject_folder": 1, "unrenamed_subject_folder": 1,
+                               "unknown_subject_folder": 1}
+    wrong_size = next(issue for issue in report.issues if issue["kind"] == "wrong_size")
+    assert (wrong_size["subject"], wrong_size["detail"]) == ("B", "40x10")
+
+
+def test_verify_clean_dataset(dataset, tmp_path):
+    """ Test that a complete layout has no problem. """
+    tasks_folder, subject_folder, code_index = dataset
+    os.rename(os.path.join(subject_folder, "300002"), os.path.join(subject_folder, "B"))
+    os.rmdir(os.path.join(subject_folder, "999999"))
+
+    report = verify_dataset(tasks_folder, subject_folder, code_index, "Anno_3", ["Task1", "Task2"],
+                            OutputCodec("png"), width=40, height=20)
+    report.save(str(tmp_path / "verify.json"))
+    assert report.ok
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import shutil
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import main
+from watcher import FolderWatcher, get_folder_signature
+
+
+@pytest.fixture
+def subjects(tmp_path):
+    (tmp_path / "300001" / "Images").mkdir(parents=True)
+    (tmp_path / "300001" / "Images" / "Task_3.png").write_bytes(b"task 3")
+    (tmp_path / "CRC_SUBJECT_002").mkdir()
+    return tmp_path
+
+
+def test_signature_changes_with_the_content(subjects):
+    """ Test that adding a file in a nested folder changes the signature. """
+    folder = str(subjects / "300001")
+    signature = get_folder_signature(folder)
+    assert signature == get_folder_signature(folder)
+    (subjects / "300001" / "Images" / "Task_4.png").write_bytes(b"task 4")
+    assert get_folder_signature(folder) != signature
+    assert get_folder_signature(str(subjects / "gone")) is None
+
+
+def test_folders_are_ready_once_settled(subjects):
+    """ Test that a folder is handed out after the settle time, and again only when it changes. """
+    watcher = FolderWatcher(str(subjects), settle_seconds=30, ignore=lambda name: name.startswith("CRC"))
+    assert watcher.poll(now=0) == []
+    assert watcher.poll(now=29) == []
+    assert watcher.poll(now=30) == ["300001"]
+
+    watcher.mark_processed(["300001"])
+    assert watcher.poll(now=100) == []
+
+    # A file still being copied delays the folder again
+    (subjects / "300001" / "Images" / "Task_4.png").write_bytes(b"task 4")
+    assert watcher.poll(now=110) == []
+    assert watcher.poll(now=140) == ["300001"]
+
+
+def test_prime_skips_the_folders_already_there(subjects):
+    """ Test that the folders present when priming are not handed out until they change. """
+    watcher = FolderWatcher(str(subjects), settle_seconds=0)
+    watcher.prime(now=0)
+    assert watcher.poll(now=10) == []
+    (subjects / "300003").mkdir()
+    assert watcher.poll(now=20) == ["300003"]
+
+
+def test_watch_processes_the_arrived_subjects(cohort, tmp_path, monkeypatch, capsys, run_report):
+    """ Test that watch mode processes a subject folder that arrives after the first run, and only that one. """
+    codes = cohort(3, missing_subject_rate=0, seed=9)
+    late_code = codes["CRC_SUBJECT_003"]["Anno_3"]
+    shutil.move(os.path.join(main.SUBJECT_FOLDER, late_code), str(tmp_path / late_code))
+    subject_lists = []
+
+    def arrive(seconds):
+        # The late subject is copied in while the watcher sleeps after the first run
+        subject_lists.append(sorted(os.listdir(main.SUBJECT_FOLDER)))
+        if len(subject_lists) == 1:
+            shutil.move(str(tmp_path / late_code), os.path.join(main.SUBJECT_FOLDER, late_code))
+
+    monkeypatch.setattr(main.time, "sleep", arrive)
+    main.watch(poll_seconds=0, settle_seconds=0, max_polls=3)
+    assert main.verify_outputs() == 0
+
+    assert subject_lists[0] == ["CRC_SUBJECT_001", "CRC_SUBJECT_002"]
+    assert f"New or changed subject folders: {late_code}\n" in capsys.readouterr().out
+    report = run_report()
+    assert report["info"]["subjects"] == [late_code]
+    assert report["counters"]["subjects_processed"] == 1
+    # The outputs of the late subject only, the missing tasks of the others are not planned again
+    operations = report["info"]["operations"]["Anno_3"]
+    assert operations["transform"] + operations["placeholder"] == 19
+    # The late subject is added to the missing-task report of the first run
+    with open(main.MISSING_TASKS_FILE) as f:
+        missing_report = json.load(f)
+    assert [row["Id"] for row in missing_report["subject_completeness"]] == sorted(codes)
+
+
+def test_watch_processes_the_subjects_arrived_during_a_run(cohort, tmp_path, monkeypatch, run_report):
+    """ Test that a subject folder arriving after the catch-up run was planned is processed at the next poll. """
+    codes = cohort(3, missing_subject_rate=0, seed=9)
+    late_code = codes["CRC_SUBJECT_003"]["Anno_3"]
+    shutil.move(os.path.join(main.SUBJECT_FOLDER, late_code), str(tmp_path / late_code))
+    execute_plans = main.execute_plans
+
+    def arrive_while_executing(plans, *args):
+        # The late subject is copied in after the subjects were listed
+        if os.path.exists(str(tmp_path / late_code)):
+            shutil.move(str(tmp_path / late_code), os.path.join(main.SUBJECT_FOLDER, late_code))
+        return execute_plans(plans, *args)
+
+    monkeypatch.setattr(main, "execute_plans", arrive_while_executing)
+    monkeypatch.setattr(main.time, "sleep", lambda seconds: None)
+    main.watch(poll_seconds=0, settle_seconds=0, max_polls=2)
+    assert main.verify_outputs() == 0
+
+    report = run_report()
+    assert report["info"]["subjects"] == [late_code]
+    assert report["counters"]["subjects_processed"] == 1
+    assert sorted(os.listdir(main.SUBJECT_FOLDER)) == sorted(codes)
@@ -0,0 +1,213 @@
+import os
+import json
+import struct
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from file_io import write_file_atomic
+from output_formats import DEFAULT_CODEC, WIDTH_IMAGE, HEIGHT_IMAGE
+from inventory import list_subject_folders
+
+# Number of folders listed and image headers read at the same time
+VERIFY_WORKERS = 16
+
+# Bytes read from the start of an image, enough for the PNG, WebP and QOI headers
+HEADER_BYTES = 32
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# JPEG start of frame markers, the ones holding the image size
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _read_webp_size(header):
+    """ Get the size from the first chunk of a WebP file"""
+    chunk = header[12:16]
+    if chunk == b"VP8 " and len(header) >= 30:
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(header) >= 25:
+        bits = struct.unpack("<I", header[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(header) >= 30:
+        return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+    return None
+
+
+def _read_jpeg_size(f):
+    """ Walk the JPEG segments up to the start of frame, without reading the compressed data"""
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        # Fill bytes before a marker
+        while marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+            if len(marker) < 2:
+                return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker[1] in JPEG_SOF_MARKERS:
+            segment = f.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack(">HH", segment[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(image_path):
+    """
+    Get the size of an image by reading its header only, without decoding it.
+    Reads the PNG IHDR chunk, the WebP and QOI headers and the JPEG start of frame.
+
+    Args:
+        image_path (str): The path of the image
+
+    Returns:
+        tuple: (width, height), None if the header is not recognised or truncated
+    """
+    with open(image_path, "rb") as f:
+        header = f.read(HEADER_BYTES)
+        if header.startswith(PNG_SIGNATURE) and header[12:16] == b"IHDR" and len(header) >= 24:
+            return struct.unpack(">II", header[16:24])
+        if header.startswith(b"qoif") and len(header) >= 12:
+            return struct.unpack(">II", header[4:12])
+        if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+            return _read_webp_size(header)
+        if header[:2] == b"\xff\xd8":
+            return _read_jpeg_size(f)
+    return None
+
+
+@dataclass
+class VerificationReport:
+    """ Problems found in the Tasks and Soggetti folders after a run"""
+    tasks_folder: str
+    subject_folder: str
+    subjects: int = 0
+    images_checked: int = 0
+    # One dict per problem: kind, subject, task, path and detail
+    issues: list = field(default_factory=list)
+
+    def add(self, kind, subject=None, task=None, path=None, detail=None):
+        """ Record a problem"""
+        self.issues.append({"kind": kind, "subject": subject, "task": task, "path": path, "detail": detail})
+
+    @property
+    def ok(self):
+        """ True if no problem was found"""
+        return not self.issues
+
+    def count(self):
+        """
+        Count the problems of every kind
+
+        Returns:
+            dict: Kind -> number of problems
+        """
+        return dict(Counter(issue["kind"] for issue in self.issues))
+
+    def save(self, report_path):
+        """
+        Write the report as JSON in one go, so that a scheduler polling it never reads it half written
+
+        Args:
+            report_path (str): The path of the JSON file
+        """
+        report = {"tasks_folder": self.tasks_folder, "subject_folder": self.subject_folder,
+                  "subjects": self.subjects, "images_checked": self.images_checked, "ok": self.ok,
+                  "counts": self.count(), "issues": self.issues}
+        write_file_atomic(report_path, json.dumps(report, indent=1).encode("utf-8"))
+
+
+def _list_files(folder):
+    """ List the files of a folder, None if the folder does not exist"""
+    try:
+        with os.scandir(folder) as iterator:
+            return {entry.name: entry.path for entry in iterator if entry.is_file()}
+    except FileNotFoundError:
+        return None
+
+
+def _probe(image_path):
+    """ Read the size of an image, None if it cannot be read"""
+    try:
+        return read_image_size(image_path)
+    except OSError:
+        return None
+
+
+def verify_dataset(tasks_folder, subject_folder, code_index, year, task_names, codec=DEFAULT_CODEC,
+                   width=WIDTH_IMAGE, height=HEIGHT_IMAGE, workers=VERIFY_WORKERS):
+    """
+    Check the layout produced by a run against codici.csv: every subject has all the
+    renumbered tasks at the expected size, there are no stray outputs, and every subject
+    has a folder named after its ID. Image sizes are read from the headers only.
+
+    Args:
+        tasks_folder (str): The folder containing the TaskN folders
+        subject_folder (str): The folder containing the subject folders (Soggetti)
+        code_index (SubjectCodeIndex): The index of the codici.csv codes
+        year (str): The year of the run, used to recognise the native folders left behind
+        task_names (list): The renumbered task names every subject must have
+        codec (OutputCodec): The codec of the processed images
+        width (int): The expected image width in pixels
+        height (int): The expected image height in pixels
+        workers (int): Number of folders listed and headers read at the same time
+
+    Returns:
+        VerificationReport: The problems found
+    """
+    report = VerificationReport(tasks_folder, subject_folder, len(code_index.ids))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        listings = dict(zip(task_names, executor.map(
+            _list_files, [os.path.join(tasks_folder, task_name) for task_name in task_names])))
+
+        # Match the files of every task folder with the expected outputs
+        probes = []
+        for task_name, files in listings.items():
+            if files is None:
+                report.add("missing_task_folder", task=task_name, path=os.path.join(tasks_folder, task_name))
+                continue
+            for subject_id in code_index.ids:
+                file_name = f"{subject_id}_{task_name}{codec.extension}"
+                image_path = files.pop(file_name, None)
+                if image_path is None:
+                    report.add("missing_output", subject_id, task_name, os.path.join(tasks_folder, task_name,
+                                                                                    file_name))
+                else:
+                    probes.append((subject_id, task_name, image_path))
+            # Left over files: outputs of unknown subjects, other codecs or interrupted writes
+            for file_name in sorted(files):
+                report.add("unexpected_output", task=task_name, path=files[file_name])
+
+        for (subject_id, task_name, image_path), size in zip(probes, executor.map(
+                _probe, [image_path for _, _, image_path in probes])):
+            if size is None:
+                report.add("unreadable_header", subject_id, task_name, image_path)
+            elif tuple(size) != (width, height):
+                report.add("wrong_size", subject_id, task_name, image_path, f"{size[0]}x{size[1]}")
+        report.images_checked = len(probes)
+
+    # Every subject of codici.csv has a folder named after its ID
+    folders = list_subject_folders(subject_folder)
+    folder_set = set(folders)
+    for subject_id in code_index.ids:
+        if subject_id not in folder_set:
+            report.add("missing_subject_folder", subject_id, path=os.path.join(subject_folder, subject_id))
+    known_ids = set(code_index.ids)
+    for folder in folders:
+        if folder in known_ids:
+            continue
+        subject_id = code_index.get_id(year, folder)
+        if subject_id is not None:
+            report.add("unrenamed_subject_folder", subject_id, path=os.path.join(subject_folder, folder))
+        else:
+            report.add("unknown_subject_folder", path=os.path.join(subject_folder, folder))
+
+    return report
@@ -0,0 +1,127 @@
+import os
+import time
+from dataclasses import dataclass
+
+# Seconds between two polls of the subjects folder
+WATCH_POLL_SECONDS = 10
+
+# Seconds a folder must stay unchanged before it is processed, so that a copy still in progress is not picked up
+WATCH_SETTLE_SECONDS = 30
+
+
+def get_folder_signature(folder_path):
+    """
+    Summarize the content of a folder from the stat of its entries, recursively, without reading any file.
+    Any file added, removed, rewritten or still growing changes the signature.
+
+    Args:
+        folder_path (str): The folder to summarize
+
+    Returns:
+        tuple: (number of entries, total size of the files, latest mtime in ns), None if the folder is gone
+    """
+    entries = 0
+    total_size = 0
+    latest_mtime_ns = 0
+    pending = [folder_path]
+    try:
+        latest_mtime_ns = os.stat(folder_path).st_mtime_ns
+        while pending:
+            with os.scandir(pending.pop()) as iterator:
+                for entry in iterator:
+                    stat = entry.stat(follow_symlinks=False)
+                    entries += 1
+                    latest_mtime_ns = max(latest_mtime_ns, stat.st_mtime_ns)
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    else:
+                        total_size += stat.st_size
+    except FileNotFoundError:
+        return None
+    return entries, total_size, latest_mtime_ns
+
+
+@dataclass
+class _WatchedFolder:
+    """ Last signature seen for a folder and when it was first seen"""
+    signature: tuple
+    since: float
+    # Signature of the content last handed out for processing
+    processed: tuple = None
+
+
+class FolderWatcher:
+    """
+    Poll a folder for new or changed subfolders by comparing the stat of their content between polls.
+    A subfolder is ready once its content stayed the same for the settle time, and is handed out again
+    only if its content changes after that.
+    """
+
+    def __init__(self, folder, settle_seconds=WATCH_SETTLE_SECONDS, ignore=None):
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        # Predicate on the subfolder names that are never watched, e.g. the processed ones
+        self.ignore = ignore
+        # Subfolder name -> _WatchedFolder
+        self.watched = {}
+
+    def list_folders(self):
+        """ List the watched subfolders with a single scan"""
+        with os.scandir(self.folder) as iterator:
+            return sorted(entry.name for entry in iterator
+                          if entry.is_dir() and (self.ignore is None or not self.ignore(entry.name)))
+
+    def poll(self, now=None):
+        """
+        Check the subfolders once
+
+        Args:
+            now (float): The current time.monotonic(), defaults to now
+
+        Returns:
+            list: The names of the subfolders that are new or changed and settled, sorted
+        """
+        now = time.monotonic() if now is None else now
+        names = self.list_folders()
+
+        # Folders renamed, merged or removed since the last poll are forgotten
+        for name in set(self.watched) - set(names):
+            del self.watched[name]
+
+        ready = []
+        for name in names:
+            signature = get_folder_signature(os.path.join(self.folder, name))
+            if signature is None:
+                continue
+            watched = self.watched.get(name)
+            if watched is None:
+                self.watched[name] = _WatchedFolder(signature, now)
+                watched = self.watched[name]
+            elif watched.signature != signature:
+                # Still being written, wait for it to settle again
+                watched.signature = signature
+                watched.since = now
+            if watched.processed != signature and now - watched.since >= self.settle_seconds:
+                ready.append(name)
+        return ready
+
+    def prime(self, now=None):
+        """
+        Record the current content of every subfolder as processed, e.g. after a full run
+
+        Args:
+            now (float): The current time.monotonic(), defaults to now
+        """
+        self.poll(now)
+        self.mark_processed(list(self.watched))
+
+    def mark_processed(self, names):
+        """
+        Record that the current content of subfolders was processed, they are not ready again until it changes
+
+        Args:
+            names (list): The names of the subfolders
+        """
+        for name in names:
+            if name in self.watched:
+                self.watched[name].processed = self.watched[name].signature